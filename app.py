@@ -21,6 +21,10 @@ import sys
 ROOT_DIR = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(ROOT_DIR)
 
+from src.backend.prefetch import ensure_prefetcher
+from src.backend.metrics import (ensure_metrics_server, node_summary, engine_summary, upstream_summary,
+                                 cache_summary, render_prometheus)
+
 # ---------------------------------------------------------------------------
 # 2. CẤU HÌNH TRANG (PAGE CONFIG) - Phải là lệnh Streamlit đầu tiên
 # ---------------------------------------------------------------------------
@@ -81,8 +85,17 @@ def inject_custom_css():
 # ---------------------------------------------------------------------------
 # 4. HIỆU ỨNG KHỞI ĐỘNG HỆ THỐNG (BOOT SEQUENCE)
 # ---------------------------------------------------------------------------
-def terminal_boot_sequence():
-    """Hiệu ứng chạy text giả lập quá trình khởi động máy chủ"""
+# Độ trễ (giây) mỗi dòng log của hiệu ứng boot. Mặc định 0 = bỏ qua hiệu ứng, vẽ Dashboard ngay.
+# Đặt FINCEPT_BOOT_DELAY=0.3 để có lại màn hình khởi động kiểu cũ (~2.6s).
+BOOT_STEP_DELAY = float(os.environ.get("FINCEPT_BOOT_DELAY", "0"))
+BOOT_FINAL_PAUSE = 0.5  # Dừng sau dòng "System Ready." (7 x 0.3s + 0.5s ~ 2.6s)
+
+
+def terminal_boot_sequence(step_delay: float = BOOT_STEP_DELAY):
+    """Hiệu ứng chạy text giả lập quá trình khởi động máy chủ (chỉ chạy khi step_delay > 0)"""
+    if step_delay <= 0:
+        st.session_state['system_booted'] = True
+        return
     if 'system_booted' not in st.session_state:
         boot_placeholder = st.empty()
         with boot_placeholder.container():
@@ -104,23 +117,90 @@ def terminal_boot_sequence():
             for i, log in enumerate(boot_logs):
                 status_text.code(f"[{datetime.datetime.now().strftime('%H:%M:%S.%f')[:-3]}] {log}", language="bash")
                 progress_bar.progress((i + 1) * (100 // len(boot_logs)))
-                time.sleep(0.3) # Độ trễ tạo cảm giác chân thực
+                time.sleep(step_delay) # Độ trễ tạo cảm giác chân thực
                 
-            time.sleep(0.5)
+            time.sleep(BOOT_FINAL_PAUSE)
         
         # Xóa hiệu ứng sau khi boot xong
         boot_placeholder.empty()
         st.session_state['system_booted'] = True
 
 # ---------------------------------------------------------------------------
-# 5. HÀM KIỂM TRA TRẠNG THÁI MODULE (SYSTEM DIAGNOSTICS)
+# 5. CHẨN ĐOÁN HỆ THỐNG THEO SỐ ĐO THỰC (SYSTEM DIAGNOSTICS)
 # ---------------------------------------------------------------------------
-def check_module_status(filepath: str) -> tuple[str, str]:
-    """Kiểm tra xem file module đã được tạo hay chưa"""
-    full_path = os.path.join(ROOT_DIR, filepath)
-    if os.path.exists(full_path):
-        return "ONLINE", "normal" # Xanh lá
-    return "OFFLINE", "inverse"   # Đỏ
+DIAGNOSTICS_REFRESH_SECONDS = float(os.environ.get("FINCEPT_DIAG_REFRESH", "5"))
+
+# Nút hiển thị -> tiền tố tên entry point được đo (src/backend/metrics.py)
+DIAGNOSTIC_NODES = (
+    ("Node: Market Data", "MarketDataEngine."),
+    ("Node: DCF Valuation", "DCFValuation."),
+    ("Node: AI & Macro", "MacroEngine."),
+)
+
+
+def node_metric(column, label: str, prefix: str):
+    """1 thẻ metric / nút: p95 độ trễ, số lượt gọi & tỷ lệ lỗi (IDLE khi chưa có lượt gọi nào)"""
+    node = node_summary(prefix)
+    if node["calls"] == 0:
+        column.metric(label, "IDLE", "no calls yet", delta_color="off")
+        return
+    column.metric(label, f"{node['p95'] * 1e3:,.1f} ms p95",
+                  f"{node['calls']} calls | {node['error_pct']:.1f}% err",
+                  delta_color="inverse" if node["errors"] else "off")
+
+
+@st.fragment(run_every=DIAGNOSTICS_REFRESH_SECONDS)
+def render_diagnostics():
+    """Bảng chẩn đoán tự làm mới: độ trễ / lỗi từng Engine, hiệu quả cache, upstream, prefetch"""
+    columns = st.columns(len(DIAGNOSTIC_NODES) + 1)
+    for column, (label, prefix) in zip(columns, DIAGNOSTIC_NODES):
+        node_metric(column, label, prefix)
+
+    caches = cache_summary()
+    if caches.empty:
+        columns[-1].metric("Cache: Hit Ratio", "IDLE", "no lookups yet", delta_color="off")
+    else:
+        served = caches[["hits", "stale_hits", "coalesced"]].to_numpy().sum()
+        lookups = served + caches["misses"].sum()
+        ratio = served / lookups * 100.0 if lookups else 0.0
+        columns[-1].metric("Cache: Hit Ratio", f"{ratio:.1f}%",
+                           f"{int(caches['entries'].sum())} entries | {int(caches['inflight'].sum())} in flight",
+                           delta_color="off")
+
+    with st.expander("📈 HOT-PATH METRICS (latency histograms, cache & upstream counters)"):
+        st.markdown("**ENGINE ENTRY POINTS**")
+        engines = engine_summary()
+        if engines.empty:
+            st.caption("No engine calls recorded in this process yet.")
+        else:
+            st.dataframe(engines.style.format({"Error_%": "{:.1f}", "Mean_ms": "{:,.1f}", "P50_ms": "{:,.1f}",
+                                               "P95_ms": "{:,.1f}", "P99_ms": "{:,.1f}"}),
+                         use_container_width=True)
+
+        st.markdown("**UPSTREAM PROVIDERS**")
+        upstream = upstream_summary()
+        if upstream.empty:
+            st.caption("No upstream requests recorded yet (everything served from cache / local store).")
+        else:
+            st.dataframe(upstream.style.format({"Error_%": "{:.1f}", "Mean_ms": "{:,.1f}", "P50_ms": "{:,.1f}",
+                                                "P95_ms": "{:,.1f}", "P99_ms": "{:,.1f}", "MB": "{:,.2f}"}),
+                         use_container_width=True)
+
+        st.markdown("**COALESCING CACHES**")
+        if caches.empty:
+            st.caption("No cache lookups yet.")
+        else:
+            st.dataframe(caches.style.format({"hit_%": "{:.1f}"}), use_container_width=True)
+
+        scheduler = ensure_prefetcher()
+        if scheduler is not None:
+            status = scheduler.status()
+            st.caption(f"Prefetch: {'RUNNING' if status['running'] else 'STOPPED'} | "
+                       f"pending {status['pending']} | backoff {status['backoff']} | "
+                       f"watchlist {len(status['watchlist'])} tickers")
+
+        st.download_button("⬇️ EXPORT PROMETHEUS METRICS", render_prometheus(), file_name="fincept_metrics.prom",
+                           mime="text/plain")
 
 # ===========================================================================
 # MAIN DASHBOARD EXECUTION
@@ -128,6 +208,8 @@ def check_module_status(filepath: str) -> tuple[str, str]:
 def main():
     # 1. Kích hoạt giao diện & Hiệu ứng
     inject_custom_css()
+    ensure_prefetcher()  # Làm ấm cache watchlist ở nền (1 lần cho cả tiến trình)
+    ensure_metrics_server()  # Endpoint /metrics cho Prometheus (chỉ khi đặt FINCEPT_METRICS_PORT)
     terminal_boot_sequence()
 
     # 2. Tiêu đề Dashboard
@@ -153,26 +235,9 @@ def main():
 
     # 4. CHẨN ĐOÁN HỆ THỐNG (SYSTEM DIAGNOSTICS)
     st.subheader("⚙️ SYSTEM DIAGNOSTICS & NODE STATUS")
-    st.info("Bảng theo dõi tiến độ lắp ráp các Module. Hệ thống sẽ tự động cập nhật khi Ngài thêm file mới.")
-    
-    # Kiểm tra các module Backend
-    m1, m2, m3, m4 = st.columns(4)
-    
-    # Check Market Engine
-    status_market, color_market = check_module_status("src/backend/market.py")
-    m1.metric("Node: Market Data", status_market, "src/backend/market.py", delta_color=color_market)
-    
-    # Check Valuation Engine
-    status_val, color_val = check_module_status("src/analytics/valuation.py")
-    m2.metric("Node: DCF Valuation", status_val, "src/analytics/valuation.py", delta_color=color_val)
-    
-    # Check Risk Engine
-    status_risk, color_risk = check_module_status("src/analytics/risk.py")
-    m3.metric("Node: Risk & CFA", status_risk, "src/analytics/risk.py", delta_color=color_risk)
-    
-    # Check Neural Core
-    status_ai, color_ai = check_module_status("src/backend/macro.py") # Tạm check file macro
-    m4.metric("Node: AI & Macro", status_ai, "src/backend/macro.py", delta_color=color_ai)
+    st.caption("Số đo thực trong tiến trình (dùng chung mọi phiên), tự làm mới mỗi "
+               f"{DIAGNOSTICS_REFRESH_SECONDS:g}s. Đặt FINCEPT_METRICS_PORT để mở endpoint /metrics cho Prometheus.")
+    render_diagnostics()
 
     st.markdown("---")
 
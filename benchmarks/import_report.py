@@ -0,0 +1,137 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: benchmarks/import_report.py
+ROLE: Báo cáo thời gian import theo từng trang (đo chi phí khởi động phiên mới)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+Chạy từ thư mục gốc của dự án:
+    python benchmarks/import_report.py                  # app.py + mọi trang trong pages/
+    python benchmarks/import_report.py --top 15         # 15 module nặng nhất mỗi trang
+    python benchmarks/import_report.py --json           # xuất JSON (dùng cho CI)
+
+Mỗi trang được đo trong 1 tiến trình Python mới với `-X importtime`: chỉ thực thi các lệnh
+import cấp module của trang (không chạy giao diện). Phần chi phí của chính Streamlit được tách
+riêng làm mốc sàn (framework minimum) để thấy phần mà code của dự án cộng thêm.
+"""
+
+import os
+import sys
+import ast
+import json
+import glob
+import argparse
+import subprocess
+from typing import Optional, Dict, Any, List, Tuple
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Mốc sàn: chi phí import của framework mà mọi trang đều phải trả
+FRAMEWORK_IMPORTS = "import streamlit"
+
+# Số lần đo mỗi trang (lấy lần nhanh nhất để giảm nhiễu đĩa / cache hệ điều hành)
+DEFAULT_REPEAT = 3
+
+
+def page_imports(path: str) -> str:
+    """Trích các lệnh import cấp module của 1 trang (bỏ qua phần giao diện)"""
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    lines = [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return "\n".join(lines)
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """Dòng `import time: self | cumulative | name` -> [(module, self_us, cumulative_us, depth)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            parts = line[len("import time:"):].split("|")
+            self_us, cumulative_us, name = int(parts[0]), int(parts[1]), parts[2].rstrip()
+        except (ValueError, IndexError):
+            continue
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append((name.strip(), self_us, cumulative_us, depth))
+    return rows
+
+
+def measure(code: str, repeat: int) -> Dict[str, Any]:
+    """Chạy `code` trong tiến trình mới với -X importtime, trả về lần đo nhanh nhất"""
+    best: Optional[Dict[str, Any]] = None
+    bootstrap = f"import sys; sys.path.insert(0, {ROOT_DIR!r})\n"
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", bootstrap + code],
+                              cwd=ROOT_DIR, capture_output=True, text=True)
+        rows = parse_importtime(proc.stderr)
+        total_us = sum(r[2] for r in rows if r[3] == 0)
+        if best is None or total_us < best["total_us"]:
+            best = {"total_us": total_us, "rows": rows, "returncode": proc.returncode,
+                    "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else None}
+    return best
+
+
+def heaviest(rows: List[Tuple[str, int, int, int]], skip: set, top: int) -> List[Tuple[str, int]]:
+    """Các package gốc nặng nhất (cộng dồn theo tên gốc, bỏ các module đã có trong mốc sàn)"""
+    totals: Dict[str, int] = {}
+    for name, self_us, _, _ in rows:
+        if name in skip:
+            continue
+        root = name.split(".")[0]
+        totals[root] = totals.get(root, 0) + self_us
+    return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:top]
+
+
+def build_report(pages: List[str], repeat: int, top: int) -> Dict[str, Any]:
+    framework = measure(FRAMEWORK_IMPORTS, repeat)
+    framework_modules = {r[0] for r in framework["rows"]}
+    report = {"framework_ms": framework["total_us"] / 1e3, "pages": []}
+    for path in pages:
+        result = measure(page_imports(path), repeat)
+        extra = [r for r in result["rows"] if r[0] not in framework_modules]
+        report["pages"].append({
+            "page": os.path.relpath(path, ROOT_DIR),
+            "total_ms": result["total_us"] / 1e3,
+            "project_ms": sum(r[1] for r in extra) / 1e3,
+            "modules": len(extra),
+            "heaviest": [(name, us / 1e3) for name, us in heaviest(extra, framework_modules, top)],
+            "error": result["error"],
+        })
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"framework minimum (import streamlit): {report['framework_ms']:.0f} ms\n")
+    print(f"{'page':<40}{'total (ms)':>12}{'above fw (ms)':>15}{'modules':>10}")
+    print("-" * 77)
+    for page in report["pages"]:
+        print(f"{page['page']:<40}{page['total_ms']:>12.0f}{page['project_ms']:>15.0f}{page['modules']:>10}")
+    for page in report["pages"]:
+        print(f"\n{page['page']}" + (f"  [IMPORT ERROR: {page['error']}]" if page["error"] else ""))
+        for name, ms in page["heaviest"]:
+            print(f"    {name:<30}{ms:>10.1f} ms")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Per-page import-time report")
+    parser.add_argument("pages", nargs="*", help="Đường dẫn trang (mặc định app.py + pages/*.py)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Số lần đo mỗi trang")
+    parser.add_argument("--top", type=int, default=8, help="Số package nặng nhất hiển thị mỗi trang")
+    parser.add_argument("--json", action="store_true", help="In kết quả dạng JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    pages = args.pages or [os.path.join(ROOT_DIR, "app.py")] + sorted(glob.glob(os.path.join(ROOT_DIR, "pages", "*.py")))
+    report = build_report(pages, args.repeat, args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
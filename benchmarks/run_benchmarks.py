@@ -0,0 +1,329 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: benchmarks/run_benchmarks.py
+ROLE: Benchmark Suite cho các Hot Path (Analytics / Valuation / Rendering)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+Chạy từ thư mục gốc của dự án:
+    python benchmarks/run_benchmarks.py                     # 1k -> 1M dòng
+    python benchmarks/run_benchmarks.py --full              # thêm mốc 10M dòng
+    python benchmarks/run_benchmarks.py --only technical --sizes 1000 100000
+    python benchmarks/run_benchmarks.py --fail-on-regression
+
+Mỗi lần chạy ghi 1 dòng JSON vào data/benchmarks/history.jsonl và so sánh với
+lần chạy gần nhất trước đó (cùng tên benchmark + cùng số dòng).
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Optional, Dict, Any, List, Tuple
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT_DIR)
+
+import numpy as np
+import pandas as pd
+
+from src.backend.providers import generate_synthetic_ohlcv, ReplayProvider, set_provider
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+FULL_SIZES = DEFAULT_SIZES + (10_000_000,)
+HISTORY_PATH = os.path.join(ROOT_DIR, 'data', 'benchmarks', 'history.jsonl')
+
+# Chậm hơn baseline quá 25% (theo thời gian tốt nhất) -> đánh dấu REGRESSION
+REGRESSION_THRESHOLD = 0.25
+
+# Tổng ngân sách thời gian cho các lần lặp của 1 phép đo (giây)
+TIME_BUDGET = 2.0
+
+
+@dataclass
+class BenchCase:
+    """Định nghĩa 1 benchmark: setup(n) dựng input (không tính giờ), run(input) là phần được đo"""
+    name: str
+    setup: Callable[[int], Any]
+    run: Callable[[Any], Any]
+    scales: bool = True               # False -> chi phí không phụ thuộc số dòng, chỉ đo 1 lần
+    max_rows: Optional[int] = None    # Giới hạn trên để tránh các case chạy hàng chục phút
+
+
+# =============================================================================
+# 1. DỮ LIỆU TỔNG HỢP
+# =============================================================================
+def synthetic_frame(n_rows: int) -> pd.DataFrame:
+    """
+    Khung OHLCV đã chuẩn hóa (cột 'timestamp') như MarketDataEngine trả về cho UI.
+    Trên 50k dòng chuyển sang nến phút để trục thời gian không vượt giới hạn pd.Timestamp.
+    """
+    freq = "B" if n_rows <= 50_000 else "min"
+    df = generate_synthetic_ohlcv(n_rows, seed=n_rows, freq=freq)
+    df = df.reset_index()
+    df.rename(columns={df.columns[0]: 'timestamp'}, inplace=True)
+    return df
+
+
+_FRAME_CACHE: Dict[Tuple[str, int], pd.DataFrame] = {}
+
+
+def cached_frame(n_rows: int, with_indicators: bool = False) -> pd.DataFrame:
+    """Dựng dữ liệu 1 lần cho mỗi kích thước, dùng chung giữa các benchmark"""
+    key = ("indicators" if with_indicators else "raw", n_rows)
+    if key not in _FRAME_CACHE:
+        if with_indicators:
+            from src.analytics.technical import TechnicalIndicators
+            _FRAME_CACHE[key] = TechnicalIndicators.add_all_indicators(cached_frame(n_rows))
+        else:
+            _FRAME_CACHE[key] = synthetic_frame(n_rows)
+    return _FRAME_CACHE[key]
+
+
+# =============================================================================
+# 2. DANH MỤC BENCHMARK
+# =============================================================================
+def build_cases() -> List[BenchCase]:
+    from src.analytics.technical import TechnicalIndicators
+    from src.analytics.valuation import DCFValuation, two_stage_dcf
+    from src.backend.market import MarketDataEngine
+    from src.analytics.scanner import MarketScanner
+    from src.analytics.optimizer import PortfolioOptimizer
+    from src.analytics.backtest import SignalBacktester
+    from src.backend.resample import resample_ohlcv
+    from src.ui.charting import build_advanced_figure, format_numeric_table
+
+    def dcf_inputs(n: int) -> Tuple[np.ndarray, ...]:
+        rng = np.random.default_rng(n)
+        return (np.full(n, 1e9), rng.normal(0.08, 0.03, n),
+                rng.uniform(0.015, 0.03, n), rng.uniform(0.07, 0.11, n))
+
+    def price_panel(n: int) -> pd.DataFrame:
+        """Ma trận giá ~1 năm phiên (260 hàng) x (n / 260) tài sản: n = tổng số ô"""
+        rng = np.random.default_rng(n)
+        n_assets = max(n // 260, 1)
+        steps = rng.normal(0.0002, 0.02, size=(260, n_assets))
+        return pd.DataFrame(100.0 * np.exp(np.cumsum(steps, axis=0)),
+                            index=pd.bdate_range("2024-01-01", periods=260),
+                            columns=[f"A{i:05d}" for i in range(n_assets)])
+
+    return [
+        BenchCase("technical.add_all_indicators",
+                  setup=cached_frame,
+                  run=TechnicalIndicators.add_all_indicators),
+        BenchCase("technical.add_all_indicators[compact]",
+                  setup=cached_frame,
+                  run=lambda df: TechnicalIndicators.add_all_indicators(df, compact=True)),
+        BenchCase("market.calculate_volatility",
+                  setup=cached_frame,
+                  run=MarketDataEngine.calculate_volatility),
+        BenchCase("valuation.dcf_calculate",
+                  setup=lambda n: DCFValuation("BENCH"),
+                  run=lambda model: model.calculate(0.08, 0.025, 0.055),
+                  scales=False),
+        BenchCase("valuation.two_stage_dcf",
+                  setup=dcf_inputs,
+                  run=lambda args: two_stage_dcf(*args)),
+        BenchCase("ui.build_advanced_figure",
+                  setup=lambda n: cached_frame(n, with_indicators=True),
+                  run=lambda df: build_advanced_figure(df, "BENCH", max_points=2000)),
+        BenchCase("ui.format_numeric_table",
+                  setup=lambda n: cached_frame(n, with_indicators=True),
+                  run=format_numeric_table,
+                  max_rows=1_000_000),
+        BenchCase("resample.resample_ohlcv[1wk]",
+                  setup=cached_frame,
+                  run=lambda df: resample_ohlcv(df, "1wk")),
+        BenchCase("scanner.scan[260 x n/260]",
+                  setup=price_panel,
+                  run=MarketScanner().scan,
+                  max_rows=1_000_000),
+        BenchCase("backtest.sweep_sma[1,000 pairs]",
+                  setup=lambda n: cached_frame(n)['Close'].to_numpy(),
+                  run=lambda close: SignalBacktester.sweep_sma(close, range(5, 105, 2), range(20, 260, 10)),
+                  max_rows=100_000),
+        BenchCase("optimizer.optimize[260 x n/260]",
+                  setup=lambda n: price_panel(n).pct_change().dropna(),
+                  run=lambda returns: PortfolioOptimizer.optimize(returns, risk_free=0.04),
+                  max_rows=130_000),
+    ]
+
+
+# =============================================================================
+# 3. ĐO THỜI GIAN & BỘ NHỚ
+# =============================================================================
+def measure(case: BenchCase, n_rows: int, repeat: int) -> Dict[str, Any]:
+    """
+    Thời gian: perf_counter, lặp tối đa `repeat` lần trong ngân sách TIME_BUDGET, lấy best & median.
+    Bộ nhớ: 1 lần chạy riêng dưới tracemalloc (numpy/pandas đều khai báo cấp phát với tracemalloc),
+    tách khỏi phần đo giờ vì tracemalloc làm chậm đáng kể.
+    """
+    payload = case.setup(n_rows)
+
+    gc.collect()
+    timings = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        case.run(payload)
+        timings.append(time.perf_counter() - t0)
+        if time.perf_counter() - started > TIME_BUDGET:
+            break
+
+    gc.collect()
+    tracemalloc.start()
+    case.run(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "name": case.name,
+        "n": n_rows,
+        "repeat": len(timings),
+        "best_s": min(timings),
+        "median_s": statistics.median(timings),
+        "peak_mb": peak / 1024 ** 2,
+    }
+
+
+# =============================================================================
+# 4. LỊCH SỬ & SO SÁNH
+# =============================================================================
+def git_revision() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+def load_history(path: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    runs = []
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                try:
+                    runs.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning("Skipping malformed benchmark history line")
+    return runs
+
+
+def baseline_for(history: List[Dict[str, Any]], revision: Optional[str] = None) -> Dict[Tuple[str, int], Dict[str, Any]]:
+    """Kết quả gần nhất cho mỗi (benchmark, n); revision != None -> chỉ lấy các lần chạy của commit đó"""
+    baseline = {}
+    for run in history:
+        if revision and run.get("git_rev") != revision:
+            continue
+        for res in run.get("results", []):
+            baseline[(res["name"], res["n"])] = res
+    return baseline
+
+
+def append_history(path: str, record: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as fh:
+        fh.write(json.dumps(record) + "\n")
+
+
+def print_report(results: List[Dict[str, Any]], baseline: Dict[Tuple[str, int], Dict[str, Any]],
+                 threshold: float) -> List[Dict[str, Any]]:
+    """In bảng kết quả, trả về danh sách các benchmark bị chậm đi quá ngưỡng"""
+    regressions = []
+    header = f"{'benchmark':<40}{'rows':>12}{'best (ms)':>14}{'median (ms)':>14}{'peak (MB)':>12}{'vs base':>10}"
+    print(header)
+    print("-" * len(header))
+    for res in results:
+        base = baseline.get((res["name"], res["n"]))
+        delta = ""
+        if base and base.get("best_s"):
+            change = res["best_s"] / base["best_s"] - 1.0
+            delta = f"{change:+.1%}"
+            if change > threshold:
+                delta += " !"
+                regressions.append({**res, "baseline_s": base["best_s"], "change": change})
+        print(f"{res['name']:<40}{res['n']:>12,}{res['best_s'] * 1e3:>14.2f}"
+              f"{res['median_s'] * 1e3:>14.2f}{res['peak_mb']:>12.1f}{delta:>10}")
+    return regressions
+
+
+# =============================================================================
+# 5. ENTRYPOINT
+# =============================================================================
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Fincept hot-path benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", help="Số dòng OHLCV (mặc định 1k..1M)")
+    parser.add_argument("--full", action="store_true", help="Thêm mốc 10M dòng")
+    parser.add_argument("--only", nargs="+", default=[], help="Chỉ chạy benchmark có tên chứa chuỗi này")
+    parser.add_argument("--repeat", type=int, default=7, help="Số lần lặp tối đa cho mỗi phép đo")
+    parser.add_argument("--history", default=HISTORY_PATH, help="File lịch sử JSONL")
+    parser.add_argument("--baseline", default=None, help="So sánh với git revision cụ thể thay vì lần chạy gần nhất")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--no-save", action="store_true", help="Không ghi kết quả vào lịch sử")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Thoát với mã 1 nếu có regression")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    # Toàn bộ dữ liệu đầu vào đến từ ReplayProvider (tổng hợp, cố định seed) -> không phụ thuộc mạng.
+    # Tắt tầng cache đĩa: mỗi lần chạy đo đường tải thật, không để lại mục rác cho thư mục replay tạm.
+    os.environ.setdefault("FINCEPT_DISK_CACHE", "0")
+    set_provider(ReplayProvider(tempfile.mkdtemp(prefix="fincept_bench_")))
+
+    sizes = sorted(set(args.sizes or (FULL_SIZES if args.full else DEFAULT_SIZES)))
+    cases = [c for c in build_cases() if not args.only or any(key in c.name for key in args.only)]
+
+    results = []
+    for case in cases:
+        case_sizes = sizes if case.scales else [1]
+        for n_rows in case_sizes:
+            if case.max_rows and n_rows > case.max_rows:
+                print(f"skip {case.name} @ {n_rows:,} rows (max_rows={case.max_rows:,})", file=sys.stderr)
+                continue
+            print(f"running {case.name} @ {n_rows:,} rows...", file=sys.stderr)
+            results.append(measure(case, n_rows, args.repeat))
+
+    history = load_history(args.history)
+    regressions = print_report(results, baseline_for(history, args.baseline), args.threshold)
+
+    if not args.no_save:
+        append_history(args.history, {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_rev": git_revision(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": f"{platform.system()}-{platform.machine()}",
+            "results": results,
+        })
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}:")
+        for reg in regressions:
+            print(f"  {reg['name']} @ {reg['n']:,}: {reg['baseline_s'] * 1e3:.2f} ms -> {reg['best_s'] * 1e3:.2f} ms ({reg['change']:+.1%})")
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
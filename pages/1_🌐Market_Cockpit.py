@@ -10,17 +10,45 @@ AUTHOR: Fincept Copilot (Emo)
 import streamlit as st
 import sys
 import os
+import time
 
 # Nạp hệ thống thư viện Core
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from src.backend.market import MarketDataEngine
+from src.backend.prefetch import ensure_prefetcher
+from src.backend.streaming import ensure_tick_stream
+from src.backend.metrics import latency_quantile
+from src.backend.profiling import start_page_profile, finish_page_profile, stage
 from src.analytics.technical import TechnicalIndicators
+from src.analytics.kernels import compact_ohlcv, memory_report
+from src.analytics.scanner import MarketScanner, DEFAULT_UNIVERSE, PRESET_SCREENS
+from src.analytics.backtest import SignalBacktester, PRESET_RULES, PERIODS_PER_YEAR
 from src.ui.components import TerminalUI
 from src.ui.styles import apply_terminal_style
 
 # 1. KHỞI TẠO PAGE
 st.set_page_config(page_title="Market Cockpit", page_icon="🌐", layout="wide")
 apply_terminal_style()
+ensure_prefetcher()
+TerminalUI.render_profile_toggle()
+profiler = start_page_profile("Market Cockpit")  # None khi không bật profile (?profile=1 hoặc công tắc sidebar)
+
+LIVE_REFRESH_SECONDS = float(os.environ.get("FINCEPT_LIVE_REFRESH", "2"))
+
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def render_live_price(symbol: str, prev_close: float, fallback_price: float, prefix: str):
+    """Thẻ LAST PRICE cập nhật từ ring buffer tick (partial rerun), không chạy lại toàn trang"""
+    stream = ensure_tick_stream([symbol])
+    live = stream.summary(symbol, reference=prev_close)
+    if live is None:
+        _, chg_pct = MarketDataEngine.calculate_price_change(fallback_price, prev_close)
+        TerminalUI.render_metric_card("LAST PRICE", fallback_price, chg_pct, prefix=prefix)
+        st.caption(f"Live feed ({stream.source.name}): waiting for first tick...")
+    else:
+        TerminalUI.render_metric_card("LAST PRICE", live['price'], live['pct_change'], prefix=prefix)
+        st.caption(f"LIVE · {stream.source.name} · {live['ticks']:,} ticks · "
+                   f"range {live['low']:,.2f}-{live['high']:,.2f} · {live['age']:.0f}s ago")
 
 # 2. HEADER
 st.title("🌐 MARKET COCKPIT")
@@ -38,17 +66,21 @@ with col_ctrl:
     st.subheader("PARAMETERS")
     period = st.selectbox("TIME HORIZON", ["1mo", "3mo", "6mo", "1y", "2y", "5y", "10y", "max"], index=3)
     interval = st.selectbox("RESOLUTION", ["1d", "1wk", "1mo"])
+    compact = st.toggle("COMPACT MEMORY", value=os.environ.get("FINCEPT_COMPACT", "0") == "1",
+                        help="float32 prices, integer volume, indicators in one preallocated block (~50% less RAM)")
     
     st.markdown("---")
     st.caption("Auto-sync: Active")
-    st.caption("Cache latency: <50ms")
+    p95 = latency_quantile("MarketDataEngine.get_historical_data")
+    st.caption(f"History latency p95: {p95 * 1e3:,.1f}ms" if p95 is not None else "History latency p95: n/a")
 
 # 4. KHU VỰC HIỂN THỊ CHÍNH (MAIN DISPLAY)
 with col_main:
     with st.spinner(f"Establishing connection to global feeds for {ticker}..."):
         # Kéo dữ liệu từ Backend
-        info = MarketDataEngine.get_company_info(ticker)
-        df_raw = MarketDataEngine.get_historical_data(ticker, period, interval)
+        with stage("fetch"):
+            info = MarketDataEngine.get_company_info(ticker)
+            df_raw = MarketDataEngine.get_historical_data(ticker, period, interval)
         
         if info and not "error" in info and df_raw is not None:
             # === PHẦN A: METRICS (Chỉ số nhanh) ===
@@ -57,10 +89,9 @@ with col_main:
             m1, m2, m3, m4 = st.columns(4)
             curr_price = info.get('current_price', 0)
             prev_price = info.get('previous_close', 0)
-            chg_abs, chg_pct = MarketDataEngine.calculate_price_change(curr_price, prev_price)
             
             with m1:
-                TerminalUI.render_metric_card("LAST PRICE", curr_price, chg_pct, prefix=info.get('currency', '$') + " ")
+                render_live_price(ticker, prev_price, curr_price, info.get('currency', '$') + " ")
             with m2:
                 TerminalUI.render_metric_card("MARKET CAP", info.get('market_cap', 0) / 1e9, 0, prefix="$", format_str="{:,.2f}B")
             with m3:
@@ -73,7 +104,10 @@ with col_main:
             
             # === PHẦN B: TÍNH TOÁN & VẼ BIỂU ĐỒ ===
             # Bơm các chỉ báo kỹ thuật vào Dataframe
-            df_tech = TechnicalIndicators.add_all_indicators(df_raw)
+            with stage("indicators"):
+                if compact:
+                    df_raw = compact_ohlcv(df_raw)
+                df_tech = TechnicalIndicators.add_all_indicators(df_raw, compact=compact)
             
             # Gọi hàm vẽ biểu đồ từ thư viện UI
             TerminalUI.render_advanced_chart(
@@ -82,14 +116,97 @@ with col_main:
                 show_volume=True
             )
             
+            mem = memory_report({"ohlcv": df_raw, "indicators": df_tech})
+            st.caption(f"Session memory: {mem['total_mb']:.2f} MB "
+                       f"(OHLCV {mem['frames_mb']['ohlcv']:.2f} MB + indicators {mem['frames_mb']['indicators']:.2f} MB) | "
+                       f"{len(df_tech):,} bars | mode: {'compact' if compact else 'standard'}")
+
             # === PHẦN C: DỮ LIỆU THÔ (DATA MATRIX) ===
             with st.expander("👁️ DEEP DIVE: RAW TECHNICAL MATRIX"):
                 st.caption("Bảng dữ liệu OHLCV và các chỉ báo kỹ thuật (RSI, MACD, BB) của 30 phiên gần nhất.")
                 # Lọc dữ liệu, đổi thứ tự ngày mới nhất lên trên cùng
                 display_df = df_tech.tail(30).sort_index(ascending=False)
                 TerminalUI.render_data_table(display_df, height=300)
+
+            # === PHẦN D: BACKTEST LUẬT CHỈ BÁO ===
+            with st.expander("🧪 STRATEGY BACKTEST: INDICATOR RULES & SMA PARAMETER SWEEP"):
+                bt1, bt2 = st.columns([3, 1])
+                with bt1:
+                    rule = st.selectbox("RULE", list(PRESET_RULES.keys()),
+                                        help="Long khi luật thỏa, đứng ngoài khi không; vị thế chốt ở giá đóng cửa, nắm giữ từ phiên sau")
+                with bt2:
+                    cost_bps = st.number_input("COST (bps)", min_value=0.0, max_value=100.0, step=1.0,
+                                               value=SignalBacktester.DEFAULT_COST_BPS, help="Phí + trượt giá trên mỗi đơn vị turnover")
+                periods_per_year = PERIODS_PER_YEAR[interval]
+                with stage("backtest"):
+                    backtest = SignalBacktester.run_rule(df_tech, rule, cost_bps, periods_per_year)
+                TerminalUI.render_equity_curve(backtest["curves"], f"{ticker} - {rule.upper()} vs BUY & HOLD")
+                TerminalUI.render_data_table(backtest["metrics"], height=110)
+
+                sw1, sw2, sw3 = st.columns([2, 2, 1])
+                with sw1:
+                    fast_range = st.slider("FAST SMA", 2, 150, (5, 100))
+                with sw2:
+                    slow_range = st.slider("SLOW SMA", 10, 300, (20, 250))
+                with sw3:
+                    sweep_step = st.number_input("STEP", min_value=1, max_value=50, value=5)
+                fast_windows = range(fast_range[0], fast_range[1] + 1, int(sweep_step))
+                slow_windows = range(slow_range[0], slow_range[1] + 1, int(sweep_step))
+                if st.button("RUN SMA SWEEP", use_container_width=True):
+                    # Cần ít nhất 1 cặp FAST < SLOW (sweep_sma báo ValueError nếu không có)
+                    if min(fast_windows) >= max(slow_windows):
+                        st.warning("⚠️ Không có cặp SMA nào với FAST < SLOW. Hãy hạ khoảng FAST hoặc nâng khoảng SLOW.")
+                    else:
+                        t0 = time.perf_counter()
+                        with stage("sweep"):
+                            sweep = SignalBacktester.sweep_sma(df_tech['Close'].to_numpy(), fast_windows, slow_windows,
+                                                               cost_bps, periods_per_year)
+                        elapsed = time.perf_counter() - t0
+                        if sweep.empty:
+                            st.warning("⚠️ SMA sweep không trả về kết quả.")
+                        else:
+                            grid = SignalBacktester.sweep_grid(sweep, "Slow", "Fast")
+                            best = sweep.iloc[0]
+                            TerminalUI.render_sensitivity_heatmap(grid.to_numpy(), grid.columns.to_numpy(), grid.index.to_numpy(),
+                                                                  title="SHARPE RATIO BY SMA PAIR", x_title="Fast", y_title="Slow",
+                                                                  z_title="Sharpe", marker=(best["Fast"], best["Slow"]), zmid=0.0)
+                            st.caption(f"{len(sweep):,} combinations x {len(df_tech):,} bars in {elapsed * 1000:,.0f} ms | "
+                                       f"best: SMA {best['Fast']:.0f}/{best['Slow']:.0f} (Sharpe {best['Sharpe']:.2f}, "
+                                       f"max DD {best['Max Drawdown']:.1%}) - in-sample, chưa kiểm định ngoài mẫu")
+                            TerminalUI.render_data_table(sweep.head(20), height=300)
                 
         else:
             # Xử lý ngoại lệ đẹp mắt
             st.error(f"SYSTEM FAILURE: Unable to locate asset '{ticker}'.")
             st.info("💡 Hướng dẫn: Đảm bảo mã Ticker đúng định dạng của Yahoo Finance. Ví dụ: AAPL, TSLA, BTC-USD, VNM.HM")
+
+# 5. MÁY QUÉT THỊ TRƯỜNG (CROSS-SECTIONAL SCANNER)
+st.divider()
+with st.expander("📡 MARKET SCANNER: RSI / SMA CROSS / BOLLINGER %B / 52W RANGE"):
+    sc1, sc2, sc3 = st.columns([3, 2, 1])
+    with sc1:
+        universe_raw = st.text_area("UNIVERSE", value=", ".join(DEFAULT_UNIVERSE), height=100,
+                                    help="Danh sách mã cách nhau bởi dấu phẩy / xuống dòng (VD: toàn bộ S&P 500)")
+    with sc2:
+        preset = st.selectbox("SCREEN", list(PRESET_SCREENS.keys()))
+    with sc3:
+        top_n = st.number_input("TOP N", min_value=5, max_value=500, value=25, step=5)
+
+    if st.button("RUN SCAN", use_container_width=True):
+        universe = [t for t in universe_raw.replace("\n", ",").split(",") if t.strip()]
+        t0 = time.perf_counter()
+        with st.spinner(f"Loading price panel for {len(universe)} assets..."):
+            panel = MarketDataEngine.get_price_panel(universe, period="1y", interval="1d")
+        t1 = time.perf_counter()
+        if not panel:
+            st.warning("No price data available for the selected universe.")
+        else:
+            with stage("scan"):
+                result = MarketScanner().run_preset(panel, preset, top=int(top_n))
+            t2 = time.perf_counter()
+            st.caption(f"{panel['Close'].shape[1]} assets x {panel['Close'].shape[0]} bars | "
+                       f"panel {t1 - t0:.2f}s | scan {(t2 - t1) * 1000:.1f} ms | {len(result)} matches")
+            TerminalUI.render_data_table(result, height=400)
+
+# 6. BÁO CÁO PROFILE (chỉ khi lượt chạy này được profile)
+TerminalUI.render_profile_report(finish_page_profile(profiler))
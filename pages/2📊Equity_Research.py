@@ -8,18 +8,62 @@ AUTHOR: Fincept Copilot (Emo)
 """
 
 import streamlit as st
+import numpy as np
 import sys
 import os
+import time
+from concurrent.futures import Future
 
 # Định tuyến hệ thống
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from src.analytics.valuation import DCFValuation
+from src.analytics.scanner import DEFAULT_UNIVERSE
+from src.backend.prefetch import ensure_prefetcher
+from src.backend.profiling import start_page_profile, finish_page_profile
 from src.ui.components import TerminalUI
 from src.ui.styles import apply_terminal_style
 
 # 1. KHỞI TẠO PAGE
 st.set_page_config(page_title="Equity Research", page_icon="📊", layout="wide")
 apply_terminal_style()
+ensure_prefetcher()
+TerminalUI.render_profile_toggle()
+profiler = start_page_profile("Equity Research")
+
+MC_POLL_SECONDS = 0.5
+
+
+def render_monte_carlo(mc: dict, prefix: str, curr: str, current_price: float):
+    """Vẽ kết quả Monte Carlo đã xong (tĩnh, không chạy lại theo chu kỳ)"""
+    if "error" in mc:
+        st.error(f"MONTE CARLO HALTED: {mc['error']}")
+        return
+    p = mc['percentiles']
+    q1, q2, q3, q4 = st.columns(4)
+    q1.metric("P5 FAIR VALUE", f"{prefix}{p[5]:,.2f}")
+    q2.metric("MEDIAN FAIR VALUE", f"{prefix}{p[50]:,.2f}")
+    q3.metric("P95 FAIR VALUE", f"{prefix}{p[95]:,.2f}")
+    q4.metric("PROB. OF UPSIDE", f"{mc['prob_upside']*100:.1f}%")
+    TerminalUI.render_distribution(
+        mc['histogram']['counts'], mc['histogram']['edges'],
+        title=f"{mc['n_draws']:,} DRAWS | SEED {mc['seed']}",
+        x_title=f"Fair Value ({curr})",
+        markers={"PRICE": current_price, "P5": p[5], "P95": p[95]}
+    )
+
+
+@st.fragment(run_every=MC_POLL_SECONDS)
+def poll_monte_carlo(job: Future):
+    """
+    Monte Carlo chạy ở luồng nền: fragment thăm dò Future, worker Streamlit không bị chặn.
+    Xong việc -> 1 lượt chạy lại toàn trang vẽ kết quả tĩnh; fragment không còn được gọi nên ngừng thăm dò.
+    """
+    if not job.done():
+        st.info("⏳ SIMULATING FAIR VALUE DISTRIBUTION IN BACKGROUND...")
+        return
+    st.session_state["mc_rerun"] = True
+    st.rerun()
+
 
 st.title("📊 EQUITY RESEARCH")
 st.markdown("`[MODULE 02] | DISCOUNTED CASH FLOW (DCF) VALUATION ENGINE | STANDARD: WALL STREET`")
@@ -41,6 +85,16 @@ with col_ctrl:
     terminal_g = st.slider("TERMINAL GROWTH (%)", min_value=1.0, max_value=5.0, value=2.5, step=0.1, help="Tốc độ tăng trưởng vĩnh viễn (thường bằng GDP hoặc Lạm phát)")
     erp = st.slider("EQUITY RISK PREMIUM (%)", min_value=3.0, max_value=10.0, value=5.5, step=0.1, help="Phần bù rủi ro vốn cổ phần thị trường")
     
+    st.markdown("---")
+    st.subheader("MONTE CARLO")
+    run_mc = st.checkbox("PROBABILISTIC MODE", value=False, help="Rút ngẫu nhiên các giả định quanh giá trị đã chọn")
+    if run_mc:
+        mc_draws = st.selectbox("DRAWS", [100_000, 250_000, 1_000_000, 2_000_000], index=2, format_func=lambda n: f"{n:,}")
+        mc_growth_sd = st.slider("GROWTH σ (%)", min_value=0.5, max_value=10.0, value=3.0, step=0.5)
+        mc_beta_sd = st.slider("BETA σ", min_value=0.0, max_value=0.5, value=0.15, step=0.05)
+        mc_erp_band = st.slider("ERP BAND ± (%)", min_value=0.0, max_value=3.0, value=1.0, step=0.1)
+        mc_seed = st.number_input("SEED", min_value=0, value=42, step=1)
+
     st.markdown("<br>", unsafe_allow_html=True)
     execute_btn = st.button("EXECUTE VALUATION MATRIX")
 
@@ -48,7 +102,8 @@ with col_ctrl:
 with col_main:
     st.subheader("VALUATION OUTPUT")
     
-    if execute_btn:
+    # Lượt chạy lại do Monte Carlo vừa xong: hiển thị lại đúng kết quả của lần EXECUTE trước
+    if execute_btn or st.session_state.pop("mc_rerun", False):
         with st.spinner(f"Compiling Financials & Running DCF Models for {ticker}..."):
             # Gọi Engine
             dcf_engine = DCFValuation(ticker)
@@ -95,6 +150,54 @@ with col_main:
 [+] Risk-Free Rate : {result['assumptions']['rf']*100:.2f}%
 [+] Enterprise Val : {prefix}{result['enterprise_value']:,.0f}
                     """.strip(), language="bash")
+
+                st.markdown("---")
+
+                # C. MA TRẬN ĐỘ NHẠY (SENSITIVITY HEATMAP) - 100 x 100 x 20 kịch bản trong 1 lượt
+                st.markdown("#### 🧮 SENSITIVITY MATRIX")
+                grid = dcf_engine.calculate_grid(
+                    growth_rates=np.linspace(0.01, 0.40, 100),
+                    terminal_growths=np.linspace(0.01, 0.05, 100),
+                    equity_risk_premiums=np.linspace(0.03, 0.10, 20)
+                )
+                if "error" not in grid:
+                    # Lát cắt tại ERP gần nhất với giả định đang chọn
+                    erp_idx = int(np.abs(grid['equity_risk_premiums'] - erp / 100.0).argmin())
+                    TerminalUI.render_sensitivity_heatmap(
+                        grid['upside_pct'][:, :, erp_idx],
+                        x=grid['terminal_growths'] * 100,
+                        y=grid['growth_rates'] * 100,
+                        title=f"UPSIDE (%) | ERP = {grid['equity_risk_premiums'][erp_idx]*100:.2f}%",
+                        x_title="Terminal Growth (%)",
+                        y_title="Growth 1-5Y (%)",
+                        z_title="Upside %",
+                        marker=(terminal_g, growth_rate),
+                        zmid=0.0
+                    )
+                    st.caption(f"{grid['fair_value'].size:,} scenarios evaluated in one vectorized pass.")
+
+                # D. PHÂN PHỐI GIÁ TRỊ NỘI TẠI (MONTE CARLO DCF)
+                if run_mc:
+                    st.markdown("---")
+                    st.markdown("#### 🎲 MONTE CARLO FAIR VALUE DISTRIBUTION")
+                    mc_key = (ticker, growth_rate, terminal_g, erp, mc_draws, mc_growth_sd, mc_beta_sd, mc_erp_band, int(mc_seed))
+                    mc_job = st.session_state.get("mc_job")
+                    if mc_job is None or mc_job[0] != mc_key:
+                        mc_job = (mc_key, dcf_engine.monte_carlo_async(
+                            distributions={
+                                "growth": ("normal", growth_rate / 100.0, mc_growth_sd / 100.0),
+                                "terminal_growth": ("triangular", max(terminal_g - 1.0, 0.0) / 100.0, terminal_g / 100.0, (terminal_g + 1.0) / 100.0),
+                                "beta": ("normal", result['assumptions']['beta'], mc_beta_sd),
+                                "erp": ("uniform", (erp - mc_erp_band) / 100.0, (erp + mc_erp_band) / 100.0),
+                            },
+                            n_draws=int(mc_draws),
+                            seed=int(mc_seed)
+                        ))
+                        st.session_state["mc_job"] = mc_job
+                    if mc_job[1].done():
+                        render_monte_carlo(mc_job[1].result(), prefix, curr, result['current_price'])
+                    else:
+                        poll_monte_carlo(mc_job[1])
             else:
                 st.error(f"SYSTEM HALTED: {result['error']}")
                 st.info("Module DCF yêu cầu cổ phiếu phải có lợi nhuận và Dòng tiền dương. Các công ty khởi nghiệp hoặc đang lỗ sẽ làm sập thuật toán.")
@@ -107,3 +210,36 @@ with col_main:
 > LOAD DCF_ALGORITHM... LOADED
 > STATUS: WAITING FOR USER INPUT
         """, language="bash")
+
+# 4. XẾP HẠNG DCF CẢ RỔ MÃ (BATCH VALUATION)
+st.divider()
+with st.expander("🏁 UNIVERSE DCF RANKING (BATCH)"):
+    st.caption("Định giá DCF đồng loạt cho cả rổ mã với cùng bộ giả định vĩ mô ở bảng điều khiển, xếp hạng theo Upside.")
+    rk1, rk2 = st.columns([4, 1])
+    with rk1:
+        universe_raw = st.text_area("UNIVERSE", value=", ".join(DEFAULT_UNIVERSE), height=100,
+                                    help="Danh sách mã cách nhau bởi dấu phẩy / xuống dòng")
+    with rk2:
+        top_n = st.number_input("TOP N", min_value=5, max_value=500, value=25, step=5)
+        only_valid = st.checkbox("VALID ONLY", value=True, help="Ẩn các mã FCF âm / thiếu dữ liệu")
+
+    if st.button("RANK UNIVERSE", use_container_width=True):
+        universe = [t for t in universe_raw.replace("\n", ",").split(",") if t.strip()]
+        t0 = time.perf_counter()
+        with st.spinner(f"Loading fundamentals for {len(universe)} tickers..."):
+            ranking = DCFValuation.rank_universe(
+                universe,
+                growth_rate_1_5=growth_rate / 100.0,
+                terminal_growth=terminal_g / 100.0,
+                equity_risk_premium=erp / 100.0,
+            )
+        elapsed = time.perf_counter() - t0
+        status_counts = ranking["Status"].value_counts().to_dict()
+        st.caption(f"{len(ranking)} tickers in {elapsed:.2f}s | " +
+                   " | ".join(f"{k}: {v}" for k, v in status_counts.items()))
+        if only_valid:
+            ranking = ranking[ranking["Status"] == "ok"]
+        TerminalUI.render_data_table(ranking.head(int(top_n)), height=420)
+
+# 5. BÁO CÁO PROFILE (chỉ khi lượt chạy này được profile)
+TerminalUI.render_profile_report(finish_page_profile(profiler))
@@ -2,49 +2,162 @@ import streamlit as st
 import numpy as np
 import pandas as pd
 import plotly.express as px
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.backend.market import MarketDataEngine
+from src.backend.macro import MacroEngine
+from src.analytics.risk import RiskEngine
+from src.analytics.optimizer import PortfolioOptimizer
+from src.backend.profiling import start_page_profile, finish_page_profile, stage
+from src.ui.components import TerminalUI
 from src.ui.styles import apply_terminal_style
 
 apply_terminal_style()
+TerminalUI.render_profile_toggle()
+profiler = start_page_profile("Portfolio Risk")  # lượt chạy kết thúc bằng st.stop() không ghi báo cáo
 st.title("⚖️ RISK MANAGEMENT & VaR")
 
 st.sidebar.header("Portfolio Construction")
 tickers = st.sidebar.text_input("Assets (comma separated)", "AAPL, MSFT, GOOG, GLD, BTC-USD")
 weights_str = st.sidebar.text_input("Weights (comma separated)", "0.2, 0.2, 0.2, 0.2, 0.2")
+lookback = st.sidebar.selectbox("Lookback Window", ["6mo", "1y", "2y", "5y", "10y"], index=1)
+
+st.sidebar.header("Risk Parameters")
+conf_levels = st.sidebar.multiselect("Confidence Levels", [0.90, 0.95, 0.975, 0.99], default=[0.95, 0.99], format_func=lambda c: f"{c:.1%}")
+horizons = st.sidebar.multiselect("Horizons (days)", [1, 5, 10, 21], default=[1, 10])
+mc_sims = st.sidebar.select_slider("Monte Carlo Simulations", options=[5_000, 10_000, 20_000, 50_000, 100_000], value=20_000)
+
+st.sidebar.header("Optimizer")
+weight_mode = st.sidebar.radio("Weights Source", ["Manual", "Min Variance", "Max Sharpe", "Target Return"],
+                               help="Manual dùng trọng số nhập tay; các chế độ còn lại lấy từ Mean-Variance Optimizer")
+min_weight = st.sidebar.number_input("Min Weight per Asset", min_value=-1.0, max_value=1.0, value=0.0, step=0.05,
+                                     help="0 = long-only; số âm cho phép bán khống tới mức đó")
+max_weight = st.sidebar.number_input("Max Weight per Asset", min_value=0.01, max_value=1.0, value=1.0, step=0.05)
+target_return = st.sidebar.number_input("Target Return (ann. %)", value=15.0, step=1.0) / 100.0
 
 if st.button("CALCULATE RISK METRICS"):
-    # Mock Data Generation
-    asset_list = [x.strip() for x in tickers.split(",")]
-    
+    asset_list = [x.strip().upper() for x in tickers.split(",") if x.strip()]
+
     try:
         weight_list = [float(x) for x in weights_str.split(",")]
-        # Chuẩn hóa trọng số về 1
-        if sum(weight_list)!= 1.0:
-             weight_list = [x/sum(weight_list) for x in weight_list]
+        if len(weight_list) != len(asset_list):
+            raise ValueError("Weights count does not match assets count")
     except:
-        st.error("Invalid weights format")
+        weight_list = None
+        if weight_mode == "Manual":
+            st.error("Invalid weights format")
+            st.stop()
+
+    # Tải toàn bộ rổ tài sản trong 1 lệnh batch, căn chỉnh trên trục thời gian chung
+    with st.spinner(f"Loading {len(asset_list)} assets in one batch..."):
+        data = MarketDataEngine.get_returns_matrix(asset_list, period=lookback, interval="1d")
+
+    if data.empty:
+        st.error("SYSTEM FAILURE: No price history available for the selected assets.")
+        st.stop()
+
+    missing = [a for a in asset_list if a not in data.columns]
+    if missing:
+        st.warning(f"No data for: {', '.join(missing)}. Weights re-normalized over remaining assets.")
+
+    # Chuẩn hóa trọng số về 1 trên các tài sản có dữ liệu
+    manual = None
+    if weight_list is not None:
+        manual = pd.Series(weight_list, index=asset_list)[data.columns]
+        # Tổng ~0 (VD: trọng số dồn hết vào mã không có dữ liệu, long/short triệt tiêu) -> không chuẩn hóa được
+        if abs(manual.sum()) < 1e-9:
+            st.error("Invalid weights: weights of the assets with data sum to 0, cannot normalize.")
+            st.stop()
+        manual = manual / manual.sum()
+
+    # Mean-Variance Optimizer: cả đường biên + Min Variance / Max Sharpe / Target Return trong 1 lượt giải theo lô
+    risk_free = MacroEngine.get_risk_free_rate()
+    try:
+        with stage("optimize"):
+            opt = PortfolioOptimizer.optimize(data, lower=min_weight, upper=max_weight, risk_free=risk_free,
+                                              target=target_return)
+    except ValueError as e:
+        opt = None
+        st.warning(f"Optimizer skipped: {e}")
+        if weight_mode != "Manual":
+            st.stop()
+
+    if weight_mode == "Manual":
+        weights = manual
+    elif weight_mode in opt["portfolios"]:
+        weights = opt["portfolios"][weight_mode]
+    else:
+        st.error(f"{weight_mode} unavailable: {opt['target_error']}")
         st.stop()
-    
-    # Create fake returns for demo (Thay bằng dữ liệu thật từ MarketEngine nếu cần)
-    dates = pd.date_range(start="2023-01-01", periods=252)
-    data = pd.DataFrame(index=dates)
-    for asset in asset_list:
-        data[asset] = np.random.normal(0, 0.015, 252) # Fake daily returns
-        
+
+    if not conf_levels or not horizons:
+        st.error("Select at least one confidence level and one horizon.")
+        st.stop()
+    conf_levels = sorted(conf_levels)
+    horizons = sorted(horizons)
+
     # Portfolio Returns
-    data['Portfolio'] = data.dot(weight_list)
-    
-    # Calculate VaR
-    conf_level = 0.95
-    var_95 = np.percentile(data['Portfolio'], (1 - conf_level) * 100)
-    cvar_95 = data['Portfolio'][data['Portfolio'] <= var_95].mean()
-    
+    returns = data[weights.index]
+    data['Portfolio'] = returns.to_numpy() @ weights.to_numpy()
+
+    # Calculate VaR (Historical / Parametric / Monte Carlo Cholesky)
+    with stage("var"):
+        table = RiskEngine.var_table(returns, weights.to_numpy(), conf_levels, horizons, n_sims=mc_sims, seed=42)
+    headline = table[(table["Method"] == "Historical") & (table["Horizon (days)"] == horizons[0])].iloc[0]
+    headline_var = headline["VaR"]
+
     c1, c2, c3 = st.columns(3)
-    c1.metric("Daily VaR (95%)", f"{var_95*100:.2f}%")
-    c2.metric("CVaR / Expected Shortfall", f"{cvar_95*100:.2f}%")
+    c1.metric(f"{horizons[0]}D VaR ({headline['Confidence']})", f"{headline['VaR']*100:.2f}%")
+    c2.metric("CVaR / Expected Shortfall", f"{headline['CVaR']*100:.2f}%")
     c3.metric("Sharpe Ratio (Ann.)", f"{(data['Portfolio'].mean()/data['Portfolio'].std()) * np.sqrt(252):.2f}")
-    
+
+    st.subheader("VaR / CVaR Matrix")
+    matrix = table.pivot_table(index=["Confidence", "Horizon (days)"], columns="Method", values=["VaR", "CVaR"])
+    st.dataframe((matrix * 100).style.format("{:.2f}%"), use_container_width=True)
+
+    st.caption(f"{len(data)} aligned sessions | {data.index[0]:%Y-%m-%d} → {data.index[-1]:%Y-%m-%d}")
+
     st.subheader("Distribution of Returns")
-    fig = px.histogram(data, x="Portfolio", nbins=50, title="Portfolio Returns Distribution", color_discrete_sequence=['#00FF41'])
-    fig.add_vline(x=var_95, line_dash="dash", line_color="red", annotation_text="VaR 95%")
-    fig.update_layout(template="plotly_dark")
-    st.plotly_chart(fig, use_container_width=True)
+    with stage("figure"):
+        fig = px.histogram(data, x="Portfolio", nbins=50, title="Portfolio Returns Distribution", color_discrete_sequence=['#00FF41'])
+        fig.add_vline(x=headline_var, line_dash="dash", line_color="red", annotation_text=f"VaR {headline['Confidence']}")
+        fig.update_layout(template="plotly_dark")
+    with stage("render"):
+        st.plotly_chart(fig, use_container_width=True)
+
+    if opt is not None:
+        st.subheader("Efficient Frontier (Mean-Variance, Ledoit-Wolf Covariance)")
+        # Các danh mục so sánh: trọng số nhập tay (nếu hợp lệ) + các danh mục tối ưu
+        compare = dict(opt["portfolios"])
+        if manual is not None:
+            compare = {"Manual": manual, **compare}
+        stats = {name: PortfolioOptimizer.portfolio_stats(w.to_numpy(), opt["mu"].to_numpy(), opt["cov"], risk_free)
+                 for name, w in compare.items()}
+
+        with stage("figure"):
+            frontier_fig = px.line(opt["frontier"], x="Volatility", y="Return", hover_data=["Sharpe"],
+                                   title="Efficient Frontier (annualized)", color_discrete_sequence=['#00FF41'])
+            frontier_fig.add_scatter(x=opt["volatility"], y=opt["mu"], mode="markers+text", text=opt["assets"],
+                                     textposition="top center", name="Assets", marker=dict(color="#888888"))
+            for name, point in stats.items():
+                frontier_fig.add_scatter(x=point["volatility"], y=point["return"], mode="markers", name=name,
+                                         marker=dict(size=12, symbol="star" if name == weight_mode else "diamond"))
+            frontier_fig.update_layout(template="plotly_dark", xaxis_tickformat=".0%", yaxis_tickformat=".0%")
+        with stage("render"):
+            st.plotly_chart(frontier_fig, use_container_width=True)
+
+        with stage("table"):
+            summary = pd.DataFrame({name: {"Return": point["return"][0], "Volatility": point["volatility"][0]}
+                                    for name, point in stats.items()})
+            st.dataframe(pd.concat([summary, pd.DataFrame(compare)]).style.format("{:.2%}"), use_container_width=True)
+            st.caption(" | ".join(f"Sharpe {name}: {point['sharpe'][0]:.2f}" for name, point in stats.items()))
+        if opt["target_error"]:
+            st.warning(f"Target Return: {opt['target_error']}")
+        lo, hi = opt["return_range"]
+        st.caption(f"Risk-free {risk_free:.2%} | Ledoit-Wolf shrinkage {opt['shrinkage']:.2f} | "
+                   f"efficient returns {lo:.1%} → {hi:.1%} | {len(opt['frontier'])}-point frontier solved in "
+                   f"{opt['elapsed_ms']:,.0f} ms ({opt['iterations']} ADMM iterations)")
+
+TerminalUI.render_profile_report(finish_page_profile(profiler))
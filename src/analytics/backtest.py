@@ -0,0 +1,235 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/analytics/backtest.py
+ROLE: Vectorized Signal Backtester (Indicator Rules -> Positions -> Equity / Drawdown / Turnover)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+Quy ước:
+- Vị thế (T, K): K chiến lược / bộ tham số trên cùng 1 chuỗi giá, giá trị trong [-1, 1] (0 = đứng ngoài).
+- Vị thế quyết định tại giá đóng cửa phiên t được nắm giữ trong phiên t+1 (trễ 1 nến, không nhìn trước).
+- Phí giao dịch tính theo turnover: |Δ vị thế| x cost_bps / 10,000 tại phiên vị thế thay đổi.
+Mọi phép tính đều trên mảng (cumsum / cumprod / maximum.accumulate), không có vòng lặp Python theo nến.
+"""
+
+import logging
+from typing import Dict, Any, Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS = 252
+# Số kỳ / năm theo độ phân giải nến (annualize Sharpe, CAGR, vol)
+PERIODS_PER_YEAR = {"1d": TRADING_DAYS, "1wk": 52, "1mo": 12}
+
+
+def _hold_until(entry: np.ndarray, exit_: np.ndarray) -> np.ndarray:
+    """
+    Máy trạng thái vào / ra lệnh không vòng lặp: vị thế tại t = 1 nếu sự kiện gần nhất (<= t) là tín hiệu vào.
+    Tín hiệu vào & ra cùng phiên -> ưu tiên ra. Hỗ trợ (T,) hoặc (T, K) (mỗi cột 1 bộ tham số).
+    """
+    entry = np.asarray(entry, dtype=bool)
+    exit_ = np.asarray(exit_, dtype=bool)
+    steps = np.arange(len(entry)).reshape((-1,) + (1,) * (entry.ndim - 1))
+    last = np.maximum.accumulate(np.where(entry | exit_, steps, -1), axis=0)
+    state = np.take_along_axis(entry & ~exit_, np.maximum(last, 0), axis=0)
+    return (state & (last >= 0)).astype(np.float64)
+
+
+# Luật dựng sẵn trên các cột của TechnicalIndicators.add_all_indicators
+# signal: {tên cột: mảng} -> vị thế (T,); warmup: số nến đầu bỏ qua (chỉ báo chưa đủ cửa sổ, min_periods=1)
+PRESET_RULES: Dict[str, Dict[str, Any]] = {
+    "SMA Cross 50/200": {"signal": lambda c: c["SMA_50"] > c["SMA_200"], "warmup": 200},
+    "SMA Cross 20/50": {"signal": lambda c: c["SMA_20"] > c["SMA_50"], "warmup": 50},
+    "Price > SMA 200": {"signal": lambda c: c["Close"] > c["SMA_200"], "warmup": 200},
+    "MACD > Signal": {"signal": lambda c: c["MACD"] > c["MACD_Signal"], "warmup": 35},
+    "RSI Reversion (30 / 70)": {"signal": lambda c: _hold_until(c["RSI_14"] < 30, c["RSI_14"] > 70), "warmup": 14},
+    "Bollinger Reversion (Lower -> Middle)": {
+        "signal": lambda c: _hold_until(c["Close"] < c["BB_Lower"], c["Close"] > c["BB_Middle"]), "warmup": 20},
+}
+
+
+class SignalBacktester:
+    """
+    Backtest vector hóa cho luật chỉ báo kỹ thuật.
+    - simulate(): lõi chung, nhận ma trận vị thế (T, K) -> equity / drawdown / turnover / chỉ số cho K cột.
+    - run_rule(): 1 luật dựng sẵn trên khung add_all_indicators, so với Buy & Hold.
+    - sweep_sma() / sweep_rsi(): quét lưới tham số, toàn bộ tổ hợp là các cột của 1 lượt broadcast.
+    """
+
+    DEFAULT_COST_BPS = 5.0
+    CHUNK_COLUMNS = 2_000   # số cột mỗi lượt khi quét lưới lớn (giới hạn bộ nhớ trung gian ~ T x 2000 x 8B)
+
+    # ------------------------------------------------------------------
+    # 1. TIỆN ÍCH VỊ THẾ / CHỈ BÁO
+    # ------------------------------------------------------------------
+    hold_until = staticmethod(_hold_until)
+
+    @staticmethod
+    def sma_matrix(close: np.ndarray, windows: Sequence[int]) -> np.ndarray:
+        """
+        SMA của nhiều cửa sổ trong 1 lượt từ 1 cumsum: (T,) x (W,) -> (T, W).
+        Cùng ngữ nghĩa min_periods=1 với TechnicalIndicators (nến đầu chia cho số nến hiện có).
+        """
+        close = np.asarray(close, dtype=np.float64)
+        w = np.asarray(windows, dtype=np.int64)[None, :]
+        csum = np.concatenate([[0.0], np.cumsum(close)])
+        count = np.arange(1, len(close) + 1)[:, None]
+        start = np.maximum(count - w, 0)
+        return (csum[count] - csum[start]) / np.minimum(count, w)
+
+    # ------------------------------------------------------------------
+    # 2. LÕI MÔ PHỎNG
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _simulate_block(returns: np.ndarray, positions: np.ndarray, cost: float,
+                        periods_per_year: int, keep_curves: bool) -> Dict[str, Any]:
+        held = np.empty_like(positions)
+        held[0] = 0.0
+        held[1:] = positions[:-1]                         # vị thế chốt ở phiên t-1 hưởng lợi suất phiên t
+        turnover = np.abs(np.diff(held, axis=0, prepend=0.0))
+        net = held * returns[:, None] - turnover * cost
+        equity = np.cumprod(1.0 + net, axis=0)
+        drawdown = equity / np.maximum.accumulate(equity, axis=0) - 1.0
+
+        years = max((len(returns) - 1) / periods_per_year, 1e-12)
+        body = net[1:]
+        mean = body.mean(axis=0) if len(body) else np.zeros(net.shape[1])
+        std = body.std(axis=0, ddof=1) if len(body) > 1 else np.zeros(net.shape[1])
+        final = equity[-1]
+        stats = {
+            "Total Return": final - 1.0,
+            "CAGR": np.where(final > 0, np.power(np.maximum(final, 1e-300), 1.0 / years) - 1.0, -1.0),
+            "Volatility": std * np.sqrt(periods_per_year),
+            "Sharpe": np.divide(mean, std, out=np.zeros_like(mean), where=std > 0) * np.sqrt(periods_per_year),
+            "Max Drawdown": drawdown.min(axis=0),
+            "Turnover (ann.)": turnover.sum(axis=0) / years,
+            "Trades": np.count_nonzero(turnover, axis=0),
+            "Exposure": np.abs(held).mean(axis=0),
+            "Costs": turnover.sum(axis=0) * cost,
+        }
+        curves = {"equity": equity, "drawdown": drawdown, "net": net, "held": held} if keep_curves else None
+        return {"stats": stats, "curves": curves}
+
+    @staticmethod
+    def simulate(close: np.ndarray, positions: np.ndarray, cost_bps: float = DEFAULT_COST_BPS,
+                 periods_per_year: int = TRADING_DAYS, keep_curves: bool = False) -> Dict[str, Any]:
+        """
+        close (T,), positions (T,) hoặc (T, K) -> {"metrics": DataFrame K hàng, "curves": mảng (T, K) | None}.
+        NaN trong vị thế coi như đứng ngoài. keep_curves=False khi quét lưới: chỉ giữ chỉ số, xử lý theo khối cột.
+        """
+        close = np.asarray(close, dtype=np.float64)
+        P = np.nan_to_num(np.asarray(positions, dtype=np.float64))
+        if P.ndim == 1:
+            P = P[:, None]
+        if len(P) != len(close):
+            raise ValueError(f"Shape mismatch: close {close.shape} vs positions {P.shape}")
+        returns = np.zeros(len(close))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns[1:] = np.nan_to_num(close[1:] / close[:-1] - 1.0, nan=0.0, posinf=0.0, neginf=0.0)
+        cost = cost_bps / 1e4
+
+        step = P.shape[1] if keep_curves else SignalBacktester.CHUNK_COLUMNS
+        blocks = [SignalBacktester._simulate_block(returns, P[:, i:i + step], cost, periods_per_year, keep_curves)
+                  for i in range(0, P.shape[1], step)]
+        metrics = pd.DataFrame({name: np.concatenate([b["stats"][name] for b in blocks]) for name in blocks[0]["stats"]})
+        return {"metrics": metrics, "curves": blocks[0]["curves"] if keep_curves else None}
+
+    # ------------------------------------------------------------------
+    # 3. LUẬT DỰNG SẴN TRÊN KHUNG CHỈ BÁO
+    # ------------------------------------------------------------------
+    @staticmethod
+    def rule_positions(df: pd.DataFrame, rule: str) -> np.ndarray:
+        """Vị thế long / flat (T,) của 1 luật trong PRESET_RULES trên khung đã có cột chỉ báo"""
+        spec = PRESET_RULES[rule]
+        columns = {c: df[c].to_numpy(dtype=np.float64) for c in df.columns if c != 'timestamp'}
+        positions = np.asarray(spec["signal"](columns), dtype=np.float64)
+        positions[:spec["warmup"]] = 0.0
+        return positions
+
+    @staticmethod
+    def run_rule(df: pd.DataFrame, rule: str, cost_bps: float = DEFAULT_COST_BPS,
+                 periods_per_year: int = TRADING_DAYS) -> Dict[str, Any]:
+        """
+        Backtest 1 luật so với Buy & Hold (2 cột trong cùng 1 lượt mô phỏng).
+        df: kết quả TechnicalIndicators.add_all_indicators (thiếu cột chỉ báo -> tự tính).
+        """
+        if any(col not in df.columns for col in ("SMA_200", "RSI_14", "BB_Lower", "MACD_Signal")):
+            from src.analytics.technical import TechnicalIndicators
+            df = TechnicalIndicators.add_all_indicators(df)
+        positions = SignalBacktester.rule_positions(df, rule)
+        warmup = PRESET_RULES[rule]["warmup"]
+        benchmark = np.ones(len(df))
+        benchmark[:warmup] = 0.0   # Buy & Hold vào lệnh cùng thời điểm chiến lược bắt đầu -> so sánh công bằng
+        result = SignalBacktester.simulate(df['Close'].to_numpy(), np.column_stack([positions, benchmark]),
+                                           cost_bps, periods_per_year, keep_curves=True)
+
+        index = pd.DatetimeIndex(df['timestamp']) if 'timestamp' in df.columns else df.index
+        curves = result["curves"]
+        result["metrics"].index = [rule, "Buy & Hold"]
+        result["curves"] = pd.DataFrame({
+            "Position": curves["held"][:, 0],
+            "Strategy": curves["equity"][:, 0],
+            "Buy & Hold": curves["equity"][:, 1],
+            "Drawdown": curves["drawdown"][:, 0],
+            "Buy & Hold Drawdown": curves["drawdown"][:, 1],
+        }, index=index)
+        return result
+
+    # ------------------------------------------------------------------
+    # 4. QUÉT LƯỚI THAM SỐ
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _sweep(close: np.ndarray, positions: np.ndarray, params: Dict[str, np.ndarray],
+               cost_bps: float, periods_per_year: int) -> pd.DataFrame:
+        result = SignalBacktester.simulate(close, positions, cost_bps, periods_per_year)
+        table = pd.concat([pd.DataFrame(params), result["metrics"]], axis=1)
+        return table.sort_values("Sharpe", ascending=False, ignore_index=True)
+
+    @staticmethod
+    def sweep_sma(close: np.ndarray, fast_windows: Sequence[int], slow_windows: Sequence[int],
+                  cost_bps: float = DEFAULT_COST_BPS, periods_per_year: int = TRADING_DAYS) -> pd.DataFrame:
+        """
+        Mọi cặp SMA nhanh < chậm: long khi SMA_fast > SMA_slow. SMA của mọi cửa sổ tính 1 lần (sma_matrix),
+        vị thế của K cặp là 1 phép so sánh broadcast (T, K). Trả về bảng chỉ số xếp theo Sharpe.
+        Không có cặp fast < slow nào -> ValueError (UI phải kiểm tra trước khi gọi).
+        """
+        fast = np.asarray(fast_windows, dtype=np.int64)
+        slow = np.asarray(slow_windows, dtype=np.int64)
+        F, S = np.meshgrid(fast, slow, indexing="ij")
+        valid = F < S
+        F, S = F[valid], S[valid]
+        if F.size == 0:
+            raise ValueError("No (fast, slow) pair with fast < slow")
+
+        windows, inverse = np.unique(np.concatenate([F, S]), return_inverse=True)
+        sma = SignalBacktester.sma_matrix(close, windows)
+        fi, si = inverse[:F.size], inverse[F.size:]
+        positions = (sma[:, fi] > sma[:, si]).astype(np.float64)
+        positions[np.arange(len(sma))[:, None] < (S - 1)[None, :]] = 0.0   # chưa đủ cửa sổ SMA chậm
+        return SignalBacktester._sweep(close, positions, {"Fast": F, "Slow": S}, cost_bps, periods_per_year)
+
+    @staticmethod
+    def sweep_rsi(close: np.ndarray, rsi: np.ndarray, lower: Sequence[float], upper: Sequence[float],
+                  cost_bps: float = DEFAULT_COST_BPS, periods_per_year: int = TRADING_DAYS,
+                  warmup: int = 14) -> pd.DataFrame:
+        """
+        Mọi cặp ngưỡng RSI (vào < lower, ra > upper) trên cùng 1 chuỗi RSI, máy trạng thái theo cột.
+        Không có cặp lower < upper nào -> ValueError (UI phải kiểm tra trước khi gọi).
+        """
+        L, U = np.meshgrid(np.asarray(lower, dtype=np.float64), np.asarray(upper, dtype=np.float64), indexing="ij")
+        valid = L < U
+        L, U = L[valid], U[valid]
+        if L.size == 0:
+            raise ValueError("No (lower, upper) pair with lower < upper")
+        rsi = np.asarray(rsi, dtype=np.float64)[:, None]
+        positions = _hold_until(rsi < L[None, :], rsi > U[None, :])
+        positions[:warmup] = 0.0
+        return SignalBacktester._sweep(close, positions, {"RSI Entry": L, "RSI Exit": U}, cost_bps, periods_per_year)
+
+    @staticmethod
+    def sweep_grid(table: pd.DataFrame, row: str, column: str, value: str = "Sharpe") -> pd.DataFrame:
+        """Bảng kết quả quét -> ma trận (row x column) cho heatmap"""
+        return table.pivot_table(index=row, columns=column, values=value)
@@ -0,0 +1,133 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/analytics/kernels.py
+ROLE: Low-allocation Numeric Kernels & Compact OHLCV Representation
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+"""
+
+import logging
+from importlib.util import find_spec
+from typing import Optional, Dict, Any
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# scipy.signal nặng (~1s import) -> chỉ kiểm tra có cài hay không, nạp ở lần gọi ema() đầu tiên
+SCIPY_AVAILABLE = find_spec("scipy") is not None
+
+# Kiểu dữ liệu của chế độ compact: giá float32 (~7 chữ số có nghĩa), khối lượng số nguyên
+COMPACT_PRICE_DTYPE = np.float32
+COMPACT_VOLUME_DTYPE = np.int64
+PRICE_COLUMNS = ('Open', 'High', 'Low', 'Close')
+
+
+# =============================================================================
+# 1. KERNELS (ghi vào mảng `out` nếu được cấp sẵn)
+# rolling_mean tính thẳng trong `out`; các kernel dựa trên pandas / scipy nhận mảng kết quả mới
+# từ thư viện rồi chép vào `out` (1 mảng tạm O(n)).
+# =============================================================================
+def _emit(values: np.ndarray, out: Optional[np.ndarray]) -> np.ndarray:
+    if out is None:
+        return values
+    out[...] = values
+    return out
+
+
+def rolling_mean(x: np.ndarray, window: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Trung bình trượt với min_periods=1 (giống pandas rolling(window, min_periods=1).mean()).
+    Tính thẳng trong `out`: tổng trượt = cumsum của hiệu x_t - x_{t-window}, chia cho số phần tử
+    (chỉ cấp phát thêm mảng đếm dài `window`). Chuỗi có NaN/inf được chuyển cho pandas.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if not np.isfinite(x.sum()):
+        return _emit(pd.Series(x, copy=False).rolling(window=window, min_periods=1).mean().to_numpy(), out)
+    n = len(x)
+    if out is None:
+        out = np.empty(n, dtype=np.float64)
+    head = min(window, n)
+    out[:head] = x[:head]
+    np.subtract(x[head:], x[:n - head], out=out[head:])
+    np.cumsum(out, out=out)
+    out[:head] /= np.arange(1, head + 1)
+    out[head:] /= window
+    return out
+
+
+def rolling_std(x: np.ndarray, window: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Độ lệch chuẩn mẫu (ddof=1) trượt với min_periods=1; phần tử đầu là NaN (pandas, chép vào out)"""
+    values = pd.Series(x, copy=False).rolling(window=window, min_periods=1).std().to_numpy()
+    return _emit(values, out)
+
+
+def ema(x: np.ndarray, span: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    EMA kiểu pandas ewm(span, adjust=False): y0 = x0, y_t = (1-α)·y_{t-1} + α·x_t.
+    Dùng bộ lọc IIR bậc 1 (scipy.signal.lfilter) - 1 lượt C. lfilter luôn trả mảng mới,
+    nên khi có `out` kết quả được chép vào đó.
+    Chuỗi có NaN được chuyển cho pandas để giữ đúng ngữ nghĩa bỏ qua NaN.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if len(x) == 0:
+        return _emit(x.copy(), out)
+    if not SCIPY_AVAILABLE or np.isnan(x).any():
+        return _emit(pd.Series(x, copy=False).ewm(span=span, adjust=False).mean().to_numpy(), out)
+    from scipy.signal import lfilter
+    alpha = 2.0 / (span + 1.0)
+    values, _ = lfilter([alpha], [1.0, alpha - 1.0], x, zi=[(1.0 - alpha) * x[0]])
+    return _emit(values, out)
+
+
+def rsi_sma(x: np.ndarray, window: int = 14, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """RSI theo trung bình đơn giản của Gain/Loss (cùng công thức với TechnicalIndicators)"""
+    delta = np.diff(x, prepend=np.nan)
+    gain = rolling_mean(np.where(delta > 0, delta, 0.0), window)
+    loss = rolling_mean(np.where(delta < 0, -delta, 0.0), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.where(loss == 0, 100.0, 100.0 - 100.0 / (1.0 + gain / loss))
+    return _emit(values, out)
+
+
+# =============================================================================
+# 2. COMPACT OHLCV
+# =============================================================================
+def compact_ohlcv(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Biểu diễn OHLCV tiết kiệm bộ nhớ: giá float32, Volume int64, timestamp datetime64.
+    Các cột khác (Dividends, Stock Splits...) bị loại bỏ. Cột đã đúng kiểu thì không bị sao chép.
+    """
+    if df is None or df.empty:
+        return df
+    columns: Dict[str, Any] = {}
+    if 'timestamp' in df.columns:
+        ts = df['timestamp']
+        columns['timestamp'] = ts if pd.api.types.is_datetime64_any_dtype(ts) else pd.to_datetime(ts)
+    for col in PRICE_COLUMNS:
+        if col in df.columns:
+            columns[col] = df[col].astype(COMPACT_PRICE_DTYPE, copy=False)
+    if 'Volume' in df.columns:
+        vol = df['Volume']
+        if not pd.api.types.is_integer_dtype(vol):
+            vol = vol.fillna(0).round()
+        columns['Volume'] = vol.astype(COMPACT_VOLUME_DTYPE, copy=False)
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+
+def frame_nbytes(df: Optional[pd.DataFrame]) -> int:
+    """Dung lượng thực (deep) của 1 DataFrame, tính cả index"""
+    if df is None:
+        return 0
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def memory_report(frames: Dict[str, Optional[pd.DataFrame]]) -> Dict[str, Any]:
+    """
+    Báo cáo bộ nhớ các khung dữ liệu mà 1 session đang giữ (MB theo từng khung + tổng).
+    Khung dùng chung vùng nhớ (VD: chỉ báo tham chiếu cột gốc) có thể bị đếm 2 lần -> cận trên.
+    """
+    sizes = {name: frame_nbytes(df) / 1024 ** 2 for name, df in frames.items()}
+    return {"frames_mb": sizes, "total_mb": float(sum(sizes.values()))}
@@ -0,0 +1,376 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/analytics/optimizer.py
+ROLE: Mean-Variance Portfolio Optimizer (Min Variance / Max Sharpe / Target Return / Efficient Frontier)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+Bài toán (mọi danh mục trên đường biên dùng chung 1 ma trận):
+    min ½·wᵀΣw   s.t.  1ᵀw = 1,  μᵀw = r_k,  lower ≤ w ≤ upper
+- Σ: hiệp phương sai co rút Ledoit-Wolf (ổn định khi số tài sản ~ số phiên, mẫu gần suy biến).
+- Giải bằng ADMM theo lô: bước x là 1 hệ KKT đẳng thức với ma trận (Σ + ρI) chung cho K mục tiêu
+  -> phân rã 1 lần, mỗi vòng lặp chỉ là phép nhân ma trận (K, N) x (N, N);
+  bước z là phép chiếu lên hộp ràng buộc = np.clip. Cả đường biên K điểm đi chung 1 lượt giải.
+"""
+
+import time
+import logging
+from importlib.util import find_spec
+from typing import Dict, Any, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# scipy.linalg chỉ cần khi giải (phân rã Cholesky) -> nạp muộn, thiếu scipy thì dùng numpy
+SCIPY_AVAILABLE = find_spec("scipy") is not None
+
+ReturnsLike = Union[pd.DataFrame, np.ndarray]
+BoundLike = Union[float, np.ndarray]
+
+TRADING_DAYS = 252
+
+
+class PortfolioOptimizer:
+    """
+    Tối ưu trung bình - phương sai với ràng buộc long-only / hộp (box) trên từng tài sản.
+    - Đầu vào năm hóa: mu (N,), cov (N, N). Hàm optimize() nhận thẳng ma trận lợi suất ngày.
+    - Trọng số trả về dạng ma trận (K, N) cho nhiều mục tiêu cùng lúc (khớp quy ước của RiskEngine).
+    """
+
+    DEFAULT_POINTS = 40
+    TOLERANCE = 1e-8
+    MAX_ITER = 5_000
+    RELAXATION = 1.6        # over-relaxation của ADMM (1.5 - 1.8 là vùng hội tụ nhanh điển hình)
+    RHO_CHECK_EVERY = 25    # chu kỳ cân bằng lại ρ giữa phần dư primal / dual
+    MAX_REFACTOR = 8
+    POLISH_FROM = 1e-4      # thử polish khi phần dư ADMM của hàng đã dưới ngưỡng này (tập biên đã ổn định)
+    POLISH_EVERY = 50
+    POLISH_STEPS = 25
+
+    # ------------------------------------------------------------------
+    # 1. ƯỚC LƯỢNG ĐẦU VÀO
+    # ------------------------------------------------------------------
+    @staticmethod
+    def ledoit_wolf(returns: ReturnsLike, periods_per_year: int = TRADING_DAYS) -> Tuple[np.ndarray, np.ndarray, float]:
+        """
+        Kỳ vọng (N,), hiệp phương sai co rút (N, N) - cả hai đã năm hóa - và cường độ co rút δ.
+        Σ̂ = δ·m·I + (1 − δ)·S  (Ledoit & Wolf 2004, đích là ma trận đơn vị co giãn).
+        Tổng Σ_t ‖x_t x_tᵀ − S‖²_F rút gọn thành Σ_t ‖x_t‖⁴ − T·‖S‖²_F -> không dựng tensor (T, N, N).
+        """
+        R = np.asarray(returns, dtype=np.float64)
+        if R.ndim != 2 or len(R) < 2:
+            raise ValueError(f"Need a (T, N) returns matrix with T >= 2, got {R.shape}")
+        T, N = R.shape
+        mu = R.mean(axis=0)
+        X = R - mu
+        S = X.T @ X / T
+        m = np.trace(S) / N
+        d2 = (np.sum(S * S) - 2.0 * m * np.trace(S) + m * m * N) / N   # ‖S − mI‖²_F / N
+        row_sq = np.einsum("ij,ij->i", X, X)
+        b2_bar = (np.sum(row_sq ** 2) - T * np.sum(S * S)) / (T * T * N)
+        b2 = min(max(b2_bar, 0.0), d2)
+        delta = float(b2 / d2) if d2 > 0 else 1.0
+        cov = (1.0 - delta) * S
+        cov[np.diag_indices(N)] += delta * m
+        return mu * periods_per_year, cov * periods_per_year, delta
+
+    # ------------------------------------------------------------------
+    # 2. RÀNG BUỘC
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _bounds(n: int, lower: BoundLike, upper: BoundLike) -> Tuple[np.ndarray, np.ndarray]:
+        lb = np.broadcast_to(np.asarray(lower, dtype=np.float64), (n,)).copy()
+        ub = np.broadcast_to(np.asarray(upper, dtype=np.float64), (n,)).copy()
+        if np.any(lb > ub):
+            raise ValueError("Lower bound exceeds upper bound")
+        if lb.sum() > 1.0 + 1e-12 or ub.sum() < 1.0 - 1e-12:
+            raise ValueError(f"Infeasible bounds: sum(lower)={lb.sum():.3f}, sum(upper)={ub.sum():.3f} must bracket 1")
+        return lb, ub
+
+    @staticmethod
+    def extreme_portfolios(mu: np.ndarray, lb: np.ndarray, ub: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Danh mục lợi suất nhỏ / lớn nhất dưới ràng buộc (LP trên hộp + ngân sách, nghiệm đóng):
+        bắt đầu từ lb, rót phần ngân sách còn lại vào tài sản lợi suất cao (thấp) nhất trước.
+        """
+        budget = 1.0 - lb.sum()
+        extremes = []
+        for order in (np.argsort(mu), np.argsort(mu)[::-1]):
+            cap = (ub - lb)[order]
+            w = lb.copy()
+            w[order] += np.clip(budget - (np.cumsum(cap) - cap), 0.0, cap)
+            extremes.append(w)
+        return extremes[0], extremes[1]
+
+    @staticmethod
+    def return_range(mu: np.ndarray, lb: np.ndarray, ub: np.ndarray) -> Tuple[float, float]:
+        """Khoảng lợi suất đạt được dưới ràng buộc"""
+        w_lo, w_hi = PortfolioOptimizer.extreme_portfolios(mu, lb, ub)
+        return float(mu @ w_lo), float(mu @ w_hi)
+
+    # ------------------------------------------------------------------
+    # 3. BỘ GIẢI QP THEO LÔ (ADMM)
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _factor(cov: np.ndarray, A: np.ndarray, rho: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Ma trận dùng lại mọi vòng lặp cho 1 giá trị ρ:
+        M⁻¹ = (Σ + ρI)⁻¹, G = M⁻¹Aᵀ và (A·G)⁻¹ (cỡ m x m với m = số ràng buộc đẳng thức).
+        """
+        M = cov + rho * np.eye(len(cov))
+        if SCIPY_AVAILABLE:
+            from scipy.linalg import cho_factor, cho_solve
+            M_inv = cho_solve(cho_factor(M), np.eye(len(cov)))
+        else:
+            M_inv = np.linalg.inv(M)
+        G = M_inv @ A.T
+        return M_inv, G, np.linalg.inv(A @ G)
+
+    @staticmethod
+    def _polish(cov: np.ndarray, A: np.ndarray, b: np.ndarray, lb: np.ndarray, ub: np.ndarray,
+                w: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Làm sạch nghiệm xấp xỉ của ADMM (kiểu "solution polishing" của OSQP): đoán tập ràng buộc chặt từ w,
+        giải đúng hệ KKT rút gọn trên các biến tự do rồi sửa tập chặt theo dấu nhân tử (primal-dual active set).
+        Trả về nghiệm chính xác, hoặc None nếu không xác nhận được KKT -> giữ nghiệm ADMM.
+        """
+        span = ub - lb
+        eps = 1e-7 * np.maximum(span, 1e-12)
+        at_lo = w <= lb + eps
+        at_hi = ~at_lo & (w >= ub - eps)
+        for _ in range(PortfolioOptimizer.POLISH_STEPS):
+            free = ~(at_lo | at_hi)
+            x = np.where(at_lo, lb, ub)
+            F = np.flatnonzero(free)
+            A_F = A[:, F]
+            rhs_eq = b - A[:, ~free] @ x[~free]
+            n, m = len(F), len(b)
+            KKT = np.zeros((n + m, n + m))
+            KKT[:n, :n] = cov[np.ix_(F, F)]
+            KKT[:n, n:] = A_F.T
+            KKT[n:, :n] = A_F
+            rhs = np.concatenate([-cov[np.ix_(F, np.flatnonzero(~free))] @ x[~free], rhs_eq])
+            try:
+                sol = np.linalg.solve(KKT, rhs)
+            except np.linalg.LinAlgError:   # ít biến tự do hơn số ràng buộc đẳng thức (đỉnh suy biến)
+                sol = np.linalg.lstsq(KKT, rhs, rcond=None)[0]
+            x[F] = sol[:n]
+            grad = cov @ x + A.T @ sol[n:]    # = λ_lo − λ_hi; cần ≥ 0 tại biên dưới, ≤ 0 tại biên trên
+
+            tol_w, tol_g = 1e-10, 1e-10 * max(float(np.max(np.abs(grad))), 1e-12)
+            below, above = free & (x < lb - tol_w), free & (x > ub + tol_w)
+            release = (at_lo & (grad < -tol_g)) | (at_hi & (grad > tol_g))
+            if not (below.any() or above.any() or release.any()):
+                if np.max(np.abs(A @ x - b)) > 1e-9:
+                    return None
+                return np.clip(x, lb, ub)
+            at_lo = (at_lo & ~release) | below
+            at_hi = (at_hi & ~release) | above
+        return None
+
+    @staticmethod
+    def solve_qp(cov: np.ndarray, A: np.ndarray, B: np.ndarray, lb: np.ndarray, ub: np.ndarray,
+                 tol: float = TOLERANCE, max_iter: int = MAX_ITER,
+                 rho: Optional[float] = None) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        Giải K bài toán min ½wᵀΣw s.t. A·w = B[k], lb ≤ w ≤ ub trong cùng 1 vòng lặp ADMM.
+        A: (m, N) chung, B: (K, m) vế phải riêng từng bài. Trả về W (K, N) nằm trong hộp và thông tin hội tụ.
+        Bước x có nghiệm đóng qua hệ KKT: x = M⁻¹q − G·ν, ν = (A·G)⁻¹(A·M⁻¹q − b).
+        Mục tiêu gần đỉnh của tập khả thi (đa số trọng số chạm biên) làm ADMM hội tụ chậm -> khi phần dư
+        đã nhỏ, mỗi hàng được "polish" về nghiệm đúng; hàng xong (hội tụ / polish) rời khỏi lô.
+        """
+        B = np.atleast_2d(np.asarray(B, dtype=np.float64))
+        K, N = len(B), len(cov)
+        rho = rho or max(float(np.trace(cov)) / N, 1e-12)
+        M_inv, G, S_inv = PortfolioOptimizer._factor(cov, A, rho)
+        alpha = PortfolioOptimizer.RELAXATION
+
+        W_out = np.empty((K, N))
+        pending = np.arange(K)
+        Z = np.clip(np.full((K, N), 1.0 / N), lb, ub)
+        U = np.zeros((K, N))
+        refactors = polished = 0
+        primal = dual = np.inf
+        it = 0
+        while pending.size and it < max_iter:
+            it += 1
+            Y = (rho * (Z - U)) @ M_inv                  # M_inv đối xứng -> áp dụng theo hàng
+            nu = (Y @ A.T - B) @ S_inv.T
+            X = Y - nu @ G.T
+            X_hat = alpha * X + (1.0 - alpha) * Z
+            Z_prev = Z
+            Z = np.clip(X_hat + U, lb, ub)
+            U += X_hat - Z
+
+            if it % PortfolioOptimizer.RHO_CHECK_EVERY:
+                continue
+            row_primal = np.max(np.abs(X - Z), axis=1)
+            row_dual = np.max(np.abs(Z - Z_prev), axis=1)
+            done = (row_primal <= tol) & (row_dual <= tol)
+            if it % PortfolioOptimizer.POLISH_EVERY == 0:
+                for i in np.flatnonzero(~done & (np.maximum(row_primal, row_dual) <= PortfolioOptimizer.POLISH_FROM)):
+                    w = PortfolioOptimizer._polish(cov, A, B[i], lb, ub, Z[i])
+                    if w is not None:
+                        Z[i], done[i] = w, True
+                        polished += 1
+            primal, dual = float(np.max(row_primal)), float(np.max(row_dual))
+            if done.any():
+                W_out[pending[done]] = Z[done]
+                keep = ~done
+                pending, Z, U, B = pending[keep], Z[keep], U[keep], B[keep]
+                X, row_primal, row_dual = X[keep], row_primal[keep], row_dual[keep]
+                if not pending.size:
+                    break
+                primal, dual = float(np.max(row_primal)), float(np.max(row_dual))
+            # Cân bằng ρ kiểu OSQP: so phần dư primal / dual đã chuẩn hóa theo độ lớn của chính chúng
+            # (U là dual đã chia ρ -> đổi ρ thì phải co giãn U ngược lại)
+            if refactors < PortfolioOptimizer.MAX_REFACTOR:
+                dual_scale = max(float(np.max(np.abs(X @ cov))), rho * float(np.max(np.abs(U))), 1e-12)
+                ratio = np.sqrt((primal / max(float(np.max(np.abs(Z))), 1e-12)) /
+                                max(rho * dual / dual_scale, 1e-16))
+                if ratio > 5.0 or ratio < 0.2:
+                    rho *= ratio
+                    U /= ratio
+                    M_inv, G, S_inv = PortfolioOptimizer._factor(cov, A, rho)
+                    refactors += 1
+
+        if pending.size:
+            W_out[pending] = Z
+            logger.warning(f"OPTIMIZER: ADMM stopped at {max_iter} iterations with {pending.size}/{K} problems "
+                           f"unconverged (primal {primal:.1e}, dual {dual:.1e})")
+        return W_out, {"iterations": it, "primal_residual": primal if pending.size else 0.0,
+                       "dual_residual": dual if pending.size else 0.0, "rho": rho,
+                       "refactors": refactors, "polished": polished, "problems": K}
+
+    # ------------------------------------------------------------------
+    # 4. DANH MỤC TỐI ƯU
+    # ------------------------------------------------------------------
+    @staticmethod
+    def min_variance(cov: np.ndarray, lower: BoundLike = 0.0, upper: BoundLike = 1.0) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """Danh mục phương sai nhỏ nhất (chỉ ràng buộc ngân sách + hộp)"""
+        N = len(cov)
+        lb, ub = PortfolioOptimizer._bounds(N, lower, upper)
+        W, info = PortfolioOptimizer.solve_qp(cov, np.ones((1, N)), np.ones((1, 1)), lb, ub)
+        return W[0], info
+
+    @staticmethod
+    def target_return(mu: np.ndarray, cov: np.ndarray, targets, lower: BoundLike = 0.0,
+                      upper: BoundLike = 1.0) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        Phương sai nhỏ nhất tại từng lợi suất mục tiêu (năm hóa). targets vô hướng -> W (N,), vector -> W (K, N).
+        Mục tiêu nằm ngoài khoảng đạt được dưới ràng buộc -> ValueError.
+        """
+        N = len(cov)
+        lb, ub = PortfolioOptimizer._bounds(N, lower, upper)
+        r = np.asarray(targets, dtype=np.float64)
+        w_lo, w_hi = PortfolioOptimizer.extreme_portfolios(mu, lb, ub)
+        r_lo, r_hi = float(mu @ w_lo), float(mu @ w_hi)
+        span = 1e-9 * max(abs(r_lo), abs(r_hi), 1.0)
+        flat = r.ravel()
+        if np.any(flat < r_lo - span) or np.any(flat > r_hi + span):
+            raise ValueError(f"Target return outside attainable range [{r_lo:.2%}, {r_hi:.2%}]")
+
+        # Mục tiêu ở biên khoảng là đỉnh của LP (tập khả thi chỉ còn 1 điểm, ADMM hội tụ rất chậm)
+        # -> dùng thẳng nghiệm đóng, chỉ đưa các mục tiêu bên trong vào lô ADMM
+        at_lo, at_hi = flat <= r_lo + span, flat >= r_hi - span
+        inner = ~(at_lo | at_hi)
+        W = np.empty((flat.size, N))
+        W[at_lo], W[at_hi] = w_lo, w_hi
+        info: Dict[str, Any] = {"iterations": 0, "problems": 0}
+        if inner.any():
+            B = np.column_stack([np.ones(inner.sum()), flat[inner]])
+            W[inner], info = PortfolioOptimizer.solve_qp(cov, np.vstack([np.ones(N), mu]), B, lb, ub)
+        return (W[0] if r.ndim == 0 else W), info
+
+    @staticmethod
+    def efficient_frontier(mu: np.ndarray, cov: np.ndarray, n_points: int = DEFAULT_POINTS,
+                           lower: BoundLike = 0.0, upper: BoundLike = 1.0,
+                           risk_free: float = 0.0) -> Dict[str, Any]:
+        """
+        Nhánh hiệu quả từ danh mục phương sai nhỏ nhất tới lợi suất lớn nhất đạt được, K = n_points điểm
+        giải chung 1 lô. Max Sharpe: Sharpe là hàm tựa lõm theo r trên đường biên -> lấy điểm tốt nhất
+        rồi giải thêm 1 lô mịn giữa 2 điểm lân cận (độ phân giải ~ khoảng lợi suất / n_points²).
+        """
+        N = len(cov)
+        lb, ub = PortfolioOptimizer._bounds(N, lower, upper)
+        w_min, info_min = PortfolioOptimizer.min_variance(cov, lb, ub)
+        r_min = float(mu @ w_min)
+        _, r_max = PortfolioOptimizer.return_range(mu, lb, ub)
+        r_min = min(r_min, r_max)
+
+        targets = np.linspace(r_min, r_max, n_points)
+        W, info = PortfolioOptimizer.target_return(mu, cov, targets, lb, ub)
+        W[0] = w_min   # điểm đầu chính là danh mục phương sai nhỏ nhất (tránh sai số mục tiêu khi đường biên suy biến)
+        stats = PortfolioOptimizer.portfolio_stats(W, mu, cov, risk_free)
+
+        best = int(np.argmax(stats["sharpe"]))
+        fine = np.linspace(targets[max(best - 1, 0)], targets[min(best + 1, n_points - 1)], n_points)
+        W_fine, info_fine = PortfolioOptimizer.target_return(mu, cov, fine, lb, ub)
+        fine_stats = PortfolioOptimizer.portfolio_stats(W_fine, mu, cov, risk_free)
+        best_fine = int(np.argmax(fine_stats["sharpe"]))
+        w_sharpe = W_fine[best_fine] if fine_stats["sharpe"][best_fine] >= stats["sharpe"][best] else W[best]
+
+        return {
+            "returns": stats["return"],
+            "volatility": stats["volatility"],
+            "sharpe": stats["sharpe"],
+            "weights": W,
+            "min_variance": w_min,
+            "max_sharpe": w_sharpe,
+            "return_range": (r_min, r_max),
+            "iterations": info_min["iterations"] + info["iterations"] + info_fine["iterations"],
+        }
+
+    @staticmethod
+    def portfolio_stats(weights, mu: np.ndarray, cov: np.ndarray, risk_free: float = 0.0) -> Dict[str, np.ndarray]:
+        """Lợi suất / biến động / Sharpe năm hóa của 1 hoặc K danh mục: diag(WΣWᵀ) = Σ_n (WΣ)_kn · W_kn"""
+        W = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+        ret = W @ mu
+        vol = np.sqrt(np.maximum(((W @ cov) * W).sum(axis=1), 0.0))
+        sharpe = np.divide(ret - risk_free, vol, out=np.zeros_like(ret), where=vol > 0)
+        return {"return": ret, "volatility": vol, "sharpe": sharpe}
+
+    # ------------------------------------------------------------------
+    # 5. BÁO CÁO ĐẦY ĐỦ TỪ MA TRẬN LỢI SUẤT
+    # ------------------------------------------------------------------
+    @staticmethod
+    def optimize(returns: pd.DataFrame, lower: BoundLike = 0.0, upper: BoundLike = 1.0, risk_free: float = 0.0,
+                 target: Optional[float] = None, n_points: int = DEFAULT_POINTS,
+                 periods_per_year: int = TRADING_DAYS) -> Dict[str, Any]:
+        """
+        Lợi suất ngày đã căn chỉnh (hàng = phiên, cột = tài sản) -> đường biên + các danh mục tối ưu.
+        Trọng số trả về dạng pd.Series theo tên cột; target ngoài khoảng đạt được -> "target" = None kèm "target_error".
+        """
+        t0 = time.perf_counter()
+        mu, cov, shrinkage = PortfolioOptimizer.ledoit_wolf(returns, periods_per_year)
+        frontier = PortfolioOptimizer.efficient_frontier(mu, cov, n_points, lower, upper, risk_free)
+        assets = list(returns.columns)
+
+        portfolios = {"Min Variance": frontier["min_variance"], "Max Sharpe": frontier["max_sharpe"]}
+        target_error = None
+        if target is not None:
+            try:
+                portfolios["Target Return"], _ = PortfolioOptimizer.target_return(mu, cov, target, lower, upper)
+            except ValueError as e:
+                target_error = str(e)
+
+        elapsed = time.perf_counter() - t0
+        logger.info(f"OPTIMIZER: {len(assets)} assets, {n_points}-point frontier in {elapsed * 1e3:,.0f} ms "
+                    f"(shrinkage {shrinkage:.2f})")
+        return {
+            "assets": assets,
+            "mu": pd.Series(mu, index=assets),
+            "volatility": pd.Series(np.sqrt(np.diag(cov)), index=assets),
+            "cov": cov,
+            "shrinkage": shrinkage,
+            "frontier": pd.DataFrame({"Return": frontier["returns"], "Volatility": frontier["volatility"],
+                                      "Sharpe": frontier["sharpe"]}),
+            "frontier_weights": frontier["weights"],
+            "portfolios": {name: pd.Series(w, index=assets) for name, w in portfolios.items()},
+            "target_error": target_error,
+            "return_range": frontier["return_range"],
+            "iterations": frontier["iterations"],
+            "elapsed_ms": elapsed * 1e3,
+        }
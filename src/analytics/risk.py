@@ -1 +1,217 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/analytics/risk.py
+ROLE: Portfolio Risk Engine (VaR / CVaR: Historical, Parametric, Monte Carlo)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+"""
 
+import numpy as np
+import pandas as pd
+import logging
+from statistics import NormalDist
+from typing import Dict, Any, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+ReturnsLike = Union[pd.DataFrame, np.ndarray]
+
+
+class RiskEngine:
+    """
+    Động cơ đo lường rủi ro danh mục trên ma trận lợi suất đã căn chỉnh (hàng = phiên, cột = tài sản).
+    - Quy ước dấu: VaR/CVaR là phân vị của LỢI SUẤT (số âm = thua lỗ), khớp với trang Portfolio Risk.
+    - weights có thể là 1 vector (N,) hoặc ma trận (K, N) để đánh giá K danh mục cùng lúc
+      bằng một phép nhân ma trận; khi đó kết quả có thêm trục K ở cuối.
+    - Mọi kết quả có shape (số mức tin cậy, số kỳ hạn[, K]).
+    """
+
+    DEFAULT_CONFIDENCE = (0.95, 0.99)
+    DEFAULT_HORIZONS = (1, 10)
+
+    # ------------------------------------------------------------------
+    # TIỆN ÍCH NỘI BỘ
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _prepare(returns: ReturnsLike, weights) -> Tuple[np.ndarray, np.ndarray, bool]:
+        """Chuyển về ndarray float64: R (T, N) và W (K, N). single=True nếu chỉ có 1 danh mục."""
+        R = np.asarray(returns, dtype=np.float64)
+        W = np.asarray(weights, dtype=np.float64)
+        single = W.ndim == 1
+        W = np.atleast_2d(W)
+        if R.ndim != 2 or W.shape[1] != R.shape[1]:
+            raise ValueError(f"Shape mismatch: returns {R.shape} vs weights {W.shape}")
+        return R, W, single
+
+    @staticmethod
+    def _finish(result: Dict[str, Any], single: bool) -> Dict[str, Any]:
+        if single:
+            result["var"] = result["var"][..., 0]
+            result["cvar"] = result["cvar"][..., 0]
+        return result
+
+    @staticmethod
+    def _tail_stats(port: np.ndarray, alphas: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        VaR = phân vị alpha, CVaR = trung bình các kịch bản <= VaR.
+        port: (S, K) -> trả về (C, K) cho mỗi alpha.
+        """
+        var = np.quantile(port, alphas, axis=0)
+        cvar = np.empty_like(var)
+        for i in range(len(alphas)):
+            tail = port <= var[i]
+            cvar[i] = (port * tail).sum(axis=0) / np.maximum(tail.sum(axis=0), 1)
+        return var, cvar
+
+    @staticmethod
+    def covariance(returns: ReturnsLike) -> Tuple[np.ndarray, np.ndarray]:
+        """Vector kỳ vọng (N,) và ma trận hiệp phương sai mẫu (N, N)"""
+        R = np.asarray(returns, dtype=np.float64)
+        mu = R.mean(axis=0)
+        centered = R - mu
+        cov = centered.T @ centered / max(len(R) - 1, 1)
+        return mu, cov
+
+    @staticmethod
+    def cholesky(cov: np.ndarray, max_tries: int = 6) -> np.ndarray:
+        """
+        Phân rã Cholesky; ma trận gần suy biến (tài sản trùng lặp) được cộng jitter tăng dần trên đường chéo.
+        Thử jitter 0 rồi max_tries mức scale·1e-10, 1e-9, ... (mức lớn nhất cũng được thử trước khi bỏ cuộc).
+        """
+        scale = float(np.mean(np.diag(cov))) or 1.0
+        jitters = [0.0] + [scale * 10.0 ** (attempt - 10) for attempt in range(max_tries)]
+        for jitter in jitters:
+            try:
+                return np.linalg.cholesky(cov + jitter * np.eye(len(cov)))
+            except np.linalg.LinAlgError:
+                continue
+        raise np.linalg.LinAlgError("Covariance matrix is not positive definite")
+
+    # ------------------------------------------------------------------
+    # 1. HISTORICAL SIMULATION
+    # ------------------------------------------------------------------
+    @staticmethod
+    def historical_var(returns: ReturnsLike, weights, confidence_levels: Sequence[float] = DEFAULT_CONFIDENCE,
+                       horizons: Sequence[int] = DEFAULT_HORIZONS) -> Dict[str, Any]:
+        """
+        VaR/CVaR lịch sử trên phân phối thực nghiệm của lợi suất danh mục.
+        Kỳ hạn nhiều ngày được quy đổi theo quy tắc căn bậc hai thời gian (sqrt-of-time).
+        """
+        R, W, single = RiskEngine._prepare(returns, weights)
+        alphas = 1.0 - np.asarray(confidence_levels, dtype=np.float64)
+        scale = np.sqrt(np.asarray(horizons, dtype=np.float64))[None, :, None]
+
+        port = R @ W.T  # (T, K) - toàn bộ K danh mục trong 1 phép nhân ma trận
+        var_1d, cvar_1d = RiskEngine._tail_stats(port, alphas)
+
+        return RiskEngine._finish({
+            "method": "historical",
+            "confidence_levels": list(confidence_levels),
+            "horizons": list(horizons),
+            "var": var_1d[:, None, :] * scale,
+            "cvar": cvar_1d[:, None, :] * scale,
+        }, single)
+
+    # ------------------------------------------------------------------
+    # 2. PARAMETRIC (DELTA-NORMAL)
+    # ------------------------------------------------------------------
+    @staticmethod
+    def parametric_var(returns: ReturnsLike, weights, confidence_levels: Sequence[float] = DEFAULT_CONFIDENCE,
+                       horizons: Sequence[int] = DEFAULT_HORIZONS) -> Dict[str, Any]:
+        """
+        VaR/CVaR Delta-Normal: VaR_h = μ_p·h + z_α·σ_p·√h, CVaR_h = μ_p·h − σ_p·√h·φ(z_α)/α.
+        σ_p của K danh mục tính bằng 1 lượt: diag(W Σ Wᵀ) = Σ_n (W Σ)_kn · W_kn.
+        """
+        R, W, single = RiskEngine._prepare(returns, weights)
+        mu, cov = RiskEngine.covariance(R)
+
+        port_mu = W @ mu                                        # (K,)
+        port_sigma = np.sqrt(np.maximum(((W @ cov) * W).sum(axis=1), 0.0))  # (K,)
+
+        std_normal = NormalDist()
+        alphas = 1.0 - np.asarray(confidence_levels, dtype=np.float64)
+        z = np.array([std_normal.inv_cdf(a) for a in alphas])[:, None, None]
+        pdf_ratio = np.array([std_normal.pdf(std_normal.inv_cdf(a)) / a for a in alphas])[:, None, None]
+        h = np.asarray(horizons, dtype=np.float64)[None, :, None]
+
+        drift = port_mu[None, None, :] * h
+        vol = port_sigma[None, None, :] * np.sqrt(h)
+
+        return RiskEngine._finish({
+            "method": "parametric",
+            "confidence_levels": list(confidence_levels),
+            "horizons": list(horizons),
+            "var": drift + z * vol,
+            "cvar": drift - pdf_ratio * vol,
+        }, single)
+
+    # ------------------------------------------------------------------
+    # 3. MONTE CARLO (CHOLESKY)
+    # ------------------------------------------------------------------
+    @staticmethod
+    def monte_carlo_var(returns: ReturnsLike, weights, confidence_levels: Sequence[float] = DEFAULT_CONFIDENCE,
+                        horizons: Sequence[int] = DEFAULT_HORIZONS, n_sims: int = 20_000,
+                        seed: Optional[int] = None, chunk_size: int = 5_000) -> Dict[str, Any]:
+        """
+        Mô phỏng lợi suất tài sản tương quan: r = μ + L·z với Σ = L·Lᵀ (Cholesky).
+        Lợi suất danh mục tính trực tiếp: r_p = W·μ + z·(Lᵀ·Wᵀ) -> không cần dựng ma trận kịch bản (S, N) đầy đủ.
+        Kỳ hạn h ngày (i.i.d.): r_p,h = h·μ_p + √h·(r_p − μ_p).
+        Với K danh mục, mọi cú sốc chung một lượt rút z nên các danh mục được so sánh trên cùng kịch bản.
+        """
+        R, W, single = RiskEngine._prepare(returns, weights)
+        mu, cov = RiskEngine.covariance(R)
+        L = RiskEngine.cholesky(cov)
+
+        loadings = L.T @ W.T   # (N, K)
+        port_mu = W @ mu       # (K,)
+
+        rng = np.random.default_rng(seed)
+        shocks = np.empty((n_sims, W.shape[0]), dtype=np.float64)
+        for start in range(0, n_sims, chunk_size):
+            size = min(chunk_size, n_sims - start)
+            z = rng.standard_normal((size, R.shape[1]))
+            shocks[start:start + size] = z @ loadings
+
+        # Phép biến đổi theo kỳ hạn là affine đồng biến -> phân vị & đuôi chỉ cần tính 1 lần trên cú sốc
+        alphas = 1.0 - np.asarray(confidence_levels, dtype=np.float64)
+        shock_var, shock_cvar = RiskEngine._tail_stats(shocks, alphas)    # (C, K)
+        h = np.asarray(horizons, dtype=np.float64)[None, :, None]
+        var = port_mu[None, None, :] * h + shock_var[:, None, :] * np.sqrt(h)
+        cvar = port_mu[None, None, :] * h + shock_cvar[:, None, :] * np.sqrt(h)
+
+        return RiskEngine._finish({
+            "method": "monte_carlo",
+            "confidence_levels": list(confidence_levels),
+            "horizons": list(horizons),
+            "n_sims": n_sims,
+            "seed": seed,
+            "var": var,
+            "cvar": cvar,
+        }, single)
+
+    # ------------------------------------------------------------------
+    # BẢNG TỔNG HỢP
+    # ------------------------------------------------------------------
+    @staticmethod
+    def var_table(returns: ReturnsLike, weights, confidence_levels: Sequence[float] = DEFAULT_CONFIDENCE,
+                  horizons: Sequence[int] = DEFAULT_HORIZONS, n_sims: int = 20_000,
+                  seed: Optional[int] = None) -> pd.DataFrame:
+        """Bảng VaR/CVaR của 1 danh mục theo cả 3 phương pháp x mức tin cậy x kỳ hạn"""
+        results = [
+            RiskEngine.historical_var(returns, weights, confidence_levels, horizons),
+            RiskEngine.parametric_var(returns, weights, confidence_levels, horizons),
+            RiskEngine.monte_carlo_var(returns, weights, confidence_levels, horizons, n_sims=n_sims, seed=seed),
+        ]
+        rows = []
+        for res in results:
+            for i, conf in enumerate(confidence_levels):
+                for j, h in enumerate(horizons):
+                    rows.append({
+                        "Method": res["method"].replace("_", " ").title(),
+                        "Confidence": f"{conf:.1%}",
+                        "Horizon (days)": h,
+                        "VaR": float(res["var"][i, j]),
+                        "CVaR": float(res["cvar"][i, j]),
+                    })
+        return pd.DataFrame(rows)
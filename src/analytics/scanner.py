@@ -0,0 +1,210 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/analytics/scanner.py
+ROLE: Vectorized Cross-Sectional Market Scanner (time x asset panel)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+"""
+
+import operator
+import logging
+from typing import Optional, Dict, Any, Tuple, Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Rổ mặc định: các mã vốn hóa lớn, thanh khoản cao của thị trường Mỹ
+DEFAULT_UNIVERSE = (
+    "AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "META", "BRK-B", "AVGO", "TSLA", "LLY",
+    "JPM", "V", "UNH", "XOM", "MA", "JNJ", "PG", "COST", "HD", "MRK",
+    "ABBV", "CVX", "ADBE", "CRM", "KO", "PEP", "BAC", "NFLX", "AMD", "TMO",
+    "WMT", "MCD", "CSCO", "ACN", "LIN", "ABT", "ORCL", "DHR", "INTC", "DIS",
+    "QCOM", "TXN", "VZ", "PFE", "CMCSA", "NKE", "WFC", "IBM", "CAT", "GS",
+)
+
+TRADING_DAYS_52W = 252
+
+# Toán tử cho bộ lọc dạng (cột, toán tử, ngưỡng)
+FILTER_OPS = {
+    "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+    "==": operator.eq, "!=": operator.ne,
+}
+
+# Các bộ lọc dựng sẵn cho giao diện
+PRESET_SCREENS: Dict[str, Dict[str, Any]] = {
+    "All (ranked by RSI)": {"filters": [], "sort_by": "RSI_14", "ascending": True},
+    "Oversold (RSI < 30)": {"filters": [("RSI_14", "<", 30)], "sort_by": "RSI_14", "ascending": True},
+    "Overbought (RSI > 70)": {"filters": [("RSI_14", ">", 70)], "sort_by": "RSI_14", "ascending": False},
+    "Fresh Golden Cross": {"filters": [("Cross", "==", 1)], "sort_by": "Cross_Age", "ascending": True},
+    "Fresh Death Cross": {"filters": [("Cross", "==", -1)], "sort_by": "Cross_Age", "ascending": True},
+    "Below Lower Band (%B < 0)": {"filters": [("BB_PctB", "<", 0)], "sort_by": "BB_PctB", "ascending": True},
+    "Near 52W High (within 3%)": {"filters": [("From_52W_High_%", ">=", -3)], "sort_by": "From_52W_High_%", "ascending": False},
+}
+
+
+class MarketScanner:
+    """
+    Máy quét chéo (cross-sectional) trên ma trận giá (hàng = thời gian, cột = tài sản).
+    Mọi chỉ báo được tính cho TẤT CẢ các cột trong 1 lượt vector hóa (cumsum / take_along_axis),
+    không lặp qua từng mã. Công thức RSI/SMA/Bollinger khớp TechnicalIndicators.
+    """
+
+    def __init__(self, rsi_window: int = 14, fast: int = 50, slow: int = 200, bb_window: int = 20,
+                 bb_std: float = 2.0, cross_lookback: int = 10, high_low_window: int = TRADING_DAYS_52W):
+        self.rsi_window = rsi_window
+        self.fast = fast
+        self.slow = slow
+        self.bb_window = bb_window
+        self.bb_std = bb_std
+        self.cross_lookback = cross_lookback
+        self.high_low_window = high_low_window
+
+    # ------------------------------------------------------------------
+    # 1. TIỆN ÍCH MA TRẬN
+    # ------------------------------------------------------------------
+    @staticmethod
+    def right_align(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Dồn các quan sát hợp lệ của mỗi cột xuống đáy (giữ thứ tự), NaN lên đầu.
+        Sau bước này hàng cuối = quan sát mới nhất của từng mã, dù lịch giao dịch khác nhau
+        (VD: Crypto giao dịch cuối tuần, mã mới niêm yết có ít lịch sử).
+        Trả về (ma trận đã dồn, số quan sát hợp lệ mỗi cột).
+        """
+        valid = ~np.isnan(values)
+        order = np.argsort(valid, axis=0, kind='stable')   # False (NaN) trước, True sau, giữ thứ tự
+        return np.take_along_axis(values, order, axis=0), valid.sum(axis=0)
+
+    @staticmethod
+    def _rolling_sum(values: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Tổng trượt & số quan sát trượt theo trục thời gian (bỏ qua NaN), cho mọi cột cùng lúc"""
+        filled = np.nan_to_num(values)
+        counts = (~np.isnan(values)).astype(np.float64)
+        cs = np.cumsum(filled, axis=0)
+        cc = np.cumsum(counts, axis=0)
+        if window < len(values):
+            cs[window:] = cs[window:] - cs[:-window].copy()
+            cc[window:] = cc[window:] - cc[:-window].copy()
+        return cs, cc
+
+    def _rolling_mean(self, values: np.ndarray, window: int) -> np.ndarray:
+        total, count = self._rolling_sum(values, window)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, total / count, np.nan)
+
+    def _rolling_std(self, values: np.ndarray, window: int) -> np.ndarray:
+        """Độ lệch chuẩn mẫu (ddof=1); trừ trung bình cột trước để giảm sai số triệt tiêu"""
+        centered = values - np.nanmean(values, axis=0)
+        total, count = self._rolling_sum(centered, window)
+        total_sq, _ = self._rolling_sum(centered * centered, window)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = (total_sq - total * total / count) / (count - 1)
+        return np.sqrt(np.where(count > 1, np.maximum(var, 0.0), np.nan))
+
+    # ------------------------------------------------------------------
+    # 2. QUÉT
+    # ------------------------------------------------------------------
+    def scan(self, close: pd.DataFrame, high: Optional[pd.DataFrame] = None,
+             low: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """
+        Tính bảng chỉ số tại phiên mới nhất của từng mã (1 hàng / mã):
+        Last, Change_%, RSI_14, SMA_Fast/SMA_Slow, Trend (+1 fast > slow), Cross (+1 Golden / -1 Death
+        trong cross_lookback phiên gần nhất), Cross_Age, BB_PctB, From_52W_High_%, From_52W_Low_%, Bars.
+        """
+        if close is None or close.empty:
+            return pd.DataFrame()
+
+        tickers = list(close.columns)
+        c, bars = self.right_align(close.to_numpy(dtype=np.float64))
+        h = self.right_align(high[tickers].to_numpy(dtype=np.float64))[0] if high is not None else c
+        l = self.right_align(low[tickers].to_numpy(dtype=np.float64))[0] if low is not None else c
+        T = len(c)
+        last = c[-1]
+
+        # --- Biến động phiên ---
+        prev = c[-2] if T > 1 else np.full_like(last, np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            change_pct = (last / prev - 1.0) * 100.0
+
+        # --- RSI (trung bình đơn giản của Gain/Loss, như TechnicalIndicators) ---
+        tail = c[-(self.rsi_window + 1):]
+        delta = np.diff(tail, axis=0)
+        # Cửa sổ min_periods=1: mã có ít hơn rsi_window + 1 phiên chia cho số phiên thực có
+        denom = np.maximum(np.minimum(bars, self.rsi_window), 1)
+        gain = np.where(delta > 0, delta, 0.0).sum(axis=0) / denom
+        loss = np.where(delta < 0, -delta, 0.0).sum(axis=0) / denom
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rsi = np.where(loss == 0, 100.0, 100.0 - 100.0 / (1.0 + gain / loss))
+        rsi = np.where(bars > 1, rsi, np.nan)
+
+        # --- SMA Crossover: xét đủ cross_lookback + 1 phiên cuối ---
+        window = min(T, self.slow + self.cross_lookback + 1)
+        recent = c[-window:]
+        sma_fast = self._rolling_mean(recent, self.fast)[-(self.cross_lookback + 1):]
+        sma_slow = self._rolling_mean(recent, self.slow)[-(self.cross_lookback + 1):]
+        above = sma_fast > sma_slow
+        flips = above[1:] != above[:-1]                         # (lookback, N)
+        any_flip = flips.any(axis=0)
+        last_flip = flips.shape[0] - 1 - np.argmax(flips[::-1], axis=0)
+        cross_age = np.where(any_flip, flips.shape[0] - 1 - last_flip, -1)
+        enough = bars >= self.slow + 1
+        trend = np.where(enough, np.where(above[-1], 1, -1), 0)
+        cross = np.where(enough & any_flip, trend, 0)
+
+        # --- Bollinger %B ---
+        bb_slice = c[-self.bb_window:]
+        mid = np.nanmean(bb_slice, axis=0)
+        std = self._rolling_std(bb_slice, self.bb_window)[-1]
+        upper = mid + self.bb_std * std
+        lower = mid - self.bb_std * std
+        with np.errstate(invalid='ignore', divide='ignore'):
+            pct_b = np.where(upper > lower, (last - lower) / (upper - lower), np.nan)
+
+        # --- Khoảng cách tới đỉnh / đáy 52 tuần ---
+        hi = np.nanmax(h[-self.high_low_window:], axis=0)
+        lo = np.nanmin(l[-self.high_low_window:], axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            from_high = (last / hi - 1.0) * 100.0
+            from_low = (last / lo - 1.0) * 100.0
+
+        table = pd.DataFrame({
+            "Last": last,
+            "Change_%": change_pct,
+            "RSI_14": rsi,
+            "SMA_Fast": np.where(enough, sma_fast[-1], np.nan),
+            "SMA_Slow": np.where(enough, sma_slow[-1], np.nan),
+            "Trend": trend,
+            "Cross": cross,
+            "Cross_Age": np.where(cross != 0, cross_age, -1),
+            "BB_PctB": pct_b,
+            "From_52W_High_%": from_high,
+            "From_52W_Low_%": from_low,
+            "Bars": bars,
+        }, index=pd.Index(tickers, name="Ticker"))
+        return table[table["Bars"] > 0]
+
+    # ------------------------------------------------------------------
+    # 3. XẾP HẠNG & LỌC
+    # ------------------------------------------------------------------
+    @staticmethod
+    def screen(table: pd.DataFrame, filters: Sequence[Tuple[str, str, float]] = (), sort_by: Optional[str] = None,
+               ascending: bool = True, top: Optional[int] = None) -> pd.DataFrame:
+        """Lọc theo các điều kiện (cột, toán tử, ngưỡng) ghép AND, rồi xếp hạng theo 1 cột"""
+        if table is None or table.empty:
+            return table
+        mask = np.ones(len(table), dtype=bool)
+        for column, op, threshold in filters:
+            if op not in FILTER_OPS:
+                raise ValueError(f"Unsupported filter operator: {op}")
+            mask &= FILTER_OPS[op](table[column].to_numpy(), threshold)
+        result = table[mask]
+        if sort_by:
+            result = result.sort_values(sort_by, ascending=ascending, na_position='last')
+        return result.head(top) if top else result
+
+    def run_preset(self, panel: Dict[str, pd.DataFrame], preset: str, top: Optional[int] = None) -> pd.DataFrame:
+        spec = PRESET_SCREENS[preset]
+        table = self.scan(panel["Close"], panel.get("High"), panel.get("Low"))
+        return self.screen(table, spec["filters"], spec["sort_by"], spec["ascending"], top)
@@ -7,20 +7,37 @@ AUTHOR: Fincept Copilot (Emo)
 =============================================================================
 """
 
+import logging
 import pandas as pd
 import numpy as np
+from typing import Optional, Dict, Any
+
+from src.analytics import kernels
+
+logger = logging.getLogger(__name__)
+
+# Thứ tự cột chỉ báo (dùng chung cho bản đầy đủ và bản compact)
+INDICATOR_COLUMNS = (
+    'SMA_20', 'SMA_50', 'SMA_200', 'EMA_12', 'EMA_26',
+    'MACD', 'MACD_Signal', 'MACD_Histogram', 'RSI_14',
+    'BB_Middle', 'BB_Upper', 'BB_Lower',
+)
 
 class TechnicalIndicators:
     """Bộ công cụ tính toán các chỉ báo Phân tích Kỹ thuật (TA)"""
 
     @staticmethod
-    def add_all_indicators(df: pd.DataFrame) -> pd.DataFrame:
+    def add_all_indicators(df: pd.DataFrame, compact: bool = False) -> pd.DataFrame:
         """
         Bơm toàn bộ các chỉ báo kỹ thuật cốt lõi vào bộ dữ liệu OHLCV.
         Bao gồm: Trend (SMA, EMA), Momentum (RSI, MACD), Volatility (Bollinger Bands).
+        compact=True: chế độ tiết kiệm bộ nhớ (xem _add_indicators_compact).
         """
         if df is None or df.empty or 'Close' not in df.columns:
             return df
+
+        if compact:
+            return TechnicalIndicators._add_indicators_compact(df)
             
         # Tránh cảnh báo SettingWithCopyWarning của Pandas
         df = df.copy()
@@ -66,3 +83,359 @@ class TechnicalIndicators:
         except Exception as e:
             print(f"Technical Analysis Error: {e}")
             return df # Trả về DF gốc nếu lỗi
+
+    @staticmethod
+    def _add_indicators_compact(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Bản tiết kiệm bộ nhớ, cùng công thức với bản đầy đủ:
+        - Khung gốc được thu gọn (giá float32, Volume int64) thay vì df.copy() toàn bộ.
+        - Toàn bộ chỉ báo ghi thẳng vào 1 khối float32 cấp phát sẵn (mỗi chỉ báo 1 hàng liên tục),
+          phép tính trung gian dùng float64 trên 1 buffer tái sử dụng, làm tròn tại chỗ (out=).
+        - Không có bước df[numeric_cols].round(4) sao chép lại cả khung.
+        """
+        try:
+            base = kernels.compact_ohlcv(df)
+            close = df['Close'].to_numpy(dtype=np.float64)
+            n = len(close)
+
+            slot = {name: i for i, name in enumerate(INDICATOR_COLUMNS)}
+            block = np.empty((len(INDICATOR_COLUMNS), n), dtype=kernels.COMPACT_PRICE_DTYPE)
+            scratch = np.empty(n, dtype=np.float64)
+
+            def emit(name: str, values: np.ndarray) -> None:
+                np.round(values, 4, out=scratch)
+                block[slot[name]] = scratch
+
+            # 1. MOVING AVERAGES
+            sma_20 = kernels.rolling_mean(close, 20)
+            emit('SMA_20', sma_20)
+            emit('SMA_50', kernels.rolling_mean(close, 50, out=scratch))
+            emit('SMA_200', kernels.rolling_mean(close, 200, out=scratch))
+
+            ema_12 = kernels.ema(close, 12)
+            ema_26 = kernels.ema(close, 26)
+            emit('EMA_12', ema_12)
+            emit('EMA_26', ema_26)
+
+            # 2. MACD (tính trên EMA chưa làm tròn như bản đầy đủ)
+            macd = np.subtract(ema_12, ema_26, out=ema_12)
+            signal = kernels.ema(macd, 9, out=ema_26)
+            emit('MACD', macd)
+            emit('MACD_Signal', signal)
+            emit('MACD_Histogram', np.subtract(macd, signal, out=macd))
+
+            # 3. RSI
+            emit('RSI_14', kernels.rsi_sma(close, 14))
+
+            # 4. BOLLINGER BANDS
+            std_20 = kernels.rolling_std(close, 20, out=macd)  # tái sử dụng buffer MACD đã ghi xong
+            emit('BB_Middle', sma_20)
+            std_20 *= 2
+            emit('BB_Upper', sma_20 + std_20)
+            emit('BB_Lower', np.subtract(sma_20, std_20, out=std_20))
+
+            columns = {col: base[col] for col in base.columns}
+            for name in INDICATOR_COLUMNS:
+                columns[name] = block[slot[name]]
+            return pd.DataFrame(columns, index=base.index, copy=False)
+        except Exception as e:
+            logger.error(f"Technical Analysis Error (compact): {e}")
+            return df
+
+
+class StreamingIndicators:
+    """
+    Động cơ chỉ báo tăng dần (Streaming State) cho biểu đồ trực tiếp và máy quét.
+    Giữ tổng trượt (rolling sums), trạng thái EMA và bộ tích lũy Gain/Loss của RSI
+    nên mỗi nến mới chỉ tốn O(1) thay vì tính lại toàn bộ lịch sử.
+    Kết quả khớp với TechnicalIndicators.add_all_indicators (cùng công thức, cùng min_periods=1).
+    """
+
+    SMA_WINDOWS = (20, 50, 200)
+    RSI_WINDOW = 14
+    BB_WINDOW = 20
+    RESYNC_EVERY = 1000  # Tính lại tổng trượt định kỳ để triệt tiêu sai số dấu phẩy động
+
+    def __init__(self):
+        size = max(self.SMA_WINDOWS)
+        self._closes = np.zeros(size, dtype=np.float64)   # Ring buffer giá đóng cửa
+        self._gains = np.zeros(self.RSI_WINDOW, dtype=np.float64)
+        self._losses = np.zeros(self.RSI_WINDOW, dtype=np.float64)
+        self.count = 0
+        self.prev_close = None
+        self.last_timestamp = None
+        self.sums = {w: 0.0 for w in self.SMA_WINDOWS}
+        self.sumsq_bb = 0.0
+        self.gain_sum = 0.0
+        self.loss_sum = 0.0
+        self.ema_12 = None
+        self.ema_26 = None
+        self.macd_signal = None
+        self._undo = None
+
+    # ------------------------------------------------------------------
+    # CẬP NHẬT TỪNG NẾN
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _ema_step(prev: Optional[float], value: float, span: int) -> float:
+        # Tương đương pandas ewm(span, adjust=False): giá trị đầu tiên = chính nó
+        if prev is None:
+            return value
+        alpha = 2.0 / (span + 1.0)
+        return alpha * value + (1.0 - alpha) * prev
+
+    def _window_value(self, buffer: np.ndarray, count: int, back: int) -> float:
+        """Giá trị cách nến hiện tại `back` bước trong ring buffer (back=0 là nến mới nhất)"""
+        return buffer[(count - 1 - back) % len(buffer)]
+
+    def update(self, close: float, timestamp: Any = None, revise: bool = False) -> Dict[str, float]:
+        """
+        Nạp 1 nến mới và trả về giá trị các chỉ báo tại nến đó.
+        revise=True: nến cuối chưa đóng đang được cập nhật giá -> thay thế thay vì thêm mới.
+        """
+        if revise and self._undo is not None:
+            self._rollback()
+
+        close = float(close)
+        n = self.count
+        size = len(self._closes)
+
+        # Lưu trạng thái cần thiết để có thể hoàn tác (revise) nến này
+        self._undo = {
+            "scalars": (self.prev_close, self.last_timestamp, dict(self.sums), self.sumsq_bb,
+                        self.gain_sum, self.loss_sum, self.ema_12, self.ema_26, self.macd_signal),
+            "close_slot": self._closes[n % size],
+            "rsi_slot": (self._gains[n % self.RSI_WINDOW], self._losses[n % self.RSI_WINDOW]),
+        }
+
+        # 1. Tổng trượt cho SMA & Bollinger (trừ giá trị rơi khỏi cửa sổ)
+        for w in self.SMA_WINDOWS:
+            if n >= w:
+                self.sums[w] -= self._window_value(self._closes, n, w - 1)
+        if n >= self.BB_WINDOW:
+            old = self._window_value(self._closes, n, self.BB_WINDOW - 1)
+            self.sumsq_bb -= old * old
+        self._closes[n % size] = close
+        for w in self.SMA_WINDOWS:
+            self.sums[w] += close
+        self.sumsq_bb += close * close
+
+        # 2. RSI: tổng Gain/Loss trên cửa sổ 14 nến (nến đầu tiên có delta = 0)
+        delta = 0.0 if self.prev_close is None else close - self.prev_close
+        slot = n % self.RSI_WINDOW
+        if n >= self.RSI_WINDOW:
+            self.gain_sum -= self._gains[slot]
+            self.loss_sum -= self._losses[slot]
+        self._gains[slot] = max(delta, 0.0)
+        self._losses[slot] = max(-delta, 0.0)
+        self.gain_sum += self._gains[slot]
+        self.loss_sum += self._losses[slot]
+
+        # 3. EMA & MACD
+        self.ema_12 = self._ema_step(self.ema_12, close, 12)
+        self.ema_26 = self._ema_step(self.ema_26, close, 26)
+        self.macd_signal = self._ema_step(self.macd_signal, self.ema_12 - self.ema_26, 9)
+
+        self.prev_close = close
+        self.last_timestamp = timestamp
+        self.count += 1
+
+        if self.count % self.RESYNC_EVERY == 0:
+            self._resync()
+
+        return self.values()
+
+    def _rollback(self) -> None:
+        """Hoàn tác nến cuối cùng (dùng khi nến đang hình thành được cập nhật giá)"""
+        undo = self._undo
+        self.count -= 1
+        n = self.count
+        (self.prev_close, self.last_timestamp, self.sums, self.sumsq_bb,
+         self.gain_sum, self.loss_sum, self.ema_12, self.ema_26, self.macd_signal) = undo["scalars"]
+        self._closes[n % len(self._closes)] = undo["close_slot"]
+        self._gains[n % self.RSI_WINDOW], self._losses[n % self.RSI_WINDOW] = undo["rsi_slot"]
+        self._undo = None
+
+    def _resync(self) -> None:
+        """Tính lại các tổng trượt trực tiếp từ buffer"""
+        for w in self.SMA_WINDOWS:
+            self.sums[w] = float(sum(self._window_value(self._closes, self.count, k) for k in range(min(w, self.count))))
+        k_bb = min(self.BB_WINDOW, self.count)
+        self.sumsq_bb = float(sum(self._window_value(self._closes, self.count, k) ** 2 for k in range(k_bb)))
+        k_rsi = min(self.RSI_WINDOW, self.count)
+        self.gain_sum = float(self._gains[:k_rsi].sum()) if self.count < self.RSI_WINDOW else float(self._gains.sum())
+        self.loss_sum = float(self._losses[:k_rsi].sum()) if self.count < self.RSI_WINDOW else float(self._losses.sum())
+
+    def values(self) -> Dict[str, float]:
+        """Giá trị chỉ báo tại nến mới nhất (làm tròn 4 chữ số như bản tính toàn bộ)"""
+        if self.count == 0:
+            return {}
+        n = self.count
+        out = {}
+        for w in self.SMA_WINDOWS:
+            out[f"SMA_{w}"] = self.sums[w] / min(n, w)
+
+        out["EMA_12"] = self.ema_12
+        out["EMA_26"] = self.ema_26
+        out["MACD"] = self.ema_12 - self.ema_26
+        out["MACD_Signal"] = self.macd_signal
+        out["MACD_Histogram"] = out["MACD"] - self.macd_signal
+
+        k_rsi = min(n, self.RSI_WINDOW)
+        loss = self.loss_sum / k_rsi
+        gain = self.gain_sum / k_rsi
+        out["RSI_14"] = 100.0 if loss == 0 else 100.0 - (100.0 / (1.0 + gain / loss))
+
+        k_bb = min(n, self.BB_WINDOW)
+        mean_bb = self.sums[self.BB_WINDOW] / k_bb
+        if k_bb > 1:
+            var = max((self.sumsq_bb - k_bb * mean_bb * mean_bb) / (k_bb - 1), 0.0)
+            std = float(np.sqrt(var))
+            out["BB_Upper"] = mean_bb + 2 * std
+            out["BB_Lower"] = mean_bb - 2 * std
+        else:
+            out["BB_Upper"] = np.nan
+            out["BB_Lower"] = np.nan
+        out["BB_Middle"] = mean_bb
+
+        return {k: round(float(v), 4) for k, v in out.items()}
+
+    # ------------------------------------------------------------------
+    # KHỞI TẠO TỪ LỊCH SỬ / SNAPSHOT
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_history(cls, df: pd.DataFrame) -> "StreamingIndicators":
+        """Khởi động trạng thái từ toàn bộ lịch sử bằng phép tính vector hóa (1 lần duy nhất)"""
+        engine = cls()
+        if df is None or df.empty or 'Close' not in df.columns:
+            return engine
+
+        # Nến cuối nạp qua update() để luôn có bản ghi hoàn tác (nến đang hình thành có thể bị sửa giá)
+        last = df.iloc[-1]
+        last_ts = pd.Timestamp(last['timestamp']).isoformat() if 'timestamp' in df.columns else None
+        if len(df) == 1:
+            engine.update(last['Close'], timestamp=last_ts)
+            return engine
+
+        close = df['Close'].astype(np.float64).to_numpy()[:-1]
+        n = len(close)
+        size = len(engine._closes)
+
+        # Nạp phần đuôi vào ring buffer đúng vị trí slot (slot = chỉ số nến % kích thước)
+        idx = np.arange(max(0, n - size), n)
+        engine._closes[idx % size] = close[idx]
+
+        delta = np.diff(close, prepend=close[0])
+        idx = np.arange(max(0, n - cls.RSI_WINDOW), n)
+        engine._gains[idx % cls.RSI_WINDOW] = np.maximum(delta[idx], 0.0)
+        engine._losses[idx % cls.RSI_WINDOW] = np.maximum(-delta[idx], 0.0)
+
+        series = pd.Series(close)
+        engine.ema_12 = float(series.ewm(span=12, adjust=False).mean().iloc[-1])
+        engine.ema_26 = float(series.ewm(span=26, adjust=False).mean().iloc[-1])
+        macd = series.ewm(span=12, adjust=False).mean() - series.ewm(span=26, adjust=False).mean()
+        engine.macd_signal = float(macd.ewm(span=9, adjust=False).mean().iloc[-1])
+
+        engine.count = n
+        engine.prev_close = float(close[-1])
+        if 'timestamp' in df.columns:
+            engine.last_timestamp = pd.Timestamp(df['timestamp'].iloc[-2]).isoformat()
+        engine._resync()
+        engine.update(last['Close'], timestamp=last_ts)
+        return engine
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Xuất trạng thái dạng JSON-serializable để lưu cạnh chuỗi lịch sử trong kho"""
+        undo = None
+        if self._undo is not None:
+            (prev_close, last_ts, sums, sumsq_bb, gain_sum, loss_sum,
+             ema_12, ema_26, macd_signal) = self._undo["scalars"]
+            undo = {
+                "prev_close": prev_close, "last_timestamp": last_ts,
+                "sums": [float(sums[w]) for w in self.SMA_WINDOWS], "sumsq_bb": float(sumsq_bb),
+                "gain_sum": float(gain_sum), "loss_sum": float(loss_sum),
+                "ema_12": ema_12, "ema_26": ema_26, "macd_signal": macd_signal,
+                "close_slot": float(self._undo["close_slot"]),
+                "rsi_slot": [float(v) for v in self._undo["rsi_slot"]],
+            }
+        return {
+            "count": self.count,
+            "prev_close": self.prev_close,   # = giá đóng cửa của nến cuối tại thời điểm chụp
+            "last_timestamp": self.last_timestamp,
+            "closes": self._closes.tolist(),
+            "gains": self._gains.tolist(),
+            "losses": self._losses.tolist(),
+            "ema_12": self.ema_12,
+            "ema_26": self.ema_26,
+            "macd_signal": self.macd_signal,
+            "undo": undo,   # Hoàn tác nến cuối -> resume sửa được nến đang hình thành
+        }
+
+    @classmethod
+    def restore(cls, state: Dict[str, Any]) -> "StreamingIndicators":
+        engine = cls()
+        engine.count = int(state["count"])
+        engine.prev_close = state["prev_close"]
+        engine.last_timestamp = state["last_timestamp"]
+        engine._closes[:] = state["closes"]
+        engine._gains[:] = state["gains"]
+        engine._losses[:] = state["losses"]
+        engine.ema_12 = state["ema_12"]
+        engine.ema_26 = state["ema_26"]
+        engine.macd_signal = state["macd_signal"]
+        engine._resync()
+        undo = state.get("undo")
+        if undo:
+            engine._undo = {
+                "scalars": (undo["prev_close"], undo["last_timestamp"],
+                            dict(zip(cls.SMA_WINDOWS, undo["sums"])), undo["sumsq_bb"],
+                            undo["gain_sum"], undo["loss_sum"],
+                            undo["ema_12"], undo["ema_26"], undo["macd_signal"]),
+                "close_slot": undo["close_slot"],
+                "rsi_slot": tuple(undo["rsi_slot"]),
+            }
+        return engine
+
+    def _matches_history(self, close: np.ndarray, pos: int) -> bool:
+        """
+        So các giá đóng cửa đã chốt trong ring buffer với chuỗi hiện tại (bỏ qua nến cuối pos).
+        Chuỗi dựng lại vì corporate action (split/cổ tức điều chỉnh) giữ nguyên độ dài & mốc thời gian
+        nhưng đổi giá quá khứ -> lệch ở đây.
+        """
+        size = len(self._closes)
+        idx = np.arange(max(0, pos - size + 1), pos)
+        if idx.size == 0:
+            return True
+        return bool(np.allclose(self._closes[idx % size], close[idx], rtol=1e-9, atol=0.0))
+
+    @classmethod
+    def resume(cls, df: pd.DataFrame, state: Optional[Dict[str, Any]]) -> "StreamingIndicators":
+        """
+        Khôi phục từ snapshot rồi chỉ nạp các nến mới hơn snapshot.
+        - Nến cuối của snapshot bị sửa giá (tail refresh ghi đè nến đang mở) -> hoàn tác rồi nạp lại nến đó.
+        - Snapshot không khớp chuỗi (VD: lịch sử bị dựng lại, kể cả cùng độ dài) -> khởi động lại từ đầu.
+        """
+        if not state or df is None or df.empty or 'timestamp' not in df.columns or not state.get("last_timestamp"):
+            return cls.from_history(df)
+
+        last_ts = pd.Timestamp(state["last_timestamp"])
+        pos = int(df['timestamp'].searchsorted(last_ts, side='left'))
+        if pos >= len(df) or df['timestamp'].iloc[pos] != last_ts or pos + 1 != int(state["count"]):
+            return cls.from_history(df)
+
+        engine = cls.restore(state)
+        close = df['Close'].astype(np.float64).to_numpy()
+        if not engine._matches_history(close, pos):
+            return cls.from_history(df)
+
+        start = pos + 1
+        if state["prev_close"] is None or close[pos] != float(state["prev_close"]):
+            if engine._undo is None:
+                return cls.from_history(df)
+            engine._rollback()
+            start = pos
+
+        tail = df.iloc[start:]
+        for ts, value in zip(tail['timestamp'], tail['Close']):
+            engine.update(value, timestamp=pd.Timestamp(ts).isoformat())
+        return engine
@@ -8,15 +8,75 @@ AUTHOR: Fincept Copilot (Emo)
 """
 
 import pandas as pd
+import numpy as np
 from decimal import Decimal
 import logging
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, Union, Optional, Tuple, List
 
 from src.backend.market import MarketDataEngine
 from src.backend.macro import MacroEngine
+from src.backend.metrics import instrumented
+from src.backend.fundamentals import get_fundamentals_store, normalize_statements
 
 logger = logging.getLogger(__name__)
 
+ArrayLike = Union[float, np.ndarray]
+
+# Đặc tả phân phối cho Monte Carlo: ("fixed", v) | ("normal", mu, sigma) | ("uniform", lo, hi) | ("triangular", lo, mode, hi)
+DistributionSpec = Tuple
+
+# Số năm của giai đoạn tăng trưởng cao (Giai đoạn 1)
+PROJECTION_YEARS = 5
+
+# Biến ngẫu nhiên của Monte Carlo, mỗi biến 1 luồng số ngẫu nhiên con (SeedSequence.spawn)
+MC_VARIABLES = ("growth", "terminal_growth", "beta", "erp")
+
+# Luồng nền cho Monte Carlo: worker Streamlit chỉ nộp việc rồi thăm dò kết quả, không bị chặn
+_MC_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="monte-carlo")
+
+
+def two_stage_dcf(fcf_base: ArrayLike, growth: ArrayLike, terminal_growth: ArrayLike, wacc: ArrayLike) -> np.ndarray:
+    """
+    Lõi DCF 2 giai đoạn dạng vector hóa (NumPy broadcasting).
+    Mọi tham số có thể là số thực hoặc mảng có shape tương thích -> trả về Enterprise Value cùng shape.
+    PV giai đoạn 1 dùng công thức cấp số nhân: FCF * Σ r^t với r = (1+g)/(1+WACC), t = 1..5.
+    """
+    fcf_base = np.asarray(fcf_base, dtype=np.float64)
+    growth = np.asarray(growth, dtype=np.float64)
+    terminal_growth = np.asarray(terminal_growth, dtype=np.float64)
+
+    # Bảo vệ lỗi chia cho 0 hoặc WACC quá nhỏ
+    wacc = np.maximum(wacc, terminal_growth + 0.01)
+
+    ratio = (1 + growth) / (1 + wacc)
+    ratio_n = ratio ** PROJECTION_YEARS
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annuity = np.where(np.isclose(ratio, 1.0), float(PROJECTION_YEARS), ratio * (1 - ratio_n) / (1 - ratio))
+    pv_fcfs = fcf_base * annuity
+
+    # Gordon Growth: TV = FCF_5 * (1 + g) / (WACC - g), chiết khấu 5 năm về hiện tại
+    fcf_final = fcf_base * (1 + growth) ** PROJECTION_YEARS
+    terminal_value = fcf_final * (1 + terminal_growth) / (wacc - terminal_growth)
+    pv_tv = terminal_value / (1 + wacc) ** PROJECTION_YEARS
+
+    return pv_fcfs + pv_tv
+
+
+def sample_distribution(rng: np.random.Generator, spec: DistributionSpec, size: int) -> np.ndarray:
+    """Rút `size` mẫu từ một phân phối được đặc tả bằng tuple (xem DistributionSpec)"""
+    kind = spec[0]
+    if kind == "fixed":
+        return np.full(size, float(spec[1]))
+    if kind == "normal":
+        return rng.normal(spec[1], spec[2], size)
+    if kind == "uniform":
+        return rng.uniform(spec[1], spec[2], size)
+    if kind == "triangular":
+        return rng.triangular(spec[1], spec[2], spec[3], size)
+    raise ValueError(f"Unsupported distribution '{kind}'")
+
+
 class DCFValuation:
     """Mô hình Định giá Chiết khấu Dòng tiền (Discounted Cash Flow) tự động"""
 
@@ -28,56 +88,62 @@ class DCFValuation:
         self.risk_free_rate = MacroEngine.get_risk_free_rate()
 
     def _extract_fcf(self) -> float:
-        """Thuật toán nội bộ: Trích xuất Dòng tiền tự do (FCF) từ BCTC"""
-        cf_stmt = self.financials.get('cash_flow')
-        if cf_stmt is None or cf_stmt.empty:
-            return 0.0
-            
+        """
+        Thuật toán nội bộ: Dòng tiền tự do (FCF) kỳ gần nhất.
+        Đọc chỉ tiêu chuẩn 'free_cash_flow' từ kho fundamentals (đã chuẩn hóa nhãn dòng khi nạp BCTC);
+        kho trống thì chuẩn hóa trực tiếp BCTC đang giữ, cuối cùng mới dùng 'info'.
+        """
+        fallback = float(self.info.get('free_cash_flow') or 0.0)
         try:
-            # Thử các tên biến phổ biến trong Yahoo Finance
-            ocf = 0.0
-            if 'Operating Cash Flow' in cf_stmt.index:
-                ocf = cf_stmt.loc['Operating Cash Flow'].iloc[0]
-            elif 'Total Cash From Operating Activities' in cf_stmt.index:
-                ocf = cf_stmt.loc['Total Cash From Operating Activities'].iloc[0]
-                
-            capex = 0.0
-            if 'Capital Expenditure' in cf_stmt.index:
-                capex = cf_stmt.loc['Capital Expenditure'].iloc[0]
-                
-            # FCF = OCF + CapEx (CapEx thường ghi số âm nên dùng dấu cộng)
-            fcf = float(ocf + capex)
-            
-            # Fallback nếu tính ra 0 hoặc lỗi, cố gắng lấy từ 'info'
-            if fcf == 0.0 and self.info.get('freeCashflow'):
-                fcf = float(self.info.get('freeCashflow'))
-                
-            return fcf
+            fcf = get_fundamentals_store().latest_value(self.ticker, "free_cash_flow")
+            if fcf is None:
+                facts = normalize_statements(self.financials)
+                fcf_rows = facts[facts["item"] == "free_cash_flow"]
+                fcf = float(fcf_rows.sort_values("period_end")["value"].iloc[-1]) if not fcf_rows.empty else None
+
+            # Fallback nếu không có hoặc bằng 0, cố gắng lấy từ 'info'
+            if not fcf and fallback:
+                return fallback
+            return float(fcf or 0.0)
         except Exception as e:
             logger.error(f"Error extracting FCF for {self.ticker}: {e}")
-            return float(self.info.get('freeCashflow', 0.0))
+            return fallback
+
+    def _load_inputs(self) -> Dict[str, Any]:
+        """Thu thập dữ liệu gốc cho mô hình (FCF, Nợ, Tiền mặt, Số CP, Beta, Giá)"""
+        if "error" in self.info:
+            return {"error": self.info["error"]}
+
+        fcf_base = self._extract_fcf()
+        if fcf_base <= 0:
+            return {"error": "Dòng tiền tự do (FCF) âm hoặc không có dữ liệu. Không thể dùng DCF."}
 
+        inputs = {
+            "fcf_base": fcf_base,
+            "total_debt": float(self.info.get('total_debt') or 0.0),
+            "total_cash": float(self.info.get('total_cash') or 0.0),
+            "shares_out": float(self.info.get('shares_outstanding') or 0.0),
+            "beta": float(self.info.get('beta') or 1.0),
+            "current_price": float(self.info.get('current_price') or 0.0),
+        }
+        if inputs["shares_out"] == 0 or inputs["current_price"] == 0:
+            return {"error": "Thiếu dữ liệu Số lượng cổ phiếu hoặc Giá hiện tại."}
+        return inputs
+
+    @instrumented
     def calculate(self, growth_rate_1_5: float, terminal_growth: float, equity_risk_premium: float) -> Dict[str, Any]:
         """
         Thực thi mô hình DCF 2 giai đoạn (5 năm tăng trưởng + Vĩnh viễn).
         """
-        if "error" in self.info:
-            return {"error": self.info["error"]}
-
         try:
             # 1. Thu thập dữ liệu gốc
-            fcf_base = self._extract_fcf()
-            if fcf_base <= 0:
-                return {"error": "Dòng tiền tự do (FCF) âm hoặc không có dữ liệu. Không thể dùng DCF."}
-
-            total_debt = float(self.info.get('totalDebt', 0.0))
-            total_cash = float(self.info.get('totalCash', 0.0))
-            shares_out = float(self.info.get('sharesOutstanding', 0.0))
-            beta = float(self.info.get('beta', 1.0))
-            current_price = float(self.info.get('current_price', 0.0))
+            inputs = self._load_inputs()
+            if "error" in inputs:
+                return inputs
 
-            if shares_out == 0 or current_price == 0:
-                return {"error": "Thiếu dữ liệu Số lượng cổ phiếu hoặc Giá hiện tại."}
+            fcf_base = inputs["fcf_base"]
+            beta = inputs["beta"]
+            current_price = inputs["current_price"]
 
             # 2. Tính toán Chi phí Vốn (WACC - Ở đây đơn giản hóa bằng Cost of Equity CAPM)
             # Ke = Rf + Beta * ERP
@@ -87,28 +153,14 @@ class DCFValuation:
             # Bảo vệ lỗi chia cho 0 hoặc WACC quá nhỏ
             wacc = max(wacc, terminal_growth + 0.01) 
 
-            # 3. Phóng chiếu Dòng tiền 5 năm tới (Giai đoạn 1)
-            projected_fcfs = []
-            pv_fcfs = 0.0
-            current_fcf = fcf_base
-            
-            for year in range(1, 6):
-                current_fcf *= (1 + growth_rate_1_5)
-                projected_fcfs.append(current_fcf)
-                # Chiết khấu về hiện tại
-                pv_fcfs += current_fcf / ((1 + wacc) ** year)
-
-            # 4. Tính Giá trị vĩnh viễn (Terminal Value - Giai đoạn 2)
-            # Công thức Gordon Growth: TV = FCF_5 * (1 + g) / (WACC - g)
-            terminal_value = (projected_fcfs[-1] * (1 + terminal_growth)) / (wacc - terminal_growth)
-            pv_tv = terminal_value / ((1 + wacc) ** 5)
+            # 3-4. Phóng chiếu FCF 5 năm + Giá trị vĩnh viễn (dùng chung lõi vector hóa)
+            enterprise_value = float(two_stage_dcf(fcf_base, growth_rate_1_5, terminal_growth, wacc))
 
             # 5. Tổng hợp Giá trị Doanh nghiệp (Enterprise Value) & Vốn hóa (Equity Value)
-            enterprise_value = pv_fcfs + pv_tv
-            equity_value = enterprise_value + total_cash - total_debt
+            equity_value = enterprise_value + inputs["total_cash"] - inputs["total_debt"]
             
             # 6. Giá trị nội tại mỗi cổ phiếu (Fair Value per Share)
-            fair_value = equity_value / shares_out
+            fair_value = equity_value / inputs["shares_out"]
             
             # Tính Upside / Downside
             upside_pct = ((fair_value - current_price) / current_price) * 100
@@ -133,3 +185,188 @@ class DCFValuation:
             }
         except Exception as e:
             return {"error": f"Lỗi tính toán hệ thống: {str(e)}"}
+
+    @instrumented
+    def calculate_grid(self, growth_rates, terminal_growths, equity_risk_premiums) -> Dict[str, Any]:
+        """
+        Ma trận độ nhạy (Sensitivity Grid): định giá toàn bộ tích Descartes của các giả định
+        trong MỘT lượt NumPy broadcasting. Kết quả có shape (len(growth), len(terminal_g), len(erp)).
+        """
+        try:
+            inputs = self._load_inputs()
+            if "error" in inputs:
+                return inputs
+
+            g = np.asarray(growth_rates, dtype=np.float64).reshape(-1, 1, 1)
+            tg = np.asarray(terminal_growths, dtype=np.float64).reshape(1, -1, 1)
+            erp = np.asarray(equity_risk_premiums, dtype=np.float64).reshape(1, 1, -1)
+
+            # WACC chỉ phụ thuộc ERP -> shape (1, 1, E), broadcast cùng g và tg
+            wacc = self.risk_free_rate + inputs["beta"] * erp
+            enterprise_value = two_stage_dcf(inputs["fcf_base"], g, tg, wacc)
+
+            fair_value = (enterprise_value + inputs["total_cash"] - inputs["total_debt"]) / inputs["shares_out"]
+            upside_pct = (fair_value - inputs["current_price"]) / inputs["current_price"] * 100
+
+            return {
+                "ticker": self.ticker,
+                "current_price": inputs["current_price"],
+                "currency": self.info.get('currency', 'USD'),
+                "growth_rates": g.ravel(),
+                "terminal_growths": tg.ravel(),
+                "equity_risk_premiums": erp.ravel(),
+                "fair_value": fair_value,
+                "upside_pct": upside_pct,
+            }
+        except Exception as e:
+            return {"error": f"Lỗi tính toán hệ thống: {str(e)}"}
+
+    @instrumented
+    def monte_carlo(self, distributions: Dict[str, DistributionSpec], n_draws: int = 100_000,
+                    seed: Optional[int] = None, chunk_size: int = 250_000, bins: int = 60) -> Dict[str, Any]:
+        """
+        Định giá xác suất (Monte Carlo DCF).
+        distributions: phân phối cho 'growth', 'terminal_growth', 'beta', 'erp'
+                       (thiếu 'beta' -> cố định bằng Beta của doanh nghiệp).
+        Mỗi biến rút từ luồng con riêng của SeedSequence(seed) nên kết quả chỉ phụ thuộc seed,
+        không phụ thuộc chunk_size.
+        Bộ nhớ: mảng trung gian O(chunk_size) cho mỗi khối, cộng 1 mảng float32 O(n_draws)
+        giữ toàn bộ giá trị nội tại để percentile chính xác (4 byte/mẫu: 2 triệu mẫu ~ 8MB).
+        """
+        try:
+            inputs = self._load_inputs()
+            if "error" in inputs:
+                return inputs
+
+            specs = {"beta": ("fixed", inputs["beta"])}
+            specs.update(distributions)
+            missing = {"growth", "terminal_growth", "erp"} - specs.keys()
+            if missing:
+                return {"error": f"Thiếu phân phối cho: {', '.join(sorted(missing))}"}
+
+            streams = dict(zip(MC_VARIABLES, (np.random.default_rng(child)
+                                              for child in np.random.SeedSequence(seed).spawn(len(MC_VARIABLES)))))
+            fair_values = np.empty(n_draws, dtype=np.float32)
+            equity_adj = inputs["total_cash"] - inputs["total_debt"]
+
+            for start in range(0, n_draws, chunk_size):
+                size = min(chunk_size, n_draws - start)
+                growth, terminal_g, beta, erp = (sample_distribution(streams[name], specs[name], size)
+                                                 for name in MC_VARIABLES)
+
+                wacc = self.risk_free_rate + beta * erp
+                enterprise_value = two_stage_dcf(inputs["fcf_base"], growth, terminal_g, wacc)
+                fair_values[start:start + size] = (enterprise_value + equity_adj) / inputs["shares_out"]
+
+            current_price = inputs["current_price"]
+            pct_levels = [5, 25, 50, 75, 95]
+            pct_values = np.percentile(fair_values, pct_levels)
+
+            # Histogram cắt đuôi 1% hai phía để biểu đồ không bị kéo giãn bởi giá trị cực đoan
+            lo, hi = np.percentile(fair_values, [1, 99])
+            counts, edges = np.histogram(fair_values, bins=bins, range=(lo, hi))
+
+            return {
+                "ticker": self.ticker,
+                "current_price": current_price,
+                "currency": self.info.get('currency', 'USD'),
+                "n_draws": n_draws,
+                "seed": seed,
+                "mean": float(fair_values.mean(dtype=np.float64)),
+                "std": float(fair_values.std(dtype=np.float64)),
+                "percentiles": {p: float(v) for p, v in zip(pct_levels, pct_values)},
+                "prob_upside": float((fair_values > current_price).mean()),
+                "histogram": {"counts": counts, "edges": edges},
+            }
+        except Exception as e:
+            return {"error": f"Lỗi tính toán hệ thống: {str(e)}"}
+
+    def monte_carlo_async(self, distributions: Dict[str, DistributionSpec], **kwargs) -> Future:
+        """Nộp monte_carlo() vào luồng nền; trang Streamlit giữ Future và thăm dò thay vì chờ"""
+        return _MC_POOL.submit(self.monte_carlo, distributions, **kwargs)
+
+    # ------------------------------------------------------------------
+    # ĐỊNH GIÁ HÀNG LOẠT (CẢ RỔ MÃ)
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _load_universe(symbols: List[str], workers: int) -> Dict[str, Dict[str, Any]]:
+        """Nạp song song hồ sơ + BCTC (qua lớp coalesced, BCTC được chuẩn hóa vào kho fundamentals)"""
+        fetch_info = getattr(MarketDataEngine.get_company_info, "__wrapped__", MarketDataEngine.get_company_info)
+        fetch_statements = getattr(MarketDataEngine.get_financial_statements, "__wrapped__",
+                                   MarketDataEngine.get_financial_statements)
+
+        def load(symbol: str) -> Dict[str, Any]:
+            info = fetch_info(symbol)
+            if "error" not in info:
+                fetch_statements(symbol)
+            return info
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return dict(zip(symbols, pool.map(load, symbols)))
+
+    @staticmethod
+    @instrumented
+    def rank_universe(tickers: List[str], growth_rate_1_5: ArrayLike, terminal_growth: ArrayLike,
+                      equity_risk_premium: ArrayLike, workers: int = 16) -> pd.DataFrame:
+        """
+        Định giá DCF cho cả rổ mã rồi xếp hạng theo Upside.
+        Dữ liệu được nạp song song (I/O), còn toàn bộ phép tính là 1 lượt vector hóa two_stage_dcf
+        trên mảng N mã - không vòng lặp Python theo từng mã.
+        Giả định tăng trưởng có thể là 1 số (dùng chung) hoặc mảng N phần tử (riêng từng mã).
+        """
+        symbols = list(dict.fromkeys(t.strip().upper() for t in tickers if t and t.strip()))
+        columns = ["Name", "Price", "Fair_Value", "Upside_%", "FCF", "WACC", "Enterprise_Value",
+                   "Equity_Value", "Beta", "Status"]
+        if not symbols:
+            return pd.DataFrame(columns=columns)
+
+        infos = DCFValuation._load_universe(symbols, workers)
+        risk_free_rate = MacroEngine.get_risk_free_rate()
+        fcf_store = get_fundamentals_store().latest(["free_cash_flow"], symbols)["free_cash_flow"]
+
+        table = pd.DataFrame([{k: v for k, v in infos[s].items() if k != "summary"} for s in symbols],
+                             index=pd.Index(symbols, name="Ticker"))
+
+        def column(name: str, default: float = 0.0) -> np.ndarray:
+            if name not in table.columns:
+                return np.full(len(table), default)
+            return pd.to_numeric(table[name], errors='coerce').fillna(default).to_numpy(dtype=np.float64)
+
+        # FCF: kho fundamentals trước, thiếu thì lấy 'free_cash_flow' trong hồ sơ
+        fcf = fcf_store.reindex(symbols).to_numpy(dtype=np.float64)
+        fcf = np.where(np.isnan(fcf) | (fcf == 0), column("free_cash_flow", np.nan), fcf)
+        price = column("current_price")
+        shares = column("shares_outstanding")
+        beta = np.where(column("beta", 1.0) == 0, 1.0, column("beta", 1.0))
+
+        # Lõi định giá: WACC ~ Ke = Rf + Beta * ERP (cùng giả định với calculate())
+        wacc = np.maximum(risk_free_rate + beta * np.asarray(equity_risk_premium, dtype=np.float64),
+                          np.asarray(terminal_growth, dtype=np.float64) + 0.01)
+        enterprise_value = two_stage_dcf(np.nan_to_num(fcf), growth_rate_1_5, terminal_growth, wacc)
+        equity_value = enterprise_value + column("total_cash") - column("total_debt")
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fair_value = np.where(shares > 0, equity_value / shares, np.nan)
+            upside = np.where(price > 0, (fair_value - price) / price * 100.0, np.nan)
+
+        errors = table["error"].fillna("").astype(str).to_numpy() if "error" in table.columns else np.full(len(table), "")
+        status = np.select(
+            [errors != "", np.isnan(fcf), fcf <= 0, (shares <= 0) | (price <= 0)],
+            ["data error", "no FCF data", "negative FCF", "missing price/shares"],
+            default="ok",
+        )
+        valid = status == "ok"
+
+        result = pd.DataFrame({
+            "Name": table["name"] if "name" in table.columns else symbols,
+            "Price": price,
+            "Fair_Value": np.where(valid, fair_value, np.nan),
+            "Upside_%": np.where(valid, upside, np.nan),
+            "FCF": fcf,
+            "WACC": np.broadcast_to(wacc, fcf.shape),
+            "Enterprise_Value": np.where(valid, enterprise_value, np.nan),
+            "Equity_Value": np.where(valid, equity_value, np.nan),
+            "Beta": beta,
+            "Status": status,
+        }, index=table.index)
+        return result.sort_values("Upside_%", ascending=False, na_position="last")
+
@@ -0,0 +1,338 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/backend/coalesce.py
+ROLE: Single-Flight Request Coalescing & Stale-While-Revalidate (process-wide)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+"""
+
+import time
+import inspect
+import logging
+import threading
+import functools
+from collections import OrderedDict, Counter
+from typing import Callable, Optional, Dict, Any, Tuple, List
+
+from src.backend.disk_cache import get_disk_cache, cache_scope
+
+logger = logging.getLogger(__name__)
+
+# Người chờ (waiter) đợi tối đa chừng này giây cho lượt tải đang chạy trước khi tự tải
+DEFAULT_WAIT_TIMEOUT = 60.0
+
+
+def is_cacheable(value: Any) -> bool:
+    """Mặc định: không lưu None và các dict lỗi {"error": ...} của các Engine"""
+    if value is None:
+        return False
+    if isinstance(value, dict) and "error" in value:
+        return False
+    return True
+
+
+def _freeze(value: Any) -> Any:
+    """Chuyển tham số về dạng hashable để làm khóa (list -> tuple, dict -> tuple đã sắp xếp)"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, set):
+        return tuple(sorted(_freeze(v) for v in value))
+    return value
+
+
+class _Flight:
+    """1 lượt tải đang chạy; mọi người chờ cùng khóa dùng chung kết quả của nó"""
+
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class CoalescingCache:
+    """
+    Bộ đệm trong tiến trình (dùng chung mọi session Streamlit) cho 1 hàm tải dữ liệu:
+    - Single-flight: tại mỗi thời điểm chỉ có tối đa 1 lượt gọi upstream cho mỗi khóa.
+    - Stale-while-revalidate: trong khoảng (ttl, ttl + stale_ttl] trả ngay giá trị cũ
+      và làm mới ở 1 luồng nền duy nhất -> không còn "vách" độ trễ khi TTL hết hạn.
+    - Giá trị không đạt `cacheable` (None, dict lỗi) vẫn được chia sẻ cho người đang chờ
+      nhưng không được lưu; giá trị cũ (nếu có) được giữ nguyên.
+    - disk=True: trượt bộ nhớ -> đọc tầng đĩa dùng chung (src/backend/disk_cache.py) trước khi gọi upstream,
+      và single-flight liên tiến trình qua lease -> khởi động lại / nhiều replica không tải lại cùng dữ liệu.
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float = 0.0, max_entries: int = 1024,
+                 cacheable: Callable[[Any], bool] = is_cacheable, wait_timeout: float = DEFAULT_WAIT_TIMEOUT,
+                 disk: bool = False):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.cacheable = cacheable
+        self.wait_timeout = wait_timeout
+        self.disk = disk
+
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Tuple, _Flight] = {}
+        self._loaders: Dict[Tuple, Callable[[], Any]] = {}
+        self._lock = threading.Lock()
+        self.stats = Counter()
+        self.key_hits = Counter()
+
+    # ------------------------------------------------------------------
+    # LƯỢT TẢI
+    # ------------------------------------------------------------------
+    def _created_wall(self, key: Tuple) -> float:
+        """Thời điểm (wall clock) giá trị trong bộ nhớ được tạo; 0 nếu chưa có. Gọi khi đang giữ khóa."""
+        entry = self._entries.get(key)
+        return 0.0 if entry is None else time.time() - (time.monotonic() - entry[0])
+
+    def _fetch(self, key: Tuple, loader: Callable[[], Any], newer_than: Optional[float]) -> Tuple[Any, float, bool]:
+        """
+        Lấy giá trị qua tầng đĩa (nếu bật) -> (giá trị, thời điểm lưu theo monotonic, có phải bản cũ không).
+        newer_than=None: lượt lạnh, nhận cả bản cũ trên đĩa (rồi làm mới nền).
+        newer_than=t: lượt làm mới, chỉ nhận bản còn tươi được tạo sau t (VD: replica khác vừa tải).
+        """
+        try:
+            disk = get_disk_cache() if self.disk else None
+        except Exception as e:   # VD: FINCEPT_DISK_CACHE_MB không hợp lệ
+            logger.warning(f"DISK CACHE unavailable for {self.name} ({e}); fetching directly")
+            disk = None
+        if disk is None:
+            return loader(), time.monotonic(), False
+        try:
+            dkey = disk.make_key(f"{self.name}@{cache_scope()}", key)
+            now = time.time()
+            hit = disk.get(dkey)
+            if hit is not None and (newer_than is None or hit[0] > newer_than):
+                age = now - hit[0]
+                if age <= self.ttl or (newer_than is None and age <= self.ttl + self.stale_ttl):
+                    with self._lock:
+                        self.stats["disk_hits" if age <= self.ttl else "disk_stale_hits"] += 1
+                    return hit[1], time.monotonic() - age, age > self.ttl
+            leader = disk.acquire_lease(dkey, self.wait_timeout)
+            if not leader:
+                # Tiến trình khác đang tải cùng khóa -> chờ kết quả của nó trên đĩa
+                hit = disk.wait_for(dkey, max(newer_than or 0.0, now - self.ttl), self.wait_timeout)
+                if hit is not None:
+                    with self._lock:
+                        self.stats["disk_coalesced"] += 1
+                    return hit[1], time.monotonic() - (time.time() - hit[0]), False
+        except Exception as e:
+            logger.warning(f"DISK CACHE unavailable for {self.name} ({e}); fetching directly")
+            return loader(), time.monotonic(), False
+
+        try:
+            value = loader()
+            if self.cacheable(value):
+                try:
+                    disk.put(dkey, self.name, value, self.ttl + self.stale_ttl)
+                except Exception as e:
+                    logger.warning(f"DISK CACHE write failed for {self.name} ({e})")
+            return value, time.monotonic(), False
+        finally:
+            if leader:
+                try:
+                    disk.release_lease(dkey)
+                except Exception:
+                    pass   # lease tự hết hạn sau wait_timeout
+
+    def _load(self, key: Tuple, loader: Callable[[], Any], flight: _Flight, newer_than: Optional[float] = None) -> None:
+        """Chạy loader (người dẫn đầu hoặc luồng nền), lưu kết quả và đánh thức người chờ"""
+        stale = False
+        try:
+            flight.value, stored_at, stale = self._fetch(key, loader, newer_than)
+            with self._lock:
+                if self.cacheable(flight.value):
+                    self._entries[key] = (stored_at, flight.value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        evicted, _ = self._entries.popitem(last=False)
+                        self._loaders.pop(evicted, None)
+                else:
+                    self.stats["uncacheable"] += 1
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                self.stats["errors"] += 1
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+        if stale:
+            # Bản cũ lấy từ đĩa (VD: ngay sau khi khởi động lại) -> phục vụ luôn và làm mới ở nền
+            with self._lock:
+                if key not in self._inflight:
+                    self._refresh_in_background(key, loader)
+
+    def _refresh_in_background(self, key: Tuple, loader: Callable[[], Any]) -> None:
+        """Gọi khi đang giữ khóa"""
+        flight = _Flight()
+        self._inflight[key] = flight
+        self.stats["refreshes"] += 1
+        threading.Thread(target=self._load, args=(key, loader, flight, self._created_wall(key)),
+                         name=f"swr-{self.name}", daemon=True).start()
+
+    def get(self, key: Tuple, loader: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            self.key_hits[key] += 1
+            self._loaders[key] = loader
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry[0]
+                if age <= self.ttl:
+                    self.stats["hits"] += 1
+                    return entry[1]
+                if age <= self.ttl + self.stale_ttl:
+                    self.stats["stale_hits"] += 1
+                    if key not in self._inflight:
+                        self._refresh_in_background(key, loader)
+                    return entry[1]
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if leader:
+            self._load(key, loader, flight)
+        elif not flight.event.wait(self.wait_timeout):
+            # Lượt tải dẫn đầu bị treo -> tự tải để không chặn session quá lâu
+            logger.warning(f"Coalesced wait timed out for {self.name}{key}; fetching directly")
+            with self._lock:
+                self.stats["wait_timeouts"] += 1
+            return loader()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def refresh(self, key: Tuple, loader: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Tải lại chủ động (bỏ qua độ tươi) - dùng cho bộ prefetch nền.
+        Nếu khóa đang được tải thì chỉ chờ lượt đó, không gọi upstream lần nữa.
+        """
+        with self._lock:
+            loader = loader or self._loaders.get(key)
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                if loader is None:
+                    raise KeyError(f"No loader known for {self.name}{key}")
+                flight = _Flight()
+                self._inflight[key] = flight
+                self._loaders[key] = loader
+                self.stats["prefetches"] += 1
+                newer_than = self._created_wall(key)
+
+        if leader:
+            self._load(key, loader, flight, newer_than)
+        else:
+            flight.event.wait(self.wait_timeout)
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    # ------------------------------------------------------------------
+    # QUẢN TRỊ
+    # ------------------------------------------------------------------
+    def age(self, key: Tuple) -> Optional[float]:
+        """Tuổi (giây) của giá trị đã lưu, None nếu chưa có"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return None if entry is None else time.monotonic() - entry[0]
+
+    def is_inflight(self, key: Tuple) -> bool:
+        with self._lock:
+            return key in self._inflight
+
+    def hot_keys(self, limit: int = 20, min_hits: int = 2) -> List[Tuple[Tuple, int]]:
+        """Các khóa được yêu cầu nhiều nhất (đã có loader) kèm số lượt truy cập"""
+        with self._lock:
+            return [(k, n) for k, n in self.key_hits.most_common()
+                    if n >= min_hits and k in self._loaders][:limit]
+
+    def decay_hits(self) -> None:
+        """Giảm một nửa bộ đếm truy cập để độ "nóng" phản ánh nhu cầu gần đây"""
+        with self._lock:
+            for k in list(self.key_hits):
+                self.key_hits[k] //= 2
+                if self.key_hits[k] == 0:
+                    del self.key_hits[k]
+                    if k not in self._entries:
+                        self._loaders.pop(k, None)
+
+    def invalidate(self, key: Optional[Tuple] = None) -> None:
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "inflight": len(self._inflight),
+                **dict(self.stats),
+            }
+
+
+# Sổ đăng ký toàn cục: module.qualname -> bộ đệm (phục vụ thống kê & bảng chẩn đoán)
+_REGISTRY: Dict[str, CoalescingCache] = {}
+
+
+def coalesced(ttl: float, stale_ttl: float = 0.0, max_entries: int = 1024,
+              cacheable: Callable[[Any], bool] = is_cacheable, disk: bool = False) -> Callable:
+    """
+    Decorator single-flight + stale-while-revalidate cho các hàm tải dữ liệu dùng chung.
+    Đặt BÊN DƯỚI @st.cache_data: cache của Streamlit vẫn sao chép kết quả cho mỗi lần gọi,
+    còn lớp này đảm bảo khi cache lạnh chỉ có 1 lượt gọi upstream cho mỗi bộ tham số.
+    Khóa được chuẩn hóa theo chữ ký hàm (tham số mặc định được điền đầy đủ).
+    disk=True: thêm tầng đĩa dùng chung giữa các tiến trình (hạn cứng trên đĩa = ttl + stale_ttl).
+    """
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+        # Tên đầy đủ module.qualname: 2 hàm trùng qualname ở 2 module (VD: MarketDataEngine.get_historical_data
+        # của src.backend.market và utils.data_fetcher) không được dùng chung bộ đệm / khóa đĩa
+        name = f"{func.__module__}.{func.__qualname__}"
+        cache = CoalescingCache(name, ttl, stale_ttl, max_entries=max_entries, cacheable=cacheable, disk=disk)
+        _REGISTRY[name] = cache
+
+        def make_key(args, kwargs) -> Tuple:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return tuple((k, _freeze(v)) for k, v in bound.arguments.items())
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = make_key(args, kwargs)
+            return cache.get(key, lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        wrapper.key_for = lambda *args, **kwargs: make_key(args, kwargs)
+        wrapper.prefetch = lambda *args, **kwargs: cache.refresh(make_key(args, kwargs), lambda: func(*args, **kwargs))
+        wrapper.invalidate = lambda *args, **kwargs: cache.invalidate(make_key(args, kwargs) if args or kwargs else None)
+        return wrapper
+
+    return decorator
+
+
+def registered_caches() -> Dict[str, CoalescingCache]:
+    return dict(_REGISTRY)
+
+
+def coalesce_stats() -> Dict[str, Dict[str, Any]]:
+    """Thống kê hits / stale_hits / misses / coalesced / refreshes / errors của mọi hàm đã đăng ký"""
+    return {name: cache.snapshot() for name, cache in _REGISTRY.items()}
@@ -0,0 +1,281 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/backend/dbnomics.py
+ROLE: Concurrent DBNomics Client + Persistent Columnar Series Cache
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Optional, Dict, Any, List, Iterable, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from src.backend.providers import get_provider
+from src.backend.storage import PARQUET_AVAILABLE, atomic_write, atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_CACHE_DIR = os.path.join(ROOT_DIR, 'data', 'macro')
+DEFAULT_BASE_URL = "https://api.db.nomics.world/v22"
+
+# Số series gộp trong 1 request (giới hạn độ dài URL) và số request chạy song song tối đa
+CHUNK_SIZE = 25
+MAX_CONCURRENCY = 8
+
+# Trong khoảng này (giây) kể từ lần kiểm tra gần nhất, series trên đĩa được dùng ngay không hỏi upstream
+CHECK_TTL = 6 * 3600
+
+SeriesKey = Union[str, Tuple[str, str, str]]
+
+
+def series_id(key: SeriesKey) -> str:
+    """Chuẩn hóa về dạng 'PROVIDER/DATASET/SERIES' (VD: IMF/CPI/A.US.PCPIT_IX)"""
+    if isinstance(key, (tuple, list)):
+        return "/".join(str(part) for part in key)
+    return str(key).strip().strip("/")
+
+
+def parse_series_doc(doc: Dict[str, Any]) -> pd.DataFrame:
+    """Chuyển 1 document series của DBNomics thành DataFrame (index 'Date', cột 'Value' kiểu float)"""
+    periods = doc.get("period_start_day") or doc.get("period") or []
+    values = pd.to_numeric(pd.Series(doc.get("value") or [], dtype=object).replace("NA", np.nan), errors="coerce")
+    df = pd.DataFrame({"Date": pd.to_datetime(pd.Series(periods), errors="coerce"), "Value": values.to_numpy(dtype=np.float64)})
+    df = df.dropna(subset=["Date"]).set_index("Date").sort_index()
+    return df
+
+
+class MacroSeriesCache:
+    """
+    Kho series vĩ mô trên đĩa: mỗi series 1 file Parquet + 1 file index.json chung lưu
+    mốc cập nhật upstream (indexed_at) và thời điểm kiểm tra gần nhất của từng series.
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+
+    @property
+    def enabled(self) -> bool:
+        return PARQUET_AVAILABLE
+
+    def _path(self, sid: str) -> str:
+        safe = re.sub(r'[^A-Za-z0-9._-]', '_', sid)[:80]
+        digest = hashlib.sha1(sid.encode("utf-8")).hexdigest()[:10]
+        return os.path.join(self.root, f"{safe}.{digest}.parquet")
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        if self._index is None:
+            try:
+                with open(os.path.join(self.root, self.INDEX_FILE), "r", encoding="utf-8") as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _write_index(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        atomic_write_json(os.path.join(self.root, self.INDEX_FILE), self._index)
+
+    def entry(self, sid: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._load_index().get(sid)
+        if entry is not None and not os.path.exists(self._path(sid)):
+            return None
+        return entry
+
+    def load(self, sid: str) -> Optional[pd.DataFrame]:
+        if self.entry(sid) is None:
+            return None
+        try:
+            return pd.read_parquet(self._path(sid))
+        except Exception as e:
+            logger.warning(f"Macro cache: Lỗi đọc {sid}: {e}")
+            return None
+
+    def save(self, frames: Dict[str, Tuple[pd.DataFrame, Optional[str]]], checked_at: float) -> None:
+        """Ghi nguyên tử các series mới/thay đổi: {sid: (df, indexed_at)}"""
+        if not self.enabled or not frames:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock:
+            index = self._load_index()
+            for sid, (df, indexed_at) in frames.items():
+                try:
+                    atomic_write(self._path(sid), df.to_parquet)
+                    index[sid] = {"indexed_at": indexed_at, "checked_at": checked_at}
+                except Exception as e:
+                    logger.error(f"Macro cache: Lỗi ghi {sid}: {e}")
+            self._write_index()
+
+    def mark_checked(self, sids: Iterable[str], checked_at: float) -> None:
+        """Series không đổi upstream -> chỉ cập nhật thời điểm kiểm tra, không ghi lại dữ liệu"""
+        if not self.enabled:
+            return
+        with self._lock:
+            index = self._load_index()
+            touched = False
+            for sid in sids:
+                if sid in index:
+                    index[sid]["checked_at"] = checked_at
+                    touched = True
+            if touched:
+                self._write_index()
+
+
+class DBNomicsClient:
+    """
+    Client DBNomics tải hàng loạt series đồng thời (asyncio) qua endpoint /series?series_ids=...
+    - Series chưa có trên đĩa: tải đầy đủ ngay trong 1 vòng request song song.
+    - Series có trên đĩa nhưng đã quá check_ttl: hỏi mốc indexed_at (observations=0) cùng vòng đó,
+      chỉ tải lại quan sát của series có mốc thay đổi.
+    - Series đã kiểm tra trong check_ttl: đọc thẳng từ đĩa (khởi động lại không tốn request).
+    I/O đi qua provider dữ liệu đang hoạt động (phiên HTTP dùng chung / replay ngoại tuyến).
+    """
+
+    def __init__(self, base_url: Optional[str] = None, cache: Optional[MacroSeriesCache] = None,
+                 chunk_size: int = CHUNK_SIZE, max_concurrency: int = MAX_CONCURRENCY, check_ttl: float = CHECK_TTL):
+        self.base_url = (base_url or os.environ.get("FINCEPT_DBNOMICS_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.cache = cache or MacroSeriesCache()
+        self.chunk_size = chunk_size
+        self.max_concurrency = max_concurrency
+        self.check_ttl = check_ttl
+
+    # ------------------------------------------------------------------
+    # 1. HTTP (ASYNC)
+    # ------------------------------------------------------------------
+    async def _fetch_chunk(self, sids: List[str], observations: bool, semaphore: asyncio.Semaphore,
+                           stats: Dict[str, int]) -> Dict[str, Dict[str, Any]]:
+        params = {"series_ids": ",".join(sids), "observations": 1 if observations else 0, "limit": len(sids)}
+        async with semaphore:
+            try:
+                data = await asyncio.to_thread(get_provider().get_json, f"{self.base_url}/series", params)
+            except Exception as e:
+                logger.warning(f"DBNomics request failed for {len(sids)} series: {e}")
+                return {}
+        stats["requests"] = stats.get("requests", 0) + 1
+        docs = (data.get("series") or {}).get("docs") or []
+        return {f"{d['provider_code']}/{d['dataset_code']}/{d['series_code']}": d for d in docs}
+
+    async def _fetch_docs(self, sids: List[str], observations: bool, semaphore: asyncio.Semaphore,
+                          stats: Dict[str, int]) -> Dict[str, Dict[str, Any]]:
+        if not sids:
+            return {}
+        chunks = [sids[i:i + self.chunk_size] for i in range(0, len(sids), self.chunk_size)]
+        results = await asyncio.gather(*(self._fetch_chunk(c, observations, semaphore, stats) for c in chunks))
+        merged: Dict[str, Dict[str, Any]] = {}
+        for part in results:
+            merged.update(part)
+        return merged
+
+    # ------------------------------------------------------------------
+    # 2. BULK FETCH
+    # ------------------------------------------------------------------
+    async def fetch_many_async(self, keys: Iterable[SeriesKey], force: bool = False,
+                               stats: Optional[Dict[str, int]] = None) -> Dict[str, pd.DataFrame]:
+        """
+        stats: dict do người gọi truyền vào để nhận thống kê của riêng lượt gọi này
+        (client là singleton toàn tiến trình nên không giữ thống kê trên self).
+        """
+        sids = list(dict.fromkeys(series_id(k) for k in keys))
+        now = time.time()
+        stats = {} if stats is None else stats
+        stats.update({"requested": len(sids), "requests": 0})
+
+        results: Dict[str, pd.DataFrame] = {}
+        missing, due = [], []
+        due_entries: Dict[str, Dict[str, Any]] = {}   # Chụp 1 lần: mục có thể bị xóa khỏi đĩa giữa 2 vòng
+        for sid in sids:
+            entry = None if force else self.cache.entry(sid)
+            if entry is None:
+                missing.append(sid)
+            elif now - entry.get("checked_at", 0) > self.check_ttl:
+                due.append(sid)
+                due_entries[sid] = entry
+            else:
+                cached = self.cache.load(sid)
+                if cached is None:
+                    missing.append(sid)
+                else:
+                    results[sid] = cached
+        stats["from_disk"] = len(results)
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        # Vòng 1: tải đầy đủ series còn thiếu + hỏi mốc cập nhật của series đến hạn kiểm tra, song song
+        full_docs, markers = await asyncio.gather(
+            self._fetch_docs(missing, True, semaphore, stats),
+            self._fetch_docs(due, False, semaphore, stats),
+        )
+
+        changed = [sid for sid in due
+                   if sid in markers and markers[sid].get("indexed_at") != due_entries[sid].get("indexed_at")]
+        unchanged = [sid for sid in due if sid in markers and sid not in changed]
+
+        # Vòng 2 (chỉ khi upstream có thay đổi): tải lại quan sát của các series đó
+        if changed:
+            full_docs.update(await self._fetch_docs(changed, True, semaphore, stats))
+
+        to_save = {}
+        for sid, doc in full_docs.items():
+            df = parse_series_doc(doc)
+            results[sid] = df
+            to_save[sid] = (df, doc.get("indexed_at"))
+        self.cache.save(to_save, now)
+        self.cache.mark_checked(unchanged, now)
+
+        # Series không làm mới được (upstream lỗi / chưa đổi) -> dùng bản trên đĩa
+        for sid in due:
+            if sid not in results:
+                cached = self.cache.load(sid)
+                if cached is not None:
+                    results[sid] = cached
+
+        stats.update({"downloaded": len(full_docs), "unchanged": len(unchanged),
+                      "failed": len([s for s in sids if s not in results])})
+        logger.info(f"DBNOMICS: {stats}")
+        return {sid: results[sid] for sid in sids if sid in results}
+
+    def fetch_many(self, keys: Iterable[SeriesKey], force: bool = False,
+                   stats: Optional[Dict[str, int]] = None) -> Dict[str, pd.DataFrame]:
+        """Phiên bản đồng bộ cho Streamlit; nếu luồng hiện tại đã có event loop thì chạy ở luồng riêng"""
+        def coro_factory():
+            return self.fetch_many_async(keys, force=force, stats=stats)
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro_factory())
+
+        box: Dict[str, Any] = {}
+        worker = threading.Thread(target=lambda: box.setdefault("value", asyncio.run(coro_factory())))
+        worker.start()
+        worker.join()
+        return box.get("value", {})
+
+
+# Client dùng chung toàn tiến trình
+_CLIENT: Optional[DBNomicsClient] = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_dbnomics_client() -> DBNomicsClient:
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = DBNomicsClient()
+        return _CLIENT
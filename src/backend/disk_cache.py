@@ -0,0 +1,367 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/backend/disk_cache.py
+ROLE: Persistent Disk Cache Tier (dùng chung nhiều tiến trình / replica, giới hạn theo byte)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+Bố cục thư mục (mặc định data/cache/, đổi bằng FINCEPT_DISK_CACHE_DIR):
+    index.db                 SQLite (WAL): bảng entries (khóa -> digest, hạn dùng, lần truy cập) + leases
+    blobs/ab/abcdef....pkl   payload pickle, đặt tên theo digest nội dung (2 khóa cùng nội dung dùng chung 1 file)
+
+- Ghi: payload ghi ra file tạm rồi os.replace (nguyên tử), sau đó mới thêm dòng chỉ mục -> người đọc
+  ở tiến trình khác không bao giờ thấy file dở dang.
+- Hết hạn: mỗi mục mang thời điểm tạo (wall clock) + hạn cứng; người gọi tự quyết tươi / cũ theo tuổi.
+- Dọn: vượt ngân sách byte -> xóa mục hết hạn trước, rồi LRU theo lần truy cập cho tới 90% ngân sách.
+- Lease: khóa tải liên tiến trình (single-flight giữa các replica); người không giữ lease chờ kết quả trên đĩa.
+"""
+
+import os
+import time
+import pickle
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+import functools
+import inspect
+from typing import Callable, Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_CACHE_DIR = os.path.join(ROOT_DIR, 'data', 'cache')
+DEFAULT_MAX_MB = 1024
+
+# Đổi khi định dạng payload / khóa thay đổi -> mọi mục cũ tự trượt, không cần xóa tay
+CACHE_VERSION = 2
+
+# Chỉ ghi lại lần truy cập khi mục đã "nguội" quá chừng này giây (giảm ghi SQLite trên đường đọc)
+ACCESS_UPDATE_INTERVAL = 60.0
+# Sau khi vượt ngân sách, dọn xuống còn tỷ lệ này để không phải dọn ở mỗi lần ghi
+EVICT_TARGET_RATIO = 0.9
+# Chu kỳ thăm dò khi chờ tiến trình khác tải xong
+LEASE_POLL_INTERVAL = 0.1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key       TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    digest    TEXT NOT NULL,
+    size      INTEGER NOT NULL,
+    created   REAL NOT NULL,
+    expires   REAL NOT NULL,
+    accessed  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed);
+CREATE INDEX IF NOT EXISTS idx_entries_digest ON entries (digest);
+CREATE INDEX IF NOT EXISTS idx_entries_expires ON entries (expires);
+CREATE TABLE IF NOT EXISTS leases (
+    key     TEXT PRIMARY KEY,
+    owner   TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+class DiskCache:
+    """
+    Tầng cache bền vững bên dưới bộ đệm trong tiến trình (@coalesced / @disk_cached).
+    An toàn khi nhiều tiến trình cùng đọc / ghi: SQLite WAL + busy timeout cho chỉ mục,
+    file payload bất biến theo digest nội dung.
+    """
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Kết nối SQLite không được dùng lại sau fork -> mở lại khi PID đổi
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.root, "index.db"), timeout=30.0,
+                                         check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
+
+    # ------------------------------------------------------------------
+    # 1. KHÓA & PAYLOAD
+    # ------------------------------------------------------------------
+    @staticmethod
+    def make_key(namespace: str, key: Any) -> str:
+        """Khóa ổn định giữa các tiến trình: băm repr của (phiên bản, namespace, tham số đã chuẩn hóa)"""
+        return hashlib.sha256(repr((CACHE_VERSION, namespace, key)).encode("utf-8")).hexdigest()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], f"{digest}.pkl")
+
+    def _write_blob(self, payload: bytes) -> str:
+        digest = hashlib.blake2b(payload, digest_size=20).hexdigest()
+        path = self._blob_path(digest)
+        if os.path.exists(path):   # cùng nội dung đã có (khóa khác hoặc tiến trình khác vừa ghi)
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return digest
+
+    # ------------------------------------------------------------------
+    # 2. ĐỌC / GHI
+    # ------------------------------------------------------------------
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        """(thời điểm tạo - wall clock, giá trị) nếu mục còn trong hạn cứng, ngược lại None"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT digest, created FROM entries WHERE key = ? AND expires > ?", (key, now)).fetchone()
+            if row is None:
+                return None
+            digest, created = row
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ? AND accessed < ?",
+                         (now, key, now - ACCESS_UPDATE_INTERVAL))
+        try:
+            with open(self._blob_path(digest), "rb") as f:
+                return created, pickle.load(f)
+        except FileNotFoundError:
+            # Payload vừa bị tiến trình khác dọn -> coi như trượt và bỏ dòng chỉ mục mồ côi
+            with self._lock:
+                self._connect().execute("DELETE FROM entries WHERE key = ? AND digest = ?", (key, digest))
+            return None
+        except Exception as e:
+            logger.warning(f"DISK CACHE: unreadable payload {digest} ({e})")
+            return None
+
+    def put(self, key: str, namespace: str, value: Any, ttl: float) -> bool:
+        """Ghi giá trị với hạn cứng `ttl` giây. Giá trị không pickle được -> bỏ qua (False)."""
+        try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.debug(f"DISK CACHE: {namespace} value not picklable ({e})")
+            return False
+        if len(payload) > self.max_bytes * (1 - EVICT_TARGET_RATIO):
+            return False   # 1 payload không được chiếm quá phần dư của ngân sách
+        digest = self._write_blob(payload)
+        now = time.time()
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO entries (key, namespace, digest, size, created, expires, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (key, namespace, digest, len(payload), now, now + ttl, now))
+        self._enforce_budget()
+        return True
+
+    def wait_for(self, key: str, newer_than: float, timeout: float) -> Optional[Tuple[float, Any]]:
+        """Chờ tiến trình đang giữ lease ghi xong: trả về mục tạo sau `newer_than`, None nếu hết giờ"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            held = self.lease_held(key)
+            hit = self.get(key)
+            if hit is not None and hit[0] > newer_than:
+                return hit
+            if not held:   # người giữ lease đã xong mà không ghi (lỗi / giá trị không lưu) hoặc đã chết
+                return None
+            time.sleep(LEASE_POLL_INTERVAL)
+        return None
+
+    # ------------------------------------------------------------------
+    # 3. LEASE (SINGLE-FLIGHT LIÊN TIẾN TRÌNH)
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _owner() -> str:
+        return f"{os.getpid()}:{threading.get_ident()}"
+
+    def acquire_lease(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM leases WHERE key = ? AND expires <= ?", (key, now))
+                cur = conn.execute("INSERT OR IGNORE INTO leases (key, owner, expires) VALUES (?, ?, ?)",
+                                   (key, self._owner(), now + ttl))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return cur.rowcount == 1
+
+    def release_lease(self, key: str) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self._owner()))
+
+    def lease_held(self, key: str) -> bool:
+        with self._lock:
+            return self._connect().execute("SELECT 1 FROM leases WHERE key = ? AND expires > ?",
+                                           (key, time.time())).fetchone() is not None
+
+    # ------------------------------------------------------------------
+    # 4. DỌN DẸP THEO NGÂN SÁCH BYTE
+    # ------------------------------------------------------------------
+    def _total_bytes(self, conn: sqlite3.Connection) -> int:
+        row = conn.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM entries GROUP BY digest)").fetchone()
+        return int(row[0])
+
+    def _drop(self, conn: sqlite3.Connection, keys: list) -> int:
+        """Xóa các khóa và payload không còn khóa nào tham chiếu; trả về số byte giải phóng"""
+        if not keys:
+            return 0
+        marks = ", ".join("?" * len(keys))
+        digests = {d: s for d, s in conn.execute(f"SELECT digest, size FROM entries WHERE key IN ({marks})", keys)}
+        conn.execute(f"DELETE FROM entries WHERE key IN ({marks})", keys)
+        freed = 0
+        for digest, size in digests.items():
+            if conn.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone() is None:
+                try:
+                    os.unlink(self._blob_path(digest))
+                except FileNotFoundError:
+                    pass
+                freed += size
+        return freed
+
+    def _enforce_budget(self) -> None:
+        with self._lock:
+            conn = self._connect()
+            total = self._total_bytes(conn)
+            if total <= self.max_bytes:
+                return
+            target = self.max_bytes * EVICT_TARGET_RATIO
+            expired = [r[0] for r in conn.execute("SELECT key FROM entries WHERE expires <= ?", (time.time(),))]
+            total -= self._drop(conn, expired)
+            evicted = 0
+            while total > target:
+                # Chọn các mục nguội nhất vừa đủ số byte cần giải phóng (ước lượng theo size của từng khóa)
+                batch, planned = [], 0
+                for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed LIMIT 256"):
+                    batch.append(key)
+                    planned += size
+                    if total - planned <= target:
+                        break
+                if not batch:
+                    break
+                total -= self._drop(conn, batch)
+                evicted += len(batch)
+        logger.info(f"DISK CACHE: evicted {len(expired)} expired + {evicted} LRU entries ({total / 1e6:,.1f} MB kept)")
+
+    def clear(self) -> None:
+        with self._lock:
+            conn = self._connect()
+            self._drop(conn, [r[0] for r in conn.execute("SELECT key FROM entries")])
+            conn.execute("DELETE FROM leases")
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            conn = self._connect()
+            entries, expired = conn.execute("SELECT COUNT(*), COALESCE(SUM(expires <= ?), 0) FROM entries",
+                                            (time.time(),)).fetchone()
+            return {"root": self.root, "entries": int(entries), "expired": int(expired),
+                    "bytes": self._total_bytes(conn), "max_bytes": self.max_bytes}
+
+
+# =============================================================================
+# 5. SINGLETON & PHẠM VI KHÓA
+# =============================================================================
+_DISK: Optional[DiskCache] = None
+_DISK_LOCK = threading.Lock()
+
+
+def get_disk_cache() -> Optional[DiskCache]:
+    """
+    Tầng đĩa dùng chung toàn tiến trình, cấu hình qua biến môi trường:
+        FINCEPT_DISK_CACHE=0          -> tắt (chỉ còn cache bộ nhớ)
+        FINCEPT_DISK_CACHE_DIR=...    -> thư mục cache (đặt trên volume chung để các replica dùng chung)
+        FINCEPT_DISK_CACHE_MB=1024    -> ngân sách dung lượng
+    """
+    global _DISK
+    if os.environ.get("FINCEPT_DISK_CACHE", "1").strip().lower() in ("0", "false", "no", "off"):
+        return None
+    with _DISK_LOCK:
+        if _DISK is None:
+            _DISK = DiskCache(os.environ.get("FINCEPT_DISK_CACHE_DIR", DEFAULT_CACHE_DIR),
+                              int(float(os.environ.get("FINCEPT_DISK_CACHE_MB", DEFAULT_MAX_MB)) * 1024 * 1024))
+        return _DISK
+
+
+def cache_scope() -> str:
+    """Phạm vi dữ liệu hiện hành: khóa đĩa kèm nguồn dữ liệu để replay / yfinance không đọc nhầm của nhau"""
+    from src.backend.providers import get_provider
+    return get_provider().cache_scope
+
+
+def has_data(value: Any) -> bool:
+    """Mặc định không lưu đĩa: None, DataFrame / dict rỗng và dict lỗi {"error": ...}"""
+    if value is None or getattr(value, "empty", False):
+        return False
+    if isinstance(value, dict) and (not value or "error" in value):
+        return False
+    return True
+
+
+def disk_cached(ttl: float, cacheable: Callable[[Any], bool] = has_data) -> Callable:
+    """
+    Decorator đọc xuyên qua tầng đĩa cho hàm chỉ có @st.cache_data (không qua @coalesced).
+    Đặt BÊN DƯỚI @st.cache_data: trượt bộ nhớ -> thử đĩa (mục còn tươi) -> lease -> gọi hàm -> ghi đĩa.
+    """
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+        name = f"{func.__module__}.{func.__qualname__}"   # cùng quy ước không gian tên với @coalesced
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # Lỗi của tầng đĩa (SQLite bị khóa, đầy đĩa, thư mục hỏng...) không được làm hỏng lượt gọi:
+            # cảnh báo rồi gọi thẳng hàm gốc, giống CoalescingCache._fetch
+            leader = False
+            try:
+                disk = get_disk_cache()
+            except Exception as e:
+                logger.warning(f"DISK CACHE unavailable for {name} ({e}); fetching directly")
+                disk = None
+            if disk is None:
+                return func(*args, **kwargs)
+            try:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                key = disk.make_key(f"{name}@{cache_scope()}", tuple(bound.arguments.items()))
+                started = time.time()
+                hit = disk.get(key)
+                if hit is not None and started - hit[0] <= ttl:
+                    return hit[1]
+                leader = disk.acquire_lease(key, ttl=60.0)
+                if not leader:
+                    hit = disk.wait_for(key, started - ttl, timeout=60.0)
+                    if hit is not None:
+                        return hit[1]
+            except Exception as e:
+                logger.warning(f"DISK CACHE unavailable for {name} ({e}); fetching directly")
+                return func(*args, **kwargs)
+
+            try:
+                value = func(*args, **kwargs)
+                if cacheable(value):
+                    try:
+                        disk.put(key, name, value, ttl)
+                    except Exception as e:
+                        logger.warning(f"DISK CACHE write failed for {name} ({e})")
+                return value
+            finally:
+                if leader:
+                    try:
+                        disk.release_lease(key)
+                    except Exception:
+                        pass   # lease tự hết hạn sau 60s
+
+        return wrapper
+
+    return decorator
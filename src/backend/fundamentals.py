@@ -0,0 +1,256 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/backend/fundamentals.py
+ROLE: Normalized Fundamentals Store (SQLite, chỉ tiêu BCTC chuẩn hóa theo mã & kỳ)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Optional, Dict, Any, List, Iterable, Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_DB_PATH = os.path.join(ROOT_DIR, 'data', 'fundamentals.db')
+
+# Chỉ tiêu chuẩn -> (báo cáo nguồn, các nhãn dòng Yahoo Finance theo thứ tự ưu tiên)
+CANONICAL_ITEMS: Dict[str, tuple] = {
+    "total_revenue": ("income_statement", ("Total Revenue", "Operating Revenue")),
+    "gross_profit": ("income_statement", ("Gross Profit",)),
+    "operating_income": ("income_statement", ("Operating Income", "EBIT")),
+    "net_income": ("income_statement", ("Net Income", "Net Income Common Stockholders")),
+    "diluted_eps": ("income_statement", ("Diluted EPS",)),
+    "total_assets": ("balance_sheet", ("Total Assets",)),
+    "total_debt": ("balance_sheet", ("Total Debt",)),
+    "cash": ("balance_sheet", ("Cash And Cash Equivalents", "Cash Cash Equivalents And Short Term Investments")),
+    "stockholders_equity": ("balance_sheet", ("Stockholders Equity", "Total Equity Gross Minority Interest")),
+    "shares_outstanding": ("balance_sheet", ("Ordinary Shares Number", "Share Issued")),
+    "operating_cash_flow": ("cash_flow", ("Operating Cash Flow", "Total Cash From Operating Activities",
+                                          "Cash Flow From Continuing Operating Activities")),
+    "capital_expenditure": ("cash_flow", ("Capital Expenditure", "Capital Expenditures")),
+    "free_cash_flow": ("cash_flow", ("Free Cash Flow",)),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS facts (
+    ticker     TEXT NOT NULL,
+    freq       TEXT NOT NULL,
+    item       TEXT NOT NULL,
+    period_end TEXT NOT NULL,
+    value      REAL,
+    PRIMARY KEY (ticker, freq, item, period_end)
+);
+CREATE INDEX IF NOT EXISTS idx_facts_item ON facts (item, freq, period_end);
+CREATE TABLE IF NOT EXISTS filings (
+    ticker        TEXT NOT NULL,
+    freq          TEXT NOT NULL,
+    latest_period TEXT,
+    digest        TEXT,
+    updated_at    REAL,
+    PRIMARY KEY (ticker, freq)
+);
+"""
+
+
+def normalize_statements(statements: Dict[str, Optional[pd.DataFrame]]) -> pd.DataFrame:
+    """
+    Chuyển 3 BCTC thô (hàng = nhãn dòng, cột = kỳ) thành bảng dài chuẩn hóa
+    [item, period_end, value]. Thiếu 'Free Cash Flow' -> suy ra OCF + CapEx (CapEx ghi số âm).
+    """
+    rows: List[pd.DataFrame] = []
+    for item, (statement, labels) in CANONICAL_ITEMS.items():
+        frame = (statements or {}).get(statement)
+        if frame is None or frame.empty:
+            continue
+        label = next((l for l in labels if l in frame.index), None)
+        if label is None:
+            continue
+        series = pd.to_numeric(frame.loc[label], errors='coerce')
+        if isinstance(series, pd.DataFrame):   # nhãn trùng -> lấy dòng đầu
+            series = series.iloc[0]
+        rows.append(pd.DataFrame({
+            "item": item,
+            "period_end": pd.to_datetime(series.index, errors='coerce').strftime('%Y-%m-%d'),
+            "value": series.to_numpy(dtype=np.float64),
+        }))
+    if not rows:
+        return pd.DataFrame(columns=["item", "period_end", "value"])
+
+    facts = pd.concat(rows, ignore_index=True).dropna(subset=["period_end", "value"])
+    if "free_cash_flow" not in set(facts["item"]):
+        wide = facts.pivot_table(index="period_end", columns="item", values="value", aggfunc="first")
+        if {"operating_cash_flow", "capital_expenditure"} <= set(wide.columns):
+            fcf = (wide["operating_cash_flow"] + wide["capital_expenditure"]).dropna()
+            facts = pd.concat([facts, pd.DataFrame({"item": "free_cash_flow", "period_end": fcf.index,
+                                                    "value": fcf.to_numpy()})], ignore_index=True)
+    return facts.sort_values(["item", "period_end"]).reset_index(drop=True)
+
+
+class FundamentalsStore:
+    """
+    Kho chỉ tiêu cơ bản bền vững (SQLite): bảng `facts` dạng dài (ticker, freq, item, period_end, value)
+    và bảng `filings` lưu kỳ mới nhất + dấu vân tay nội dung của từng mã.
+    - ingest(): chỉ ghi khi có kỳ báo cáo mới / số liệu thay đổi (so dấu vân tay) -> cập nhật tăng dần.
+    - latest() / cross_section() / ratio(): truy vấn chéo cả rổ mã bằng 1 câu SQL, trả về
+      DataFrame (hàng = mã, cột = chỉ tiêu).
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    # ------------------------------------------------------------------
+    # 1. GHI (TĂNG DẦN)
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _digest(facts: pd.DataFrame) -> str:
+        payload = facts[["item", "period_end", "value"]].to_csv(index=False, float_format="%.6g")
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def ingest(self, ticker: str, statements: Dict[str, Optional[pd.DataFrame]], freq: str = "annual") -> bool:
+        """Chuẩn hóa & ghi BCTC của 1 mã. Trả về True nếu kho có thay đổi (kỳ mới / số liệu sửa đổi)."""
+        facts = normalize_statements(statements)
+        if facts.empty:
+            return False
+        ticker = ticker.upper()
+        digest = self._digest(facts)
+        latest_period = str(facts["period_end"].max())
+
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT digest FROM filings WHERE ticker = ? AND freq = ?", (ticker, freq)).fetchone()
+            if row is not None and row[0] == digest:
+                return False
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO facts (ticker, freq, item, period_end, value) VALUES (?, ?, ?, ?, ?)",
+                    [(ticker, freq, r.item, r.period_end, float(r.value)) for r in facts.itertuples(index=False)],
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO filings (ticker, freq, latest_period, digest, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (ticker, freq, latest_period, digest, time.time()),
+                )
+        logger.info(f"FUNDAMENTALS: {ticker} updated ({len(facts)} facts, latest period {latest_period})")
+        return True
+
+    # ------------------------------------------------------------------
+    # 2. TRUY VẤN
+    # ------------------------------------------------------------------
+    def _query(self, sql: str, params: Sequence[Any] = ()) -> pd.DataFrame:
+        with self._lock:
+            return pd.read_sql_query(sql, self._connect(), params=list(params))
+
+    @staticmethod
+    def _in_clause(column: str, values: Optional[Iterable[str]], params: List[Any]) -> str:
+        if values is None:
+            return ""
+        values = list(values)
+        params.extend(values)
+        return f" AND {column} IN ({', '.join('?' * len(values))})" if values else " AND 0"
+
+    def latest(self, items: Sequence[str], tickers: Optional[Iterable[str]] = None, freq: str = "annual") -> pd.DataFrame:
+        """Giá trị kỳ gần nhất của các chỉ tiêu cho mọi mã (hàng = mã, cột = chỉ tiêu)"""
+        params: List[Any] = [freq]
+        where = self._in_clause("item", items, params)
+        where += self._in_clause("ticker", [t.upper() for t in tickers] if tickers is not None else None, params)
+        df = self._query(
+            "SELECT ticker, item, value FROM ("
+            "  SELECT ticker, item, value, ROW_NUMBER() OVER (PARTITION BY ticker, item ORDER BY period_end DESC) AS rn"
+            f"  FROM facts WHERE freq = ?{where}"
+            ") WHERE rn = 1", params)
+        if df.empty:
+            return pd.DataFrame(columns=list(items), dtype=np.float64)
+        wide = df.pivot(index="ticker", columns="item", values="value")
+        return wide.reindex(columns=list(items)).astype(np.float64)
+
+    def latest_value(self, ticker: str, item: str, freq: str = "annual") -> Optional[float]:
+        value = self.latest([item], [ticker], freq).get(item)
+        if value is None or value.empty or pd.isna(value.iloc[0]):
+            return None
+        return float(value.iloc[0])
+
+    def cross_section(self, item: str, period_end: Optional[str] = None, freq: str = "annual") -> pd.Series:
+        """1 chỉ tiêu cho cả rổ mã: kỳ gần nhất của mỗi mã, hoặc đúng kỳ `period_end` (YYYY-MM-DD)"""
+        if period_end is None:
+            return self.latest([item], freq=freq)[item]
+        df = self._query("SELECT ticker, value FROM facts WHERE freq = ? AND item = ? AND period_end = ?",
+                         (freq, item, period_end))
+        return df.set_index("ticker")["value"].astype(np.float64).rename(item)
+
+    def ratio(self, numerator: str, denominator: str, tickers: Optional[Iterable[str]] = None,
+              freq: str = "annual") -> pd.Series:
+        """
+        Tỷ số cùng kỳ cho cả rổ mã (VD: FCF margin = free_cash_flow / total_revenue).
+        Ghép 2 chỉ tiêu theo (ticker, period_end) trước khi xếp hạng -> lấy kỳ gần nhất có ĐỦ cả hai,
+        không ghép tử số kỳ này với mẫu số kỳ khác. Mã không có kỳ chung nào bị loại.
+        """
+        params: List[Any] = [denominator, freq, numerator]
+        where = self._in_clause("n.ticker", [t.upper() for t in tickers] if tickers is not None else None, params)
+        df = self._query(
+            "SELECT ticker, num, den FROM ("
+            "  SELECT n.ticker AS ticker, n.value AS num, d.value AS den,"
+            "         ROW_NUMBER() OVER (PARTITION BY n.ticker ORDER BY n.period_end DESC) AS rn"
+            "  FROM facts n JOIN facts d"
+            "    ON d.ticker = n.ticker AND d.freq = n.freq AND d.period_end = n.period_end AND d.item = ?"
+            f"  WHERE n.freq = ? AND n.item = ?{where}"
+            ") WHERE rn = 1", params)
+        name = f"{numerator}/{denominator}"
+        if df.empty:
+            return pd.Series(dtype=np.float64, name=name)
+        df = df.set_index("ticker")
+        num, den = df["num"].astype(np.float64), df["den"].astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = num / den.where(den != 0)
+        return result.rename(name)
+
+    def history(self, ticker: str, items: Optional[Sequence[str]] = None, freq: str = "annual") -> pd.DataFrame:
+        """Chuỗi thời gian các chỉ tiêu của 1 mã (hàng = kỳ, cột = chỉ tiêu)"""
+        params: List[Any] = [ticker.upper(), freq]
+        where = self._in_clause("item", items, params)
+        df = self._query(f"SELECT item, period_end, value FROM facts WHERE ticker = ? AND freq = ?{where}", params)
+        if df.empty:
+            return pd.DataFrame()
+        wide = df.pivot(index="period_end", columns="item", values="value").sort_index()
+        wide.index = pd.to_datetime(wide.index)
+        return wide.reindex(columns=list(items)) if items else wide
+
+    def status(self) -> Dict[str, Any]:
+        df = self._query("SELECT COUNT(*) AS tickers, MAX(updated_at) AS updated_at FROM filings")
+        facts = self._query("SELECT COUNT(*) AS n FROM facts")
+        updated_at = df["updated_at"].iloc[0]
+        return {"tickers": int(df["tickers"].iloc[0]), "facts": int(facts["n"].iloc[0]),
+                "updated_at": float(updated_at) if pd.notna(updated_at) else None}
+
+
+# Kho dùng chung toàn tiến trình
+_STORE: Optional[FundamentalsStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_fundamentals_store() -> FundamentalsStore:
+    """FINCEPT_FUNDAMENTALS_DB trỏ tới file SQLite khác (mặc định data/fundamentals.db)"""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = FundamentalsStore(os.environ.get("FINCEPT_FUNDAMENTALS_DB", DEFAULT_DB_PATH))
+        return _STORE
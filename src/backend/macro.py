@@ -7,18 +7,23 @@ AUTHOR: Fincept Copilot (Emo)
 =============================================================================
 """
 
-import yfinance as yf
 import streamlit as st
 import logging
 from typing import Optional
 
+from src.backend.providers import get_provider
+from src.backend.coalesce import coalesced
+from src.backend.metrics import instrumented
+
 logger = logging.getLogger(__name__)
 
 class MacroEngine:
     """Động cơ xử lý dữ liệu Vĩ mô (Lãi suất, Lạm phát, GDP)"""
 
     @staticmethod
-    @st.cache_data(ttl=86400, show_spinner=False) # Lãi suất ít biến động, cache 1 ngày (86400s)
+    @st.cache_data(ttl=60, show_spinner=False)
+    @instrumented
+    @coalesced(ttl=3600, stale_ttl=86400, disk=True) # Lãi suất ít biến động; giá trị fallback chỉ bị ghim tối đa 1 giờ
     def get_risk_free_rate() -> float:
         """
         Lấy lợi suất Trái phiếu Chính phủ Mỹ 10 năm (^TNX) làm Risk-Free Rate.
@@ -26,9 +31,8 @@ class MacroEngine:
         """
         logger.info("FETCHING MACRO: US 10-Year Treasury Yield (^TNX)")
         try:
-            # Lấy mã ^TNX từ Yahoo Finance
-            tnx = yf.Ticker("^TNX")
-            df = tnx.history(period="5d")
+            # Lấy mã ^TNX từ Yahoo Finance (qua provider dữ liệu đang hoạt động)
+            df = get_provider().history("^TNX", period="5d")
             
             if df is not None and not df.empty:
                 # Lấy giá đóng cửa phiên gần nhất, chia 100 vì ^TNX hiển thị dạng % (VD: 4.2)
@@ -7,33 +7,59 @@ AUTHOR: Fincept Copilot (Emo)
 =============================================================================
 """
 
-import yfinance as yf
+import os
 import pandas as pd
 import numpy as np
 import streamlit as st
 import logging
-from typing import Optional, Dict, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Tuple, List
+
+from src.backend.storage import OHLCVStore
+from src.backend.providers import get_provider
+from src.backend.coalesce import coalesced
+from src.backend.disk_cache import disk_cached
+from src.backend.metrics import instrumented
+from src.backend.resample import ResampleCache, pick_base
+from src.backend.fundamentals import get_fundamentals_store
+from src.analytics.technical import StreamingIndicators
 
 # Thiết lập hệ thống ghi log
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Kho OHLCV cục bộ (Parquet) dùng chung cho toàn tiến trình
+_OHLCV_STORE = OHLCVStore()
+
+# Nến 1wk/1mo/3mo (và nến trong ngày thô hơn) được dựng cục bộ từ chuỗi gốc; FINCEPT_RESAMPLE=0 để tắt
+LOCAL_RESAMPLE = os.environ.get("FINCEPT_RESAMPLE", "1").strip().lower() not in ("0", "false", "no", "off")
+_RESAMPLE_CACHE = ResampleCache()
+
+
+def _has_statements(statements: Dict[str, Optional[pd.DataFrame]]) -> bool:
+    """Chỉ lưu cache BCTC khi tải được ít nhất 1 báo cáo (tránh ghim kết quả lỗi cả ngày)"""
+    return isinstance(statements, dict) and any(v is not None for v in statements.values())
+
+
 class MarketDataEngine:
     """
     Engine xử lý dữ liệu thị trường thời gian thực và lịch sử.
     Sử dụng Singleton pattern và Streamlit Caching để tối ưu hóa API calls.
     """
 
+    # Streamlit cache (60s) chỉ là lớp sao chép/ghi nhớ theo lượt chạy; độ tươi do lớp coalesced quyết định:
+    # hết TTL -> trả giá trị cũ ngay (stale-while-revalidate) và chỉ 1 luồng nền gọi lại upstream.
     @staticmethod
-    @st.cache_data(ttl=300, show_spinner=False) # Cache 5 phút
+    @st.cache_data(ttl=60, show_spinner=False)
+    @instrumented
+    @coalesced(ttl=300, stale_ttl=1800, disk=True) # Tươi 5 phút, phục vụ bản cũ thêm tối đa 30 phút khi đang làm mới
     def get_company_info(ticker: str) -> Dict[str, Any]:
         """
         Lấy hồ sơ doanh nghiệp và các chỉ số tài chính cơ bản.
         """
         logger.info(f"FETCHING INFO: {ticker}")
         try:
-            stock = yf.Ticker(ticker)
-            info = stock.info
+            info = get_provider().info(ticker)
             
             # Xử lý trường hợp ticker không hợp lệ
             if not info or 'symbol' not in info:
@@ -64,6 +90,12 @@ class MarketDataEngine:
                 "ps_ratio": info.get("priceToSalesTrailing12Months", 0.0),
                 "beta": info.get("beta", 1.0),
                 "dividend_yield": info.get("dividendYield", 0.0),
+
+                # Balance Sheet & Cash Flow (đầu vào cho mô hình DCF)
+                "total_debt": info.get("totalDebt", 0.0),
+                "total_cash": info.get("totalCash", 0.0),
+                "shares_outstanding": info.get("sharesOutstanding", 0),
+                "free_cash_flow": info.get("freeCashflow", 0.0),
                 
                 # 52 Week Data
                 "fiftyTwoWeekHigh": info.get("fiftyTwoWeekHigh", 0.0),
@@ -76,38 +108,126 @@ class MarketDataEngine:
             return {"error": str(e)}
 
     @staticmethod
-    @st.cache_data(ttl=300, show_spinner=False)
+    def _normalize_ohlcv(df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+        """Chuẩn hóa khung OHLCV thô từ yfinance (cột 'timestamp', bỏ timezone, ép kiểu số)"""
+        if df is None or df.empty:
+            return None
+
+        df = df.reset_index()
+
+        # Đồng nhất tên cột thời gian thành 'timestamp'
+        time_col = 'Datetime' if 'Datetime' in df.columns else 'Date'
+        if time_col in df.columns:
+            df.rename(columns={time_col: 'timestamp'}, inplace=True)
+
+        # Loại bỏ múi giờ (timezone tz-aware) để tránh lỗi khi vẽ biểu đồ Plotly
+        if pd.api.types.is_datetime64_any_dtype(df['timestamp']):
+            df['timestamp'] = df['timestamp'].dt.tz_localize(None)
+
+        # Đảm bảo các cột số liệu đúng định dạng số (cột đã là kiểu số thì chỉ lấp NaN, không ép kiểu lại)
+        numeric_cols = ['Open', 'High', 'Low', 'Close', 'Volume']
+        for col in numeric_cols:
+            if col in df.columns:
+                if pd.api.types.is_numeric_dtype(df[col]):
+                    if df[col].hasnans:
+                        df[col] = df[col].fillna(0.0)
+                else:
+                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0)
+
+        return df
+
+    @staticmethod
+    def _download_history(ticker: str, interval: str, period: Optional[str] = None, start: Optional[pd.Timestamp] = None) -> Optional[pd.DataFrame]:
+        """Gọi provider theo period (tải đầy đủ) hoặc theo start (chỉ tải phần đuôi)"""
+        provider = get_provider()
+        if start is not None:
+            df = provider.history(ticker, interval=interval, start=start.strftime('%Y-%m-%d'))
+        else:
+            df = provider.history(ticker, period=period, interval=interval)
+        return MarketDataEngine._normalize_ohlcv(df)
+
+    @staticmethod
+    def _coverage_meta(meta: Dict[str, Any], period: str) -> Dict[str, Any]:
+        """Ghi nhận độ sâu lịch sử mà kho đang phủ sau 1 lần tải đủ period (giữ mốc sớm nhất từng tải)"""
+        covered_from = OHLCVStore.period_start(period, pd.Timestamp.now())
+        if covered_from is not None and meta.get("covered_from"):
+            covered_from = min(covered_from, pd.Timestamp(meta["covered_from"]))
+        return {
+            "full_history": period == "max" or bool(meta.get("full_history")),
+            "covered_from": covered_from.isoformat() if covered_from is not None else None,
+        }
+
+    @staticmethod
+    def _rebuild_series(ticker: str, interval: str, meta: Dict[str, Any]) -> Optional[pd.DataFrame]:
+        """
+        Tải lại toàn bộ chuỗi sau corporate action với ĐÚNG độ sâu kho đang phủ
+        (full_history -> 'max', ngược lại từ mốc covered_from), không co về period của lượt gọi hiện tại.
+        """
+        if meta.get("full_history"):
+            return MarketDataEngine._download_history(ticker, interval, period="max")
+        return MarketDataEngine._download_history(ticker, interval, start=pd.Timestamp(meta["covered_from"]))
+
+    @staticmethod
+    def _sync_store(ticker: str, period: str, interval: str) -> Optional[pd.DataFrame]:
+        """
+        Đồng bộ kho Parquet cục bộ với nhà cung cấp:
+        - Chưa có dữ liệu hoặc chưa đủ sâu -> tải đủ period rồi gộp vào kho.
+        - Đã đủ sâu -> chỉ hỏi các nến mới hơn timestamp cuối cùng (tail-only refresh).
+        Sau đó cắt đúng period yêu cầu từ chuỗi đã lưu.
+        """
+        stored = _OHLCV_STORE.load(ticker, interval)
+        meta = _OHLCV_STORE.load_meta(ticker, interval)
+
+        if stored is None or stored.empty or not OHLCVStore.covers(meta, period):
+            fresh = MarketDataEngine._download_history(ticker, interval, period=period)
+            if fresh is None:
+                return OHLCVStore.slice_period(stored, period) if stored is not None else None
+            merged = OHLCVStore.merge(stored, fresh)
+            meta = MarketDataEngine._coverage_meta(meta, period)
+        else:
+            last_ts = stored['timestamp'].iloc[-1]
+            logger.info(f"OHLCV STORE: {ticker} | {interval} | tail refresh from {last_ts}")
+            tail = MarketDataEngine._download_history(ticker, interval, start=last_ts)
+
+            # Có cổ tức / chia tách mới -> giá điều chỉnh quá khứ đã thay đổi, phải tải lại toàn bộ
+            if OHLCVStore.has_corporate_action(tail, after=last_ts):
+                logger.info(f"OHLCV STORE: {ticker} | corporate action detected, rebuilding series")
+                fresh = MarketDataEngine._rebuild_series(ticker, interval, meta)
+                if fresh is not None:
+                    _OHLCV_STORE.save(ticker, interval, fresh, dict(meta, refreshed_at=pd.Timestamp.now().isoformat()))
+                    return OHLCVStore.slice_period(fresh, period)
+
+            merged = OHLCVStore.merge(stored, tail)
+
+        meta["refreshed_at"] = pd.Timestamp.now().isoformat()
+        _OHLCV_STORE.save(ticker, interval, merged, meta)
+        return OHLCVStore.slice_period(merged, period)
+
+    @staticmethod
+    @st.cache_data(ttl=60, show_spinner=False)
+    @instrumented
+    @coalesced(ttl=300, stale_ttl=1800, disk=True)
     def get_historical_data(ticker: str, period: str = "1y", interval: str = "1d") -> Optional[pd.DataFrame]:
         """
         Lấy dữ liệu OHLCV (Open, High, Low, Close, Volume) để vẽ biểu đồ.
         Hỗ trợ các khung thời gian: 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max
         Hỗ trợ các interval: 1m, 2m, 5m, 15m, 30m, 60m, 90m, 1h, 1d, 5d, 1wk, 1mo, 3mo
+        Dữ liệu được lưu bền vững trong data/ohlcv/ nên mỗi lần hết TTL chỉ tải các nến mới.
+        Nến 1wk/1mo/3mo được dựng cục bộ từ chuỗi 1d (xem _derive_interval).
         """
-        logger.info(f"FETCHING OHLCV: {ticker} | Period: {period} | Interval: {interval}")
         try:
-            stock = yf.Ticker(ticker)
-            df = stock.history(period=period, interval=interval)
-            
+            derived = MarketDataEngine._derive_interval(ticker, period, interval)
+            if derived is not None:
+                return derived
+
+            logger.info(f"FETCHING OHLCV: {ticker} | Period: {period} | Interval: {interval}")
+            if _OHLCV_STORE.enabled:
+                df = MarketDataEngine._sync_store(ticker, period, interval)
+            else:
+                df = MarketDataEngine._download_history(ticker, interval, period=period)
+
             if df is None or df.empty:
                 return None
-                
-            # Chuẩn hóa dữ liệu
-            df.reset_index(inplace=True)
-            
-            # Đồng nhất tên cột thời gian thành 'timestamp'
-            time_col = 'Datetime' if 'Datetime' in df.columns else 'Date'
-            if time_col in df.columns:
-                df.rename(columns={time_col: 'timestamp'}, inplace=True)
-                
-            # Loại bỏ múi giờ (timezone tz-aware) để tránh lỗi khi vẽ biểu đồ Plotly
-            if pd.api.types.is_datetime64_any_dtype(df['timestamp']):
-                df['timestamp'] = df['timestamp'].dt.tz_localize(None)
-
-            # Đảm bảo các cột số liệu đúng định dạng float
-            numeric_cols = ['Open', 'High', 'Low', 'Close', 'Volume']
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0)
 
             return df
         except Exception as e:
@@ -115,7 +235,49 @@ class MarketDataEngine:
             return None
 
     @staticmethod
-    @st.cache_data(ttl=86400, show_spinner=False) # Cache 1 ngày cho BCTC
+    def _derive_interval(ticker: str, period: str, interval: str) -> Optional[pd.DataFrame]:
+        """
+        Dựng nến `interval` từ chuỗi gốc mịn hơn thay vì tải riêng từ upstream:
+        1wk/1mo/3mo từ 1d; nến trong ngày từ interval mịn nhất chia hết mà kho đã phủ đủ period.
+        Chuỗi gốc đi qua chính lớp coalesced của get_historical_data, nên đổi RESOLUTION
+        1d -> 1wk -> 1mo chỉ tốn 1 lượt tải cho chuỗi 1d. None -> không dựng được.
+        """
+        if not LOCAL_RESAMPLE:
+            return None
+
+        def stored_covers(base: str) -> bool:
+            return _OHLCV_STORE.enabled and OHLCVStore.covers(_OHLCV_STORE.load_meta(ticker, base), period)
+
+        base = pick_base(interval, stored_covers)
+        if base is None:
+            return None
+
+        load_base = getattr(MarketDataEngine.get_historical_data, "__wrapped__", MarketDataEngine.get_historical_data)
+        base_df = load_base(ticker, period, base)
+        if base_df is None or base_df.empty:
+            return None
+        logger.info(f"RESAMPLE OHLCV: {ticker} | Period: {period} | {base} -> {interval}")
+        return _RESAMPLE_CACHE.get(ticker, base, interval, base_df)
+
+    @staticmethod
+    @instrumented
+    def get_streaming_indicators(ticker: str, interval: str = "1d") -> Optional[StreamingIndicators]:
+        """
+        Trạng thái chỉ báo tăng dần cho chuỗi đã lưu trong kho OHLCV.
+        Snapshot được lưu cạnh file Parquet nên lần sau chỉ phải nạp các nến mới.
+        """
+        history = _OHLCV_STORE.load(ticker, interval)
+        if history is None or history.empty:
+            return None
+        state = _OHLCV_STORE.load_state(ticker, interval)
+        engine = StreamingIndicators.resume(history, state)
+        _OHLCV_STORE.save_state(ticker, interval, engine.snapshot())
+        return engine
+
+    @staticmethod
+    @st.cache_data(ttl=60, show_spinner=False)
+    @instrumented
+    @coalesced(ttl=86400, stale_ttl=6 * 86400, cacheable=_has_statements, disk=True) # BCTC tươi 1 ngày
     def get_financial_statements(ticker: str) -> Dict[str, Optional[pd.DataFrame]]:
         """
         Lấy 3 báo cáo tài chính cốt lõi (cho module Định giá DCF sau này):
@@ -125,12 +287,14 @@ class MarketDataEngine:
         """
         logger.info(f"FETCHING FINANCIALS: {ticker}")
         try:
-            stock = yf.Ticker(ticker)
-            return {
-                "income_statement": stock.financials,
-                "balance_sheet": stock.balance_sheet,
-                "cash_flow": stock.cashflow
-            }
+            statements = get_provider().financials(ticker)
+            if _has_statements(statements):
+                # Chuẩn hóa vào kho fundamentals (chỉ ghi khi có kỳ báo cáo mới / số liệu sửa đổi)
+                try:
+                    get_fundamentals_store().ingest(ticker, statements)
+                except Exception as e:
+                    logger.warning(f"Fundamentals store ingest failed for {ticker}: {e}")
+            return statements
         except Exception as e:
             logger.error(f"Error fetching financials for {ticker}: {str(e)}")
             return {
@@ -139,6 +303,151 @@ class MarketDataEngine:
                 "cash_flow": None
             }
 
+    @staticmethod
+    @instrumented
+    def sync_fundamentals(tickers: List[str], workers: int = 8) -> Dict[str, int]:
+        """
+        Nạp BCTC của cả rổ mã vào kho fundamentals (song song, qua lớp coalesced 1 ngày):
+        sau bước này các truy vấn chéo (VD: FCF margin của 500 mã) chỉ là 1 lượt đọc SQLite.
+        """
+        symbols = list(dict.fromkeys(t.strip().upper() for t in tickers if t and t.strip()))
+        fetch = getattr(MarketDataEngine.get_financial_statements, "__wrapped__",
+                        MarketDataEngine.get_financial_statements)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            loaded = sum(1 for statements in pool.map(fetch, symbols) if _has_statements(statements))
+        return {"requested": len(symbols), "loaded": loaded}
+
+    @staticmethod
+    @st.cache_data(ttl=300, show_spinner=False)
+    @instrumented
+    @disk_cached(ttl=300)
+    def get_batch_history(tickers: List[str], period: str = "1y", interval: str = "1d") -> Dict[str, pd.DataFrame]:
+        """
+        Tải OHLCV cho nhiều mã trong MỘT lệnh gọi batch của provider (yf.download đa luồng với YFinance).
+        Trả về dict {ticker: DataFrame chuẩn hóa}. Mã không có dữ liệu sẽ bị bỏ qua.
+        """
+        symbols = list(dict.fromkeys(t.strip().upper() for t in tickers if t and t.strip()))
+        if not symbols:
+            return {}
+
+        logger.info(f"FETCHING BATCH OHLCV: {len(symbols)} tickers | Period: {period} | Interval: {interval}")
+        try:
+            raw = get_provider().download(symbols, period=period, interval=interval)
+        except Exception as e:
+            logger.error(f"Error fetching batch history: {str(e)}")
+            return {}
+
+        if raw is None or raw.empty:
+            return {}
+
+        if isinstance(raw.columns, pd.MultiIndex):
+            available = set(raw.columns.get_level_values(0))
+            frames = {symbol: raw[symbol] for symbol in symbols if symbol in available}
+        elif len(symbols) == 1:
+            # yf.download 1 mã (yfinance bản cũ) trả cột phẳng Open/High/... không có tầng ticker
+            frames = {symbols[0]: raw}
+        else:
+            logger.warning(f"Batch history: unexpected flat columns for {len(symbols)} tickers")
+            frames = {}
+
+        result = {}
+        for symbol, frame in frames.items():
+            df = MarketDataEngine._normalize_ohlcv(frame.dropna(how='all'))
+            if df is not None:
+                result[symbol] = df
+        return result
+
+    @staticmethod
+    @instrumented
+    def get_returns_matrix(tickers: List[str], period: str = "1y", interval: str = "1d", log_returns: bool = False) -> pd.DataFrame:
+        """
+        Ma trận lợi suất (hàng = phiên, cột = tài sản) đã căn chỉnh trên cùng một trục thời gian.
+        Chỉ giữ các phiên mà MỌI tài sản đều có giá (VD: bỏ cuối tuần của Crypto khi trộn với cổ phiếu).
+        """
+        history = MarketDataEngine.get_batch_history(tickers, period, interval)
+        if not history:
+            return pd.DataFrame()
+
+        prices = pd.DataFrame({
+            symbol: df.set_index('timestamp')['Close'] for symbol, df in history.items()
+        })
+        # Giữ đúng thứ tự tài sản người dùng nhập
+        ordered = [s for s in dict.fromkeys(t.strip().upper() for t in tickers) if s in prices.columns]
+        prices = prices[ordered].replace(0.0, np.nan).dropna(how='any').astype(np.float64)
+
+        if log_returns:
+            returns = np.log(prices / prices.shift(1))
+        else:
+            returns = prices.pct_change()
+        return returns.iloc[1:]
+
+    @staticmethod
+    @instrumented
+    def get_price_panel(tickers: List[str], period: str = "1y", interval: str = "1d",
+                        fields: Tuple[str, ...] = ("Close", "High", "Low"), max_age: float = 3600.0,
+                        workers: int = 8) -> Dict[str, pd.DataFrame]:
+        """
+        Bảng giá 2 chiều cho máy quét: {field: DataFrame (hàng = thời gian, cột = tài sản)}, float64.
+        - Ưu tiên kho Parquet cục bộ: đọc song song, chỉ các cột cần thiết.
+        - Mã chưa có / chưa đủ sâu / làm mới lâu hơn max_age giây -> tải chung 1 batch rồi ghi vào kho.
+        Không loại bỏ phiên thiếu dữ liệu (NaN) - mỗi cột giữ đúng lịch giao dịch riêng của nó.
+        """
+        symbols = list(dict.fromkeys(t.strip().upper() for t in tickers if t and t.strip()))
+        if not symbols:
+            return {}
+
+        columns = ['timestamp', *fields]
+        now = pd.Timestamp.now()
+
+        def load_local(symbol: str) -> Tuple[str, Optional[Dict[str, np.ndarray]]]:
+            meta = _OHLCV_STORE.load_meta(symbol, interval)
+            refreshed = meta.get("refreshed_at")
+            if not OHLCVStore.covers(meta, period) or refreshed is None \
+                    or (now - pd.Timestamp(refreshed)).total_seconds() > max_age:
+                return symbol, None
+            return symbol, _OHLCV_STORE.load_arrays(symbol, interval, columns)
+
+        frames: Dict[str, Dict[str, np.ndarray]] = {}
+        if _OHLCV_STORE.enabled:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for symbol, arrays in pool.map(load_local, symbols):
+                    if arrays is not None and len(arrays['timestamp']):
+                        frames[symbol] = arrays
+
+        missing = [s for s in symbols if s not in frames]
+        if missing:
+            logger.info(f"PRICE PANEL: {len(frames)} local, {len(missing)} via batch download")
+            for symbol, df in MarketDataEngine.get_batch_history(missing, period, interval).items():
+                if _OHLCV_STORE.enabled:
+                    stored = _OHLCV_STORE.load(symbol, interval)
+                    meta = MarketDataEngine._coverage_meta(_OHLCV_STORE.load_meta(symbol, interval), period)
+                    meta["refreshed_at"] = now.isoformat()
+                    _OHLCV_STORE.save(symbol, interval, OHLCVStore.merge(stored, df), meta)
+                frames[symbol] = {col: df[col].to_numpy() for col in columns}
+
+        ordered = [s for s in symbols if s in frames]
+        if not ordered:
+            return {}
+
+        # Ghép panel trực tiếp bằng numpy (tránh chi phí căn chỉnh index của pandas cho hàng trăm cột)
+        arrays = {}
+        for symbol in ordered:
+            data = frames[symbol]
+            ts = data['timestamp'].astype('datetime64[ns]', copy=False)
+            start = OHLCVStore.period_start(period, pd.Timestamp(ts[-1]))
+            pos = 0 if start is None else int(np.searchsorted(ts, np.datetime64(start, 'ns')))
+            values = np.column_stack([data[field] for field in fields]).astype(np.float64, copy=False)
+            arrays[symbol] = (ts[pos:], values[pos:])
+
+        index = np.unique(np.concatenate([ts for ts, _ in arrays.values()]))
+        cube = np.full((len(fields), len(index), len(ordered)), np.nan)
+        for j, symbol in enumerate(ordered):
+            ts, values = arrays[symbol]
+            cube[:, np.searchsorted(index, ts), j] = values.T
+
+        time_index = pd.DatetimeIndex(index, name='timestamp')
+        return {field: pd.DataFrame(cube[i], index=time_index, columns=ordered) for i, field in enumerate(fields)}
+
     @staticmethod
     def calculate_price_change(current: float, previous: float) -> Tuple[float, float]:
         """Tính toán biến động giá (Số tuyệt đối & Phần trăm)"""
@@ -0,0 +1,440 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/backend/metrics.py
+ROLE: Hot-Path Metrics (histogram độ trễ, bộ đếm lỗi / byte upstream, xuất Prometheus)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+"""
+
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional, Dict, Any, List, Tuple, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.backend.profiling import stage
+
+logger = logging.getLogger(__name__)
+
+# Ngưỡng bucket (giây) cho histogram độ trễ: từ trúng cache bộ nhớ (<1ms) tới upstream chậm (>10s)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+# =============================================================================
+# 1. KIỂU METRIC
+# =============================================================================
+class Histogram:
+    """Histogram bucket cố định (kiểu Prometheus): đếm theo bucket + tổng + số lần quan sát"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # bucket cuối = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Ước lượng phân vị bằng nội suy tuyến tính trong bucket (giống histogram_quantile)"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            if cumulative + n >= rank and n > 0:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):   # rơi vào +Inf -> trả ngưỡng hữu hạn lớn nhất
+                    return self.buckets[-1]
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / n
+            cumulative += n
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """
+    Sổ metric trong tiến trình (dùng chung mọi session Streamlit).
+    Counter & Histogram được định danh bằng (tên, nhãn); mọi thao tác ghi chỉ giữ khóa vài micro giây.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelSet, float]] = {}
+        self._histograms: Dict[str, Dict[LabelSet, Histogram]] = {}
+        self._help: Dict[str, str] = {}
+
+    @staticmethod
+    def _labels(labels: Optional[Dict[str, Any]]) -> LabelSet:
+        return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, labels: Optional[Dict[str, Any]] = None, value: float = 1.0) -> None:
+        key = self._labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None) -> None:
+        key = self._labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram()
+            hist.observe(value)
+
+    def counter_value(self, name: str, **labels: Any) -> float:
+        """Tổng các chuỗi của counter khớp với các nhãn đã cho"""
+        wanted = set(self._labels(labels))
+        with self._lock:
+            return sum(v for k, v in self._counters.get(name, {}).items() if wanted <= set(k))
+
+    def histograms(self, name: str) -> Dict[LabelSet, Histogram]:
+        with self._lock:
+            return dict(self._histograms.get(name, {}))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    # ------------------------------------------------------------------
+    # XUẤT PROMETHEUS TEXT FORMAT (v0.0.4)
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _fmt_labels(labels: LabelSet, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = labels + extra
+        if not pairs:
+            return ""
+        escape = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self) -> List[str]:
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{self._fmt_labels(labels)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, hist in sorted(series.items()):
+                    cumulative = 0
+                    for bound, n in zip(hist.buckets + (float("inf"),), hist.counts):
+                        cumulative += n
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{name}_bucket{self._fmt_labels(labels, (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{self._fmt_labels(labels)} {hist.sum:.6f}")
+                    lines.append(f"{name}_count{self._fmt_labels(labels)} {hist.count}")
+        return lines
+
+
+REGISTRY = MetricsRegistry()
+REGISTRY.describe("fincept_engine_calls_total", "Engine entry point calls by outcome (ok / empty / error)")
+REGISTRY.describe("fincept_engine_latency_seconds", "Engine entry point latency")
+REGISTRY.describe("fincept_upstream_requests_total", "Upstream data provider requests by outcome")
+REGISTRY.describe("fincept_upstream_latency_seconds", "Upstream data provider request latency")
+REGISTRY.describe("fincept_upstream_bytes_total", "Approximate payload bytes received from upstream providers")
+
+
+# =============================================================================
+# 2. ĐO ĐẠC (DECORATOR & HÀM GHI)
+# =============================================================================
+def _outcome(result: Any) -> str:
+    """Các Engine báo lỗi bằng None / DataFrame rỗng / dict {"error": ...} thay vì raise"""
+    if result is None:
+        return "empty"
+    if isinstance(result, dict) and "error" in result:
+        return "error"
+    if isinstance(result, (pd.DataFrame, pd.Series)) and result.empty:
+        return "empty"
+    return "ok"
+
+
+def instrumented(func: Callable) -> Callable:
+    """
+    Đo 1 entry point của Engine: histogram độ trễ + bộ đếm theo kết quả (ok / empty / error).
+    Với hàm có @st.cache_data, đặt NGAY DƯỚI @st.cache_data (trên @coalesced): chỉ đo các lượt
+    đi qua lớp coalesce (trúng / cũ / trượt), lượt trúng st.cache_data là bản sao bộ nhớ.
+    functools.wraps sao chép .cache / .key_for / .prefetch của @coalesced lên lớp bọc nên bộ prefetch vẫn dùng được.
+    """
+    labels = {"fn": func.__qualname__}
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with stage(labels["fn"]):   # hiện thành 1 giai đoạn khi lượt chạy trang đang được profile
+                result = func(*args, **kwargs)
+        except BaseException:
+            REGISTRY.observe("fincept_engine_latency_seconds", time.perf_counter() - start, labels)
+            REGISTRY.inc("fincept_engine_calls_total", {**labels, "outcome": "error"})
+            raise
+        REGISTRY.observe("fincept_engine_latency_seconds", time.perf_counter() - start, labels)
+        REGISTRY.inc("fincept_engine_calls_total", {**labels, "outcome": _outcome(result)})
+        return result
+
+    return wrapper
+
+
+def payload_bytes(value: Any) -> int:
+    """Ước lượng kích thước payload (rẻ): bộ nhớ của DataFrame, độ dài JSON của dict / list"""
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(index=True)) if isinstance(value, pd.Series) else int(value.nbytes)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict) and any(isinstance(v, (pd.DataFrame, pd.Series)) for v in value.values()):
+        return sum(payload_bytes(v) for v in value.values())
+    if isinstance(value, (dict, list, tuple)):
+        try:
+            return len(json.dumps(value, default=str))
+        except (TypeError, ValueError):
+            return 0
+    return 0
+
+
+def record_upstream(provider: str, method: str, seconds: float, payload: Any = None,
+                    error: Optional[BaseException] = None) -> None:
+    labels = {"provider": provider, "method": method}
+    REGISTRY.observe("fincept_upstream_latency_seconds", seconds, labels)
+    REGISTRY.inc("fincept_upstream_requests_total", {**labels, "outcome": "error" if error is not None else _outcome(payload)})
+    if error is None:
+        REGISTRY.inc("fincept_upstream_bytes_total", labels, payload_bytes(payload))
+
+
+_UPSTREAM_DEPTH = threading.local()
+
+
+def upstream_call(provider: str, method: str, func: Callable) -> Callable:
+    """
+    Bọc 1 phương thức của provider. Chỉ lượt gọi NGOÀI CÙNG được ghi nhận
+    (VD: quote() mặc định gọi history() bên trong -> tính 1 request, không đếm đôi byte).
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_UPSTREAM_DEPTH, "value", 0)
+        if depth:
+            return func(*args, **kwargs)
+        _UPSTREAM_DEPTH.value = 1
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            record_upstream(provider, method, time.perf_counter() - start, error=e)
+            raise
+        finally:
+            _UPSTREAM_DEPTH.value = 0
+        record_upstream(provider, method, time.perf_counter() - start, result)
+        return result
+
+    wrapper.upstream_impl = func
+    return wrapper
+
+
+# =============================================================================
+# 3. TỔNG HỢP CHO BẢNG CHẨN ĐOÁN
+# =============================================================================
+def _series_summary(hists: Dict[LabelSet, Histogram], counter: str, key: str) -> pd.DataFrame:
+    rows = []
+    for labels, hist in hists.items():
+        match = dict(labels)
+        calls = hist.count
+        errors = REGISTRY.counter_value(counter, **match, outcome="error")
+        empty = REGISTRY.counter_value(counter, **match, outcome="empty")
+        row = {
+            **match,
+            "Calls": calls,
+            "Errors": int(errors),
+            "Empty": int(empty),
+            "Error_%": errors / calls * 100.0 if calls else 0.0,
+            "Mean_ms": hist.sum / calls * 1e3 if calls else np.nan,
+            "P50_ms": (hist.quantile(0.50) or np.nan) * 1e3,
+            "P95_ms": (hist.quantile(0.95) or np.nan) * 1e3,
+            "P99_ms": (hist.quantile(0.99) or np.nan) * 1e3,
+        }
+        if counter == "fincept_upstream_requests_total":
+            row["MB"] = REGISTRY.counter_value("fincept_upstream_bytes_total", **match) / 1e6
+        rows.append(row)
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(rows).set_index(key).sort_values("Calls", ascending=False)
+
+
+def engine_summary() -> pd.DataFrame:
+    """1 hàng / entry point: Calls, Errors, Empty, Error_%, Mean/P50/P95/P99 (ms)"""
+    return _series_summary(REGISTRY.histograms("fincept_engine_latency_seconds"), "fincept_engine_calls_total", "fn")
+
+
+def upstream_summary() -> pd.DataFrame:
+    """1 hàng / (provider, method): như engine_summary + MB đã nhận"""
+    return _series_summary(REGISTRY.histograms("fincept_upstream_latency_seconds"), "fincept_upstream_requests_total", "method")
+
+
+def latency_quantile(fn: str, q: float = 0.95) -> Optional[float]:
+    """Phân vị độ trễ (giây) của 1 entry point, VD: latency_quantile("MarketDataEngine.get_historical_data")"""
+    hist = REGISTRY.histograms("fincept_engine_latency_seconds").get((("fn", fn),))
+    return None if hist is None else hist.quantile(q)
+
+
+def node_summary(prefix: str) -> Dict[str, Any]:
+    """Gộp mọi entry point có tên bắt đầu bằng `prefix` (VD: "MarketDataEngine.") thành 1 nút"""
+    merged = Histogram()
+    errors = 0.0
+    for labels, hist in REGISTRY.histograms("fincept_engine_latency_seconds").items():
+        fn = dict(labels).get("fn", "")
+        if not fn.startswith(prefix):
+            continue
+        merged.counts = [a + b for a, b in zip(merged.counts, hist.counts)]
+        merged.sum += hist.sum
+        merged.count += hist.count
+        errors += REGISTRY.counter_value("fincept_engine_calls_total", fn=fn, outcome="error")
+    return {"calls": merged.count, "errors": int(errors),
+            "error_pct": errors / merged.count * 100.0 if merged.count else 0.0,
+            "p50": merged.quantile(0.50), "p95": merged.quantile(0.95)}
+
+
+def cache_summary() -> pd.DataFrame:
+    """Bộ đếm của mọi bộ đệm @coalesced + tỷ lệ trúng (hits + stale_hits + coalesced) / lượt truy cập"""
+    from src.backend.coalesce import coalesce_stats
+    rows = []
+    for name, snap in coalesce_stats().items():
+        served = snap.get("hits", 0) + snap.get("stale_hits", 0) + snap.get("coalesced", 0)
+        lookups = served + snap.get("misses", 0)
+        rows.append({"cache": name, "entries": snap["entries"], "inflight": snap["inflight"],
+                     "hits": snap.get("hits", 0), "stale_hits": snap.get("stale_hits", 0),
+                     "coalesced": snap.get("coalesced", 0), "misses": snap.get("misses", 0),
+                     "refreshes": snap.get("refreshes", 0), "errors": snap.get("errors", 0),
+                     "hit_%": served / lookups * 100.0 if lookups else np.nan})
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(rows).set_index("cache")
+
+
+# =============================================================================
+# 4. XUẤT PROMETHEUS
+# =============================================================================
+def _collector_lines() -> List[str]:
+    """Metric dạng gauge/counter lấy trực tiếp từ các lớp cache & prefetch (không cần đo thêm)"""
+    from src.backend.coalesce import coalesce_stats
+    from src.backend import prefetch, disk_cache
+
+    fmt = MetricsRegistry._fmt_labels
+    lines = ["# HELP fincept_cache_events_total Coalescing cache events (hits, stale_hits, misses, coalesced, ...)",
+             "# TYPE fincept_cache_events_total counter"]
+    gauges: List[str] = []
+    for name, snap in sorted(coalesce_stats().items()):
+        for event, value in sorted(snap.items()):
+            if event in ("name", "entries", "inflight"):
+                continue
+            lines.append(f"fincept_cache_events_total{fmt((('cache', name), ('event', event)))} {value}")
+        gauges.append(f"fincept_cache_entries{fmt((('cache', name),))} {snap['entries']}")
+        gauges.append(f"fincept_cache_inflight{fmt((('cache', name),))} {snap['inflight']}")
+    lines += ["# HELP fincept_cache_entries Entries held per coalescing cache", "# TYPE fincept_cache_entries gauge"]
+    lines += [g for g in gauges if g.startswith("fincept_cache_entries")]
+    lines += ["# HELP fincept_cache_inflight Upstream loads in flight per coalescing cache",
+              "# TYPE fincept_cache_inflight gauge"]
+    lines += [g for g in gauges if g.startswith("fincept_cache_inflight")]
+
+    scheduler = prefetch._SCHEDULER
+    if scheduler is not None:
+        status = scheduler.status()
+        lines += ["# HELP fincept_prefetch_running Whether the background prefetcher is running",
+                  "# TYPE fincept_prefetch_running gauge",
+                  f"fincept_prefetch_running {int(status['running'])}",
+                  "# HELP fincept_prefetch_pending Prefetch refreshes queued or running",
+                  "# TYPE fincept_prefetch_pending gauge",
+                  f"fincept_prefetch_pending {status['pending']}"]
+        for key, value in sorted(status.items()):
+            if key in ("running", "pending", "watchlist") or not isinstance(value, (int, float)):
+                continue
+            lines += [f"# TYPE fincept_prefetch_{key} gauge", f"fincept_prefetch_{key} {value}"]
+
+    disk = disk_cache._DISK   # chỉ đọc khi tầng đĩa đã được khởi tạo, không mở SQLite chỉ để xuất metric
+    if disk is not None:
+        try:
+            status = disk.status()
+        except Exception as e:
+            logger.debug(f"METRICS: disk cache status unavailable ({e})")
+        else:
+            lines += ["# HELP fincept_disk_cache_bytes Bytes held by the shared disk cache",
+                      "# TYPE fincept_disk_cache_bytes gauge",
+                      f"fincept_disk_cache_bytes {status['bytes']}",
+                      "# HELP fincept_disk_cache_max_bytes Byte budget of the shared disk cache",
+                      "# TYPE fincept_disk_cache_max_bytes gauge",
+                      f"fincept_disk_cache_max_bytes {status['max_bytes']}",
+                      "# HELP fincept_disk_cache_entries Keys indexed by the shared disk cache",
+                      "# TYPE fincept_disk_cache_entries gauge",
+                      f"fincept_disk_cache_entries {status['entries']}"]
+    return lines
+
+
+def render_prometheus() -> str:
+    """Toàn bộ metric ở Prometheus text exposition format"""
+    return "\n".join(REGISTRY.render() + _collector_lines()) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass   # Không ghi log mỗi lượt scrape
+
+
+_SERVER: Optional[ThreadingHTTPServer] = None
+_SERVER_LOCK = threading.Lock()
+
+
+def ensure_metrics_server() -> Optional[ThreadingHTTPServer]:
+    """
+    FINCEPT_METRICS_PORT=9108 -> mở endpoint http://<host>:9108/metrics cho Prometheus scrape
+    (1 lần cho cả tiến trình; mặc định tắt). FINCEPT_METRICS_HOST đổi địa chỉ bind (mặc định 127.0.0.1).
+    """
+    global _SERVER
+    port = os.environ.get("FINCEPT_METRICS_PORT", "").strip()
+    if not port:
+        return None
+    with _SERVER_LOCK:
+        if _SERVER is None:
+            host = os.environ.get("FINCEPT_METRICS_HOST", "127.0.0.1")
+            try:
+                _SERVER = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            except (OSError, ValueError) as e:
+                logger.error(f"METRICS: cannot bind {host}:{port} ({e})")
+                return None
+            _SERVER.daemon_threads = True
+            threading.Thread(target=_SERVER.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info(f"METRICS: Prometheus endpoint on http://{host}:{port}/metrics")
+        return _SERVER
@@ -0,0 +1,255 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/backend/prefetch.py
+ROLE: Background Prefetch Scheduler (giữ cache watchlist & mã "nóng" luôn ấm)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+"""
+
+import os
+import heapq
+import logging
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Dict, Any, List, Tuple
+
+from src.backend.coalesce import CoalescingCache, registered_caches
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WATCHLIST = "AAPL,MSFT,GOOG,NVDA,SPY,BTC-USD"
+DEFAULT_HISTORY_SPECS = (("1y", "1d"),)   # (period, interval) được làm ấm cho mỗi mã trong watchlist
+
+# Tầng ưu tiên (số nhỏ chạy trước)
+PRIORITY_COLD = 0       # chưa có trong cache hoặc đã quá TTL (người dùng kế tiếp sẽ chờ upstream)
+PRIORITY_EXPIRING = 1   # sắp hết TTL trong khoảng lead time
+
+
+class _Task:
+    __slots__ = ("cache", "key", "run", "source")
+
+    def __init__(self, cache: CoalescingCache, key: Tuple, run: Callable[[], Any], source: str):
+        self.cache = cache
+        self.key = key
+        self.run = run
+        self.source = source
+
+
+class PrefetchScheduler:
+    """
+    Bộ lập lịch nền làm mới các khóa của lớp coalesced TRƯỚC khi hết TTL:
+    - Nguồn mục tiêu: watchlist cấu hình + các khóa được yêu cầu nhiều nhất (hot keys).
+    - Hàng đợi ưu tiên: khóa lạnh/hết hạn trước, rồi khóa sắp hết hạn; watchlist trước hot keys;
+      cùng tầng thì khóa nhiều lượt truy cập hơn / sắp hết hạn sớm hơn đi trước.
+    - Giới hạn: tối đa `max_workers` lượt tải đồng thời, `max_per_cycle` lượt mỗi chu kỳ,
+      khóa lỗi liên tiếp được lùi lịch theo cấp số nhân.
+    """
+
+    def __init__(self, watchlist: List[str], history_specs: Tuple[Tuple[str, str], ...] = DEFAULT_HISTORY_SPECS,
+                 max_workers: int = 4, interval: float = 15.0, lead_fraction: float = 0.2,
+                 max_lead: float = 120.0, hot_limit: int = 20, max_per_cycle: int = 64, decay_every: int = 20,
+                 start_delay: float = 0.0):
+        self.watchlist = [t.strip().upper() for t in watchlist if t and t.strip()]
+        self.history_specs = tuple(history_specs)
+        self.max_workers = max_workers
+        self.interval = interval
+        self.lead_fraction = lead_fraction
+        self.max_lead = max_lead
+        self.hot_limit = hot_limit
+        self.max_per_cycle = max_per_cycle
+        self.decay_every = decay_every
+        self.start_delay = start_delay
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._pending: set = set()
+        self._failures: Dict[Tuple[str, Tuple], int] = {}
+        self._skip_until: Dict[Tuple[str, Tuple], int] = {}
+        self._cycle = 0
+        self.stats = {"cycles": 0, "submitted": 0, "completed": 0, "failed": 0}
+
+    # ------------------------------------------------------------------
+    # 1. MỤC TIÊU
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _coalesced(func: Callable) -> Callable:
+        """Bóc lớp st.cache_data để lấy hàm @coalesced bên dưới (có .cache / .key_for / .prefetch)"""
+        inner = getattr(func, "__wrapped__", func)
+        if not hasattr(inner, "cache"):
+            raise TypeError(f"{func} is not wrapped with @coalesced")
+        return inner
+
+    def _watchlist_tasks(self) -> List[_Task]:
+        from src.backend.market import MarketDataEngine
+        from src.backend.macro import MacroEngine
+
+        calls: List[Tuple[Callable, tuple]] = [(MacroEngine.get_risk_free_rate, ())]
+        for ticker in self.watchlist:
+            calls.append((MarketDataEngine.get_company_info, (ticker,)))
+            calls.append((MarketDataEngine.get_financial_statements, (ticker,)))
+            for period, interval in self.history_specs:
+                calls.append((MarketDataEngine.get_historical_data, (ticker, period, interval)))
+
+        tasks = []
+        for func, args in calls:
+            fn = self._coalesced(func)
+            tasks.append(_Task(fn.cache, fn.key_for(*args), lambda fn=fn, args=args: fn.prefetch(*args), "watchlist"))
+        return tasks
+
+    def _hot_tasks(self) -> List[Tuple[_Task, int]]:
+        tasks = []
+        for cache in registered_caches().values():
+            for key, hits in cache.hot_keys(limit=self.hot_limit):
+                tasks.append((_Task(cache, key, lambda cache=cache, key=key: cache.refresh(key), "hot"), hits))
+        return tasks
+
+    def _time_left(self, cache: CoalescingCache, key: Tuple) -> Optional[float]:
+        """Số giây còn lại trước khi cần làm mới (<= 0: đã đến hạn), None nếu chưa từng có giá trị"""
+        age = cache.age(key)
+        if age is None:
+            return None
+        lead = min(cache.ttl * self.lead_fraction, self.max_lead)
+        return cache.ttl - lead - age
+
+    def plan(self) -> List[Tuple[tuple, _Task]]:
+        """Dựng hàng đợi ưu tiên các khóa đến hạn làm mới trong chu kỳ này"""
+        heap: List[Tuple[tuple, _Task]] = []
+        seen = set()
+        counter = itertools.count()
+
+        candidates = [(t, None) for t in self._watchlist_tasks()] + self._hot_tasks()
+        for task, hits in candidates:
+            ident = (task.cache.name, task.key)
+            if ident in seen or ident in self._pending or task.cache.is_inflight(task.key):
+                continue
+            seen.add(ident)
+            if self._skip_until.get(ident, 0) > self._cycle:
+                continue
+
+            left = self._time_left(task.cache, task.key)
+            if left is None:
+                # Hot key chưa từng thành công (VD: mã sai) -> không kéo upstream liên tục
+                if task.source != "watchlist":
+                    continue
+                tier = PRIORITY_COLD
+            elif left > 0:
+                continue
+            else:
+                tier = PRIORITY_COLD if left <= -min(task.cache.ttl * self.lead_fraction, self.max_lead) else PRIORITY_EXPIRING
+
+            source_rank = 0 if task.source == "watchlist" else 1
+            priority = (tier, source_rank, -(hits or 0), left if left is not None else float("-inf"), next(counter))
+            heapq.heappush(heap, (priority, task))
+
+        return [heapq.heappop(heap) for _ in range(min(len(heap), self.max_per_cycle))]
+
+    # ------------------------------------------------------------------
+    # 2. THỰC THI
+    # ------------------------------------------------------------------
+    def _execute(self, task: _Task) -> None:
+        ident = (task.cache.name, task.key)
+        try:
+            task.run()
+            with self._lock:
+                self._failures.pop(ident, None)
+                self.stats["completed"] += 1
+        except Exception as e:
+            with self._lock:
+                failures = self._failures.get(ident, 0) + 1
+                self._failures[ident] = failures
+                self._skip_until[ident] = self._cycle + min(2 ** failures, 64)
+                self.stats["failed"] += 1
+            logger.warning(f"Prefetch failed for {task.cache.name}{task.key}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(ident)
+
+    def run_cycle(self) -> int:
+        """1 chu kỳ: lập kế hoạch rồi đẩy vào thread pool; trả về số lượt đã gửi"""
+        self._cycle += 1
+        self.stats["cycles"] += 1
+        if self._cycle % self.decay_every == 0:
+            for cache in registered_caches().values():
+                cache.decay_hits()
+
+        planned = self.plan()
+        for _, task in planned:
+            with self._lock:
+                self._pending.add((task.cache.name, task.key))
+                self.stats["submitted"] += 1
+            self._executor.submit(self._execute, task)
+        if planned:
+            logger.info(f"PREFETCH: cycle {self._cycle} queued {len(planned)} refreshes")
+        return len(planned)
+
+    def _loop(self) -> None:
+        # Chờ trước chu kỳ đầu để không tranh GIL / import lock với lượt vẽ trang đầu tiên
+        if self.start_delay > 0 and self._stop.wait(self.start_delay):
+            return
+        while not self._stop.is_set():
+            try:
+                self.run_cycle()
+            except Exception as e:
+                logger.error(f"Prefetch cycle error: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="prefetch")
+        self._thread = threading.Thread(target=self._loop, name="prefetch-scheduler", daemon=True)
+        self._thread.start()
+        logger.info(f"PREFETCH: started ({len(self.watchlist)} watchlist tickers, {self.max_workers} workers)")
+
+    def stop(self, wait: bool = True) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1 if wait else 0)
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "watchlist": list(self.watchlist),
+                "pending": len(self._pending),
+                "backoff": len([k for k, c in self._skip_until.items() if c > self._cycle]),
+                **self.stats,
+            }
+
+
+# =============================================================================
+# SINGLETON TOÀN TIẾN TRÌNH
+# =============================================================================
+_SCHEDULER: Optional[PrefetchScheduler] = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def ensure_prefetcher() -> Optional[PrefetchScheduler]:
+    """
+    Khởi động (1 lần cho cả tiến trình) bộ prefetch theo biến môi trường:
+        FINCEPT_PREFETCH=0            -> tắt
+        FINCEPT_WATCHLIST=AAPL,MSFT   -> danh sách mã luôn được làm ấm
+        FINCEPT_PREFETCH_WORKERS=4    -> số lượt tải đồng thời tối đa
+        FINCEPT_PREFETCH_INTERVAL=15  -> chu kỳ quét (giây)
+        FINCEPT_PREFETCH_DELAY=3      -> chờ bao lâu (giây) sau khi khởi động mới chạy chu kỳ đầu
+    """
+    global _SCHEDULER
+    if os.environ.get("FINCEPT_PREFETCH", "1").strip().lower() in ("0", "false", "no", "off"):
+        return None
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = PrefetchScheduler(
+                watchlist=os.environ.get("FINCEPT_WATCHLIST", DEFAULT_WATCHLIST).split(","),
+                max_workers=int(os.environ.get("FINCEPT_PREFETCH_WORKERS", "4")),
+                interval=float(os.environ.get("FINCEPT_PREFETCH_INTERVAL", "15")),
+                start_delay=float(os.environ.get("FINCEPT_PREFETCH_DELAY", "3")),
+            )
+        _SCHEDULER.start()
+        return _SCHEDULER
@@ -0,0 +1,291 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/backend/profiling.py
+ROLE: On-Demand Page Profiler (1 lượt chạy lại trang -> flamegraph + thời gian từng giai đoạn)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+Bật cho 1 lượt chạy:
+    http://localhost:8501/Market_Cockpit?profile=1          # lấy mẫu stack (mặc định, overhead thấp)
+    http://localhost:8501/Market_Cockpit?profile=cprofile   # cProfile tất định (chi tiết từng hàm)
+hoặc bật theo session bằng công tắc ⏱️ PROFILE ở sidebar (st.session_state[PROFILE_SESSION_KEY]).
+
+Kết quả ghi vào data/profiles/:
+    <page>_<time>.folded   stack gộp (flamegraph.pl, speedscope, inferno)   - chế độ sample
+    <page>_<time>.prof     pstats (snakeviz, `python -m pstats`)            - chế độ cprofile
+    <page>_<time>.json     thời gian từng giai đoạn (fetch / indicators / figure / render ...)
+Khi tắt: start_page_profile() trả về None, stage() trả về 1 nullcontext dùng chung -> không tốn gì.
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+import logging
+import threading
+from datetime import datetime
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Optional, Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_PROFILE_DIR = os.path.join(ROOT_DIR, 'data', 'profiles')
+
+PROFILE_QUERY_PARAM = "profile"
+PROFILE_SESSION_KEY = "fincept_profile"
+MODE_SAMPLE = "sample"
+MODE_CPROFILE = "cprofile"
+
+# Chu kỳ lấy mẫu stack (giây); FINCEPT_PROFILE_INTERVAL đổi giá trị
+DEFAULT_SAMPLE_INTERVAL = float(os.environ.get("FINCEPT_PROFILE_INTERVAL", "0.002"))
+
+_NULL_STAGE = nullcontext()
+_ACTIVE = threading.local()
+# cProfile gắn vào luồng gọi enable(), nhưng 2 phiên tất định song song làm số liệu khó đọc
+# -> mỗi lúc chỉ 1 phiên cprofile (chủ sở hữu), phiên khác tự chuyển sang lấy mẫu
+_CPROFILE_GUARD = threading.RLock()
+_CPROFILE_OWNER: Optional["PageProfiler"] = None
+
+
+def _parse_mode(value: Any) -> Optional[str]:
+    if value is None or value is False:
+        return None
+    value = str(value).strip().lower()
+    if value in ("", "0", "false", "no", "off"):
+        return None
+    return MODE_CPROFILE if value in (MODE_CPROFILE, "deterministic", "det") else MODE_SAMPLE
+
+
+def requested_mode() -> Optional[str]:
+    """Chế độ profile được yêu cầu cho lượt chạy này: query param ?profile=... rồi tới công tắc của session"""
+    import streamlit as st   # nạp muộn: metrics / providers dùng stage() mà không kéo theo Streamlit
+    try:
+        mode = _parse_mode(st.query_params.get(PROFILE_QUERY_PARAM))
+        if mode is None:
+            mode = _parse_mode(st.session_state.get(PROFILE_SESSION_KEY))
+        return mode
+    except Exception:   # ngoài runtime Streamlit (script, benchmark)
+        return None
+
+
+# =============================================================================
+# 1. BỘ LẤY MẪU STACK (SAMPLING)
+# =============================================================================
+class StackSampler:
+    """
+    Luồng nền chụp stack của 1 luồng đích mỗi `interval` giây qua sys._current_frames()
+    và gộp thành định dạng folded ("khung_gốc;...;khung_lá số_mẫu").
+    Chỉ thấy luồng chạy script của session; công việc trong ThreadPoolExecutor nằm ở luồng khác.
+    """
+
+    def __init__(self, thread_id: int, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._labels: Dict[Any, str] = {}
+
+    def _label(self, code) -> str:
+        """Tên khung: hàm (đường dẫn tương đối trong dự án hoặc tên file thư viện:dòng định nghĩa)"""
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename
+            path = os.path.relpath(path, ROOT_DIR) if path.startswith(ROOT_DIR) else os.path.basename(path)
+            label = self._labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})"
+        return label
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack: List[str] = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+# =============================================================================
+# 2. PHIÊN PROFILE CỦA 1 LƯỢT CHẠY TRANG
+# =============================================================================
+class PageProfiler:
+    """1 lượt chạy lại trang: profiler (sample / cprofile) + thời gian các giai đoạn có tên"""
+
+    def __init__(self, page: str, mode: str = MODE_SAMPLE, out_dir: str = DEFAULT_PROFILE_DIR,
+                 interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.page = page
+        self.mode = mode
+        self.out_dir = out_dir
+        self.interval = interval
+        self.stages: List[Tuple[str, int, float, float]] = []   # (tên, độ sâu, bắt đầu, thời lượng) tính từ t0
+        self._depth = 0
+        self._t0 = 0.0
+        self._sampler: Optional[StackSampler] = None
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._thread = threading.current_thread()
+        self.report: Optional[Dict[str, Any]] = None
+
+    def _claim_cprofile(self) -> bool:
+        global _CPROFILE_OWNER
+        with _CPROFILE_GUARD:
+            owner = _CPROFILE_OWNER
+            if owner is not None and not owner._thread.is_alive():   # lượt chạy trước bị ngắt, luồng đã kết thúc
+                owner.abandon()
+            if _CPROFILE_OWNER is None:
+                _CPROFILE_OWNER = self
+                return True
+            return False
+
+    def _release_cprofile(self) -> None:
+        global _CPROFILE_OWNER
+        with _CPROFILE_GUARD:
+            if _CPROFILE_OWNER is self:
+                _CPROFILE_OWNER = None
+
+    def start(self) -> "PageProfiler":
+        if self.mode == MODE_CPROFILE and self._claim_cprofile():
+            self._cprofile = cProfile.Profile()
+        else:
+            self.mode = MODE_SAMPLE
+            self._sampler = StackSampler(threading.get_ident(), self.interval)
+            self._sampler.start()
+        _ACTIVE.profiler = self
+        self._t0 = time.perf_counter()
+        if self._cprofile is not None:
+            self._cprofile.enable()
+        return self
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        depth = self._depth
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.stages.append((name, depth, start - self._t0, time.perf_counter() - start))
+
+    def stop(self) -> Dict[str, Any]:
+        """Dừng profiler, ghi file ra out_dir và trả về báo cáo (cũng lưu ở self.report)"""
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        wall = time.perf_counter() - self._t0
+        if self._sampler is not None:
+            self._sampler.stop()
+        if getattr(_ACTIVE, "profiler", None) is self:
+            _ACTIVE.profiler = None
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        stem = os.path.join(self.out_dir, f"{_slug(self.page)}_{datetime.now().strftime('%Y%m%d-%H%M%S-%f')[:-3]}")
+        files: Dict[str, str] = {}
+        try:
+            if self._cprofile is not None:
+                files["pstats"] = f"{stem}.prof"
+                self._cprofile.dump_stats(files["pstats"])
+            if self._sampler is not None:
+                files["folded"] = f"{stem}.folded"
+                with open(files["folded"], "w", encoding="utf-8") as f:
+                    f.write(self._sampler.folded())
+        finally:
+            self._release_cprofile()
+
+        self.report = {
+            "page": self.page,
+            "mode": self.mode,
+            "wall_ms": wall * 1e3,
+            "samples": self._sampler.samples if self._sampler is not None else None,
+            "stages": self.stage_breakdown(wall),
+            "files": files,
+        }
+        files["stages"] = f"{stem}.json"
+        with open(files["stages"], "w", encoding="utf-8") as f:
+            json.dump(self.report, f, indent=2)
+        logger.info(f"PROFILE: {self.page} {wall * 1e3:,.0f} ms ({self.mode}) -> {stem}.*")
+        return self.report
+
+    def abandon(self) -> None:
+        """Bỏ phiên không kết thúc được (st.stop / lỗi giữa trang): tắt profiler, không ghi file"""
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        if getattr(_ACTIVE, "profiler", None) is self:
+            _ACTIVE.profiler = None
+        self._release_cprofile()
+
+    def stage_breakdown(self, wall: float) -> List[Dict[str, Any]]:
+        """Gộp theo tên giai đoạn; phần thời gian ngoài mọi giai đoạn cấp 1 ghi là 'unattributed'"""
+        totals: Dict[str, Dict[str, Any]] = {}
+        for name, depth, _, duration in sorted(self.stages, key=lambda s: s[2]):
+            row = totals.setdefault(name, {"stage": name, "depth": depth, "calls": 0, "ms": 0.0})
+            row["calls"] += 1
+            row["ms"] += duration * 1e3
+        top_level = sum(s[3] for s in self.stages if s[1] == 0)
+        rows = list(totals.values())
+        rows.append({"stage": "unattributed", "depth": 0, "calls": 1, "ms": max(wall - top_level, 0.0) * 1e3})
+        for row in rows:
+            row["pct"] = row["ms"] / (wall * 1e3) * 100.0 if wall > 0 else 0.0
+        return rows
+
+
+def _slug(text: str) -> str:
+    return "".join(c.lower() if c.isalnum() else "_" for c in text).strip("_") or "page"
+
+
+# =============================================================================
+# 3. API DÙNG TRONG TRANG
+# =============================================================================
+def start_page_profile(page: str) -> Optional[PageProfiler]:
+    """Gọi ở đầu trang (sau set_page_config). None khi không có yêu cầu profile -> trang chạy như thường."""
+    stale = getattr(_ACTIVE, "profiler", None)
+    if stale is not None:
+        stale.abandon()
+    mode = requested_mode()
+    if mode is None:
+        return None
+    return PageProfiler(page, mode).start()
+
+
+def finish_page_profile(profiler: Optional[PageProfiler]) -> Optional[Dict[str, Any]]:
+    """Gọi ở cuối trang. Lượt chạy bị ngắt giữa chừng (st.stop, lỗi) không ghi báo cáo."""
+    if profiler is None:
+        return None
+    report = profiler.stop()
+    import streamlit as st
+    try:
+        # ?profile=... chỉ áp dụng cho 1 lượt chạy; công tắc của session thì giữ nguyên
+        if PROFILE_QUERY_PARAM in st.query_params:
+            del st.query_params[PROFILE_QUERY_PARAM]
+    except Exception:
+        pass
+    return report
+
+
+def stage(name: str):
+    """
+    Đánh dấu 1 giai đoạn của lượt chạy đang được profile (dùng được ở mọi tầng: trang, UI, Engine):
+        with stage("indicators"): ...
+    Không có profile đang chạy trên luồng này -> nullcontext dùng chung.
+    """
+    profiler = getattr(_ACTIVE, "profiler", None)
+    return _NULL_STAGE if profiler is None else profiler.stage(name)
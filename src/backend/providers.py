@@ -0,0 +1,538 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/backend/providers.py
+ROLE: Pluggable Market Data Providers (YFinance / Local Replay)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+"""
+
+import os
+import re
+import json
+import zlib
+import hashlib
+import logging
+import time
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+import pandas as pd
+
+from src.backend.metrics import upstream_call
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_REPLAY_DIR = os.path.join(ROOT_DIR, 'data', 'replay')
+
+# Mốc kết thúc cố định của dữ liệu tổng hợp -> benchmark & load test luôn tái lập được
+SYNTHETIC_END = "2025-12-31"
+
+# Tần suất pandas tương ứng với interval của yfinance
+INTERVAL_FREQ = {
+    "1m": "min", "2m": "2min", "5m": "5min", "15m": "15min", "30m": "30min",
+    "60m": "h", "90m": "90min", "1h": "h", "1d": "B", "5d": "5B",
+    "1wk": "W-MON", "1mo": "MS", "3mo": "QS",
+}
+
+STATEMENT_NAMES = ("income_statement", "balance_sheet", "cash_flow")
+
+# Cấu hình HTTP dùng chung: (connect, read) timeout và kích thước pool keep-alive
+HTTP_TIMEOUT = (3.05, 20.0)
+HTTP_POOL_SIZE = 32
+HTTP_USER_AGENT = "FinceptTerminal/3.0 (+https://github.com/thanglong0503-dev/FinceptCore)"
+
+# Chỉ số lợi suất trái phiếu (niêm yết dạng %) -> dữ liệu tổng hợp được neo về mức lãi suất thực tế
+SYNTHETIC_YIELD_INDICES = {"^IRX": 4.3, "^FVX": 4.0, "^TNX": 4.25, "^TYX": 4.5}
+
+
+def _steps_per_year(freq: str) -> float:
+    """Số nến mỗi năm giao dịch (252 phiên x 6.5 giờ cho khung intraday)"""
+    named = {"B": 252.0, "D": 365.0, "5B": 50.4, "W-MON": 52.0, "MS": 12.0, "QS": 4.0}
+    if freq in named:
+        return named[freq]
+    try:
+        step = pd.to_timedelta(pd.tseries.frequencies.to_offset(freq))
+        return 252.0 * pd.Timedelta(hours=6.5) / step
+    except (ValueError, TypeError):
+        return 252.0
+
+
+def generate_synthetic_ohlcv(n_rows: int, seed: int = 0, end: str = SYNTHETIC_END, freq: str = "B",
+                             start_price: float = 100.0, annual_vol: float = 0.25) -> pd.DataFrame:
+    """
+    Sinh chuỗi OHLCV tổng hợp (Geometric Brownian Motion) có định dạng giống yfinance:
+    index 'Date'/'Datetime', cột Open/High/Low/Close/Volume/Dividends/Stock Splits.
+    Cùng seed -> cùng dữ liệu (phục vụ benchmark & kiểm thử tải ngoại tuyến).
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(end=pd.Timestamp(end), periods=n_rows, freq=freq)
+    index.name = "Date" if freq in ("B", "5B", "W-MON", "MS", "QS", "D") else "Datetime"
+
+    # Drift & volatility theo từng bước: chuỗi phút dài hàng triệu nến vẫn giữ biên độ giá thực tế
+    steps_per_year = _steps_per_year(freq)
+    step_vol = annual_vol / np.sqrt(steps_per_year)
+    log_ret = rng.normal(0.0504 / steps_per_year, step_vol, n_rows)
+    close = start_price * np.exp(np.cumsum(log_ret))
+    open_ = np.concatenate(([start_price], close[:-1])) * np.exp(rng.normal(0, step_vol / 4, n_rows))
+    spread = np.abs(rng.normal(0, step_vol / 2, n_rows))
+    high = np.maximum(open_, close) * (1 + spread)
+    low = np.minimum(open_, close) * (1 - spread)
+    volume = rng.lognormal(mean=15, sigma=0.5, size=n_rows).astype(np.int64)
+
+    return pd.DataFrame({
+        "Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume,
+        "Dividends": 0.0, "Stock Splits": 0.0,
+    }, index=index)
+
+
+class MarketDataProvider(ABC):
+    """
+    Giao diện chung cho mọi nguồn dữ liệu. Các Engine (Market, Macro, Economic) chỉ gọi qua lớp này,
+    nên có thể thay YFinance bằng nguồn phát lại (Replay) để đo hiệu năng không phụ thuộc mạng.
+    Định dạng trả về bám theo yfinance để Engine không cần biết nguồn nào đang chạy.
+    """
+
+    name = "base"
+
+    # Các phương thức gọi upstream: mọi lớp con được tự động bọc để đo độ trễ / lỗi / byte nhận về
+    # (functools.wraps giữ cờ __isabstractmethod__ -> lớp con thiếu phương thức vẫn không khởi tạo được)
+    UPSTREAM_METHODS = ("history", "download", "info", "financials", "attribute", "get_json", "quote")
+
+    @property
+    def cache_scope(self) -> str:
+        """Phạm vi dữ liệu cho tầng cache đĩa dùng chung: 2 provider khác nội dung không được chung khóa"""
+        return self.name
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for method in cls.UPSTREAM_METHODS:
+            impl = getattr(cls, method)
+            impl = getattr(impl, "upstream_impl", impl)   # phương thức kế thừa đã bọc -> bọc lại với nhãn của lớp này
+            setattr(cls, method, upstream_call(cls.name, method, impl))
+
+    @abstractmethod
+    def history(self, ticker: str, period: Optional[str] = None, interval: str = "1d",
+                start: Optional[str] = None) -> pd.DataFrame:
+        """OHLCV của 1 mã (theo period, hoặc từ ngày start đến hiện tại)"""
+
+    @abstractmethod
+    def download(self, tickers: List[str], period: str = "1y", interval: str = "1d") -> pd.DataFrame:
+        """OHLCV nhiều mã, cột MultiIndex (ticker, field) giống yf.download(group_by='ticker')"""
+
+    @abstractmethod
+    def info(self, ticker: str) -> Dict[str, Any]:
+        """Hồ sơ doanh nghiệp thô (khóa theo chuẩn yfinance: currentPrice, sharesOutstanding...)"""
+
+    @abstractmethod
+    def financials(self, ticker: str) -> Dict[str, Optional[pd.DataFrame]]:
+        """3 BCTC cốt lõi: income_statement, balance_sheet, cash_flow"""
+
+    @abstractmethod
+    def attribute(self, ticker: str, name: str) -> Any:
+        """Thuộc tính phụ của mã (VD: calendar, recommendations)"""
+
+    @abstractmethod
+    def get_json(self, url: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Gọi HTTP GET trả về JSON (DBNomics và các API REST khác)"""
+
+    def quote(self, ticker: str) -> Dict[str, Any]:
+        """
+        Quote nhẹ: {symbol, price, prev_close, open, high, low, volume, ts}.
+        Mặc định dựng từ vài nến ngày gần nhất (không cần nến phút hay hồ sơ doanh nghiệp).
+        """
+        hist = self.history(ticker, period="5d", interval="1d")
+        if hist is None or hist.empty:
+            return {}
+        last = hist.iloc[-1]
+        prev_close = float(hist['Close'].iloc[-2]) if len(hist) > 1 else float(last['Open'])
+        return {
+            "symbol": ticker.upper(), "price": float(last['Close']), "prev_close": prev_close,
+            "open": float(last['Open']), "high": float(last['High']), "low": float(last['Low']),
+            "volume": float(last['Volume']), "ts": pd.Timestamp(hist.index[-1]).timestamp(),
+        }
+
+
+def build_http_session(pool_size: int = HTTP_POOL_SIZE, retries: int = 2):
+    """
+    requests.Session dùng chung: keep-alive qua HTTPAdapter có pool, tự thử lại (backoff)
+    với lỗi tạm thời 429/5xx cho các lệnh GET. An toàn khi dùng đồng thời từ nhiều luồng.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset(["GET"]), respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"User-Agent": HTTP_USER_AGENT, "Accept": "application/json"})
+    return session
+
+
+def build_yf_session():
+    """
+    Phiên curl_cffi (giả lập trình duyệt) cho yf.Ticker / yf.download, giữ cookie & crumb
+    của Yahoo giữa các lượt gọi. curl_cffi.Session KHÔNG an toàn đa luồng -> mỗi luồng 1 phiên
+    (xem YFinanceProvider.yf_session). None -> để yfinance tự quản lý phiên
+    (VD: môi trường không cài curl_cffi với yfinance bản cũ).
+    """
+    try:
+        from curl_cffi import requests as curl_requests
+        return curl_requests.Session(impersonate="chrome")
+    except Exception as e:
+        logger.info(f"curl_cffi session unavailable ({e}); yfinance will manage its own session")
+        return None
+
+
+class TickerHandleCache:
+    """
+    Bộ đệm LRU các đối tượng yf.Ticker theo (luồng, mã): 1 lượt DCF (info + BCTC + thuộc tính)
+    dùng chung 1 handle thay vì tạo mới ở mỗi Engine. yf.Ticker ghi nhớ trạng thái nội bộ không khóa
+    và gắn với phiên curl_cffi của luồng tạo ra nó -> handle không bao giờ được trao cho luồng khác.
+    Handle quá `ttl` giây bị tạo lại vì yf.Ticker tự ghi nhớ info/BCTC bên trong
+    (tránh giữ dữ liệu cũ quá TTL của cache).
+    """
+
+    def __init__(self, factory, max_size: int = 256, ttl: float = 60.0):
+        self._factory = factory
+        self.max_size = max_size
+        self.ttl = ttl
+        self._handles: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, ticker: str):
+        symbol = ticker.upper()
+        key = (threading.get_ident(), symbol)   # ident chỉ được tái dùng sau khi luồng cũ đã kết thúc
+        now = time.monotonic()
+        with self._lock:
+            entry = self._handles.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._handles.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            handle = self._factory(symbol)
+            self._handles[key] = (now, handle)
+            self._handles.move_to_end(key)
+            while len(self._handles) > self.max_size:
+                self._handles.popitem(last=False)
+            self.misses += 1
+            return handle
+
+    def clear(self) -> None:
+        with self._lock:
+            self._handles.clear()
+
+
+class YFinanceProvider(MarketDataProvider):
+    """
+    Nguồn dữ liệu thật: Yahoo Finance qua thư viện yfinance + requests cho các API REST.
+    Mọi Engine dùng chung 1 phiên HTTP có pool (requests an toàn đa luồng); phiên curl_cffi
+    của yfinance và handle yf.Ticker thì riêng cho từng luồng.
+    """
+
+    name = "yfinance"
+
+    def __init__(self, timeout=HTTP_TIMEOUT, pool_size: int = HTTP_POOL_SIZE, handle_ttl: float = 60.0):
+        self.timeout = timeout
+        self.http = build_http_session(pool_size=pool_size)
+        self.handles = TickerHandleCache(self._new_ticker, ttl=handle_ttl)
+        self._yf = None
+        self._yf_local = threading.local()   # phiên curl_cffi riêng mỗi luồng
+        self._yf_lock = threading.Lock()
+
+    def _ensure_yf(self):
+        """yfinance + curl_cffi (~0.9s import) chỉ được nạp ở lần gọi Yahoo đầu tiên, không phải lúc khởi động"""
+        if self._yf is None:
+            with self._yf_lock:
+                if self._yf is None:
+                    import yfinance as yf
+                    self._yf = yf
+        return self._yf
+
+    @property
+    def yf(self):
+        return self._ensure_yf()
+
+    @property
+    def yf_session(self):
+        """Phiên curl_cffi của luồng hiện tại (tạo ở lần gọi Yahoo đầu tiên của luồng)"""
+        self._ensure_yf()   # curl_cffi được nạp cùng yfinance
+        local = self._yf_local
+        if not hasattr(local, "session"):
+            local.session = build_yf_session()
+        return local.session
+
+    def _new_ticker(self, ticker: str):
+        if self.yf_session is not None:
+            return self.yf.Ticker(ticker, session=self.yf_session)
+        return self.yf.Ticker(ticker)
+
+    def history(self, ticker, period=None, interval="1d", start=None):
+        stock = self.handles.get(ticker)
+        if start is not None:
+            return stock.history(start=start, interval=interval)
+        return stock.history(period=period, interval=interval)
+
+    def download(self, tickers, period="1y", interval="1d"):
+        kwargs = {"session": self.yf_session} if self.yf_session is not None else {}
+        return self.yf.download(
+            list(tickers), period=period, interval=interval,
+            group_by='ticker', threads=True, progress=False, auto_adjust=True, **kwargs
+        )
+
+    def info(self, ticker):
+        return self.handles.get(ticker).info
+
+    def financials(self, ticker):
+        stock = self.handles.get(ticker)
+        return {
+            "income_statement": stock.financials,
+            "balance_sheet": stock.balance_sheet,
+            "cash_flow": stock.cashflow
+        }
+
+    def attribute(self, ticker, name):
+        return getattr(self.handles.get(ticker), name)
+
+    def quote(self, ticker):
+        # 1 request chart 5 nến ngày: metadata kèm giá khớp gần nhất (regularMarketPrice) và thời điểm khớp
+        stock = self.handles.get(ticker)
+        quote = super().quote(ticker)
+        if not quote:
+            return quote
+        meta = stock.get_history_metadata() or {}
+        mapping = {"price": "regularMarketPrice", "high": "regularMarketDayHigh",
+                   "low": "regularMarketDayLow", "volume": "regularMarketVolume", "ts": "regularMarketTime"}
+        for field, key in mapping.items():
+            if meta.get(key) is not None:
+                quote[field] = float(meta[key])
+        return quote
+
+    def get_json(self, url, params=None):
+        response = self.http.get(url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Nguồn phát lại từ đĩa (offline, tất định). Cấu trúc thư mục:
+        <root>/<TICKER>/ohlcv_<interval>.parquet|.csv   (index Date/Datetime)
+        <root>/<TICKER>/info.json
+        <root>/<TICKER>/<income_statement|balance_sheet|cash_flow>.csv
+        <root>/<TICKER>/<attribute>.json
+        <root>/http/<sha1(url+params)>.json
+    synthetic=True: mã chưa được ghi sẽ được sinh tổng hợp (seed theo tên mã).
+    """
+
+    name = "replay"
+
+    def __init__(self, root: str = DEFAULT_REPLAY_DIR, synthetic: bool = True, synthetic_rows: int = 5000):
+        self.root = root
+        self.synthetic = synthetic
+        self.synthetic_rows = synthetic_rows
+        self._frames: Dict[tuple, pd.DataFrame] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache_scope(self) -> str:
+        return f"{self.name}:{os.path.abspath(self.root)}:{self.synthetic_rows if self.synthetic else 0}"
+
+    # ------------------------------------------------------------------
+    # ĐƯỜNG DẪN
+    # ------------------------------------------------------------------
+    def _ticker_dir(self, ticker: str) -> str:
+        return os.path.join(self.root, re.sub(r'[^A-Za-z0-9._-]', '_', ticker.upper()))
+
+    @staticmethod
+    def _seed(ticker: str) -> int:
+        return zlib.crc32(ticker.upper().encode("utf-8"))
+
+    @staticmethod
+    def http_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        raw = url + "?" + json.dumps(params or {}, sort_keys=True)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------
+    # OHLCV
+    # ------------------------------------------------------------------
+    def _series(self, ticker: str, interval: str) -> pd.DataFrame:
+        """Toàn bộ chuỗi đã ghi (hoặc tổng hợp) của 1 mã, được giữ trong bộ nhớ sau lần đọc đầu"""
+        key = (ticker.upper(), interval)
+        with self._lock:
+            if key in self._frames:
+                return self._frames[key]
+
+        base = os.path.join(self._ticker_dir(ticker), f"ohlcv_{interval}")
+        df = None
+        if os.path.exists(base + ".parquet"):
+            df = pd.read_parquet(base + ".parquet")
+        elif os.path.exists(base + ".csv"):
+            df = pd.read_csv(base + ".csv", index_col=0, parse_dates=True)
+        elif self.synthetic and interval in INTERVAL_FREQ:
+            df = generate_synthetic_ohlcv(self.synthetic_rows, seed=self._seed(ticker), freq=INTERVAL_FREQ[interval])
+            anchor = SYNTHETIC_YIELD_INDICES.get(ticker.upper())
+            if anchor is not None:
+                price_cols = ['Open', 'High', 'Low', 'Close']
+                df[price_cols] = df[price_cols] * (anchor / df['Close'].iloc[-1])
+
+        if df is None:
+            df = pd.DataFrame()
+        with self._lock:
+            self._frames[key] = df
+        return df
+
+    def history(self, ticker, period=None, interval="1d", start=None):
+        from src.backend.storage import OHLCVStore
+
+        df = self._series(ticker, interval)
+        if df.empty:
+            return df
+        if start is not None:
+            return df[df.index >= pd.Timestamp(start)]
+        begin = OHLCVStore.period_start(period or "1mo", df.index[-1])
+        return df if begin is None else df[df.index >= begin]
+
+    def download(self, tickers, period="1y", interval="1d"):
+        frames = {t: self.history(t, period=period, interval=interval) for t in tickers}
+        frames = {t: f for t, f in frames.items() if not f.empty}
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, axis=1, sort=True)
+
+    # ------------------------------------------------------------------
+    # HỒ SƠ & BCTC
+    # ------------------------------------------------------------------
+    def _read_json(self, path: str) -> Optional[Any]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def info(self, ticker):
+        recorded = self._read_json(os.path.join(self._ticker_dir(ticker), "info.json"))
+        if recorded is not None:
+            return recorded
+        if not self.synthetic:
+            return {}
+
+        df = self._series(ticker, "1d")
+        last, prev = float(df['Close'].iloc[-1]), float(df['Close'].iloc[-2])
+        shares = 1_000_000_000
+        return {
+            "symbol": ticker.upper(),
+            "shortName": f"{ticker.upper()} (SYNTHETIC)",
+            "sector": "Synthetic", "industry": "Replay", "country": "N/A",
+            "financialCurrency": "USD", "exchange": "REPLAY",
+            "currentPrice": last, "previousClose": prev,
+            "open": float(df['Open'].iloc[-1]), "dayHigh": float(df['High'].iloc[-1]), "dayLow": float(df['Low'].iloc[-1]),
+            "volume": int(df['Volume'].iloc[-1]), "averageVolume10days": int(df['Volume'].tail(10).mean()),
+            "marketCap": last * shares, "sharesOutstanding": shares,
+            "trailingPE": 20.0, "priceToBook": 3.0, "beta": 1.0,
+            "fiftyTwoWeekHigh": float(df['High'].tail(252).max()), "fiftyTwoWeekLow": float(df['Low'].tail(252).min()),
+            "freeCashflow": last * shares / 25.0, "totalDebt": last * shares / 10.0, "totalCash": last * shares / 20.0,
+            "longBusinessSummary": "Synthetic instrument served by the local replay provider.",
+        }
+
+    def financials(self, ticker):
+        folder = self._ticker_dir(ticker)
+        result = {}
+        for name in STATEMENT_NAMES:
+            path = os.path.join(folder, f"{name}.csv")
+            result[name] = pd.read_csv(path, index_col=0) if os.path.exists(path) else None
+        if any(v is not None for v in result.values()) or not self.synthetic:
+            return result
+
+        # BCTC tổng hợp 4 năm gần nhất, khớp với 'info' tổng hợp ở trên
+        info = self.info(ticker)
+        periods = pd.date_range(end=SYNTHETIC_END, periods=4, freq="YE")[::-1]
+        fcf = info["freeCashflow"] * np.array([1.0, 0.92, 0.85, 0.78])
+        capex = -0.25 * fcf
+        revenue = fcf * 8
+        return {
+            "income_statement": pd.DataFrame([revenue, revenue * 0.2], index=["Total Revenue", "Net Income"], columns=periods),
+            "balance_sheet": pd.DataFrame([[info["totalDebt"]] * 4, [info["totalCash"]] * 4],
+                                          index=["Total Debt", "Cash And Cash Equivalents"], columns=periods),
+            "cash_flow": pd.DataFrame([fcf - capex, capex, fcf],
+                                      index=["Operating Cash Flow", "Capital Expenditure", "Free Cash Flow"], columns=periods),
+        }
+
+    def attribute(self, ticker, name):
+        return self._read_json(os.path.join(self._ticker_dir(ticker), f"{name}.json"))
+
+    def get_json(self, url, params=None):
+        path = os.path.join(self.root, "http", self.http_key(url, params) + ".json")
+        data = self._read_json(path)
+        if data is None:
+            raise FileNotFoundError(f"No recorded response for {url}")
+        return data
+
+    # ------------------------------------------------------------------
+    # GHI LẠI TỪ NGUỒN THẬT
+    # ------------------------------------------------------------------
+    def record(self, source: MarketDataProvider, ticker: str, intervals: tuple = ("1d",), period: str = "max") -> None:
+        """Ghi dữ liệu thật của 1 mã từ `source` xuống đĩa để phát lại về sau"""
+        folder = self._ticker_dir(ticker)
+        os.makedirs(folder, exist_ok=True)
+        for interval in intervals:
+            df = source.history(ticker, period=period, interval=interval)
+            if df is not None and not df.empty:
+                if getattr(df.index, "tz", None) is not None:
+                    df = df.tz_localize(None)
+                df.to_csv(os.path.join(folder, f"ohlcv_{interval}.csv"))
+        with open(os.path.join(folder, "info.json"), "w", encoding="utf-8") as f:
+            json.dump(source.info(ticker), f, default=str)
+        for name, frame in source.financials(ticker).items():
+            if frame is not None and not frame.empty:
+                frame.to_csv(os.path.join(folder, f"{name}.csv"))
+        with self._lock:
+            self._frames = {k: v for k, v in self._frames.items() if k[0] != ticker.upper()}
+
+    def record_json(self, source: MarketDataProvider, url: str, params: Optional[Dict[str, Any]] = None) -> None:
+        folder = os.path.join(self.root, "http")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, self.http_key(url, params) + ".json"), "w", encoding="utf-8") as f:
+            json.dump(source.get_json(url, params), f)
+
+
+# ---------------------------------------------------------------------------
+# SỔ ĐĂNG KÝ PROVIDER TOÀN TIẾN TRÌNH
+# ---------------------------------------------------------------------------
+_PROVIDER: Optional[MarketDataProvider] = None
+_PROVIDER_LOCK = threading.Lock()
+
+
+def _provider_from_env() -> MarketDataProvider:
+    """FINCEPT_DATA_PROVIDER=yfinance (mặc định) | replay; FINCEPT_REPLAY_DIR trỏ tới thư mục phát lại"""
+    kind = os.environ.get("FINCEPT_DATA_PROVIDER", "yfinance").lower()
+    if kind == "replay":
+        root = os.environ.get("FINCEPT_REPLAY_DIR", DEFAULT_REPLAY_DIR)
+        logger.info(f"DATA PROVIDER: replay ({root})")
+        return ReplayProvider(root)
+    return YFinanceProvider()
+
+
+def get_provider() -> MarketDataProvider:
+    global _PROVIDER
+    if _PROVIDER is None:
+        with _PROVIDER_LOCK:
+            if _PROVIDER is None:
+                _PROVIDER = _provider_from_env()
+    return _PROVIDER
+
+
+def set_provider(provider: MarketDataProvider) -> None:
+    """Thay provider cho toàn tiến trình (benchmark, load test, kiểm thử)"""
+    global _PROVIDER
+    with _PROVIDER_LOCK:
+        _PROVIDER = provider
@@ -0,0 +1,185 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/backend/resample.py
+ROLE: Local OHLCV Resampling Engine (dựng nến thô hơn từ chuỗi gốc mịn nhất)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple, Callable
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Interval trong ngày (phút) theo chuẩn yfinance
+INTRADAY_MINUTES = {"1m": 1, "2m": 2, "5m": 5, "15m": 15, "30m": 30, "60m": 60, "90m": 90, "1h": 60}
+
+# Interval lịch (tuần / tháng / quý) luôn dựng từ nến ngày
+CALENDAR_INTERVALS = ("1wk", "1mo", "3mo")
+DAILY_BASE = "1d"
+
+
+# =============================================================================
+# 1. NHÃN NẾN (vector hóa trên datetime64)
+# =============================================================================
+def _week_start(ts: np.ndarray) -> np.ndarray:
+    """Thứ Hai đầu tuần (giống nhãn nến 1wk của Yahoo). 1970-01-01 là thứ Năm -> lệch 3 ngày"""
+    days = ts.astype('datetime64[D]').astype(np.int64)
+    return (days - (days + 3) % 7).astype('datetime64[D]')
+
+
+def _month_start(ts: np.ndarray) -> np.ndarray:
+    return ts.astype('datetime64[M]').astype('datetime64[D]')
+
+
+def _quarter_start(ts: np.ndarray) -> np.ndarray:
+    months = ts.astype('datetime64[M]').astype(np.int64)
+    return (months - months % 3).astype('datetime64[M]').astype('datetime64[D]')
+
+
+_CALENDAR_LABELERS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    "1wk": _week_start,
+    "1mo": _month_start,
+    "3mo": _quarter_start,
+}
+
+
+def _intraday_start(ts: np.ndarray, minutes: int) -> np.ndarray:
+    """
+    Nhãn nến trong ngày neo theo nến ĐẦU TIÊN của mỗi ngày (mở cửa phiên 9:30 với cổ phiếu Mỹ,
+    00:00 với crypto) - cùng cách Yahoo chia nến 15m/60m/90m.
+    """
+    ts = ts.astype('datetime64[ns]')
+    day = ts.astype('datetime64[D]')
+    # Chuỗi đã sắp xếp -> ngày mới bắt đầu ở nơi giá trị ngày thay đổi (không cần np.unique)
+    first_idx = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])
+    origin = np.repeat(ts[first_idx], np.diff(np.r_[first_idx, len(ts)]))
+    step = np.int64(minutes) * 60 * 1_000_000_000
+    offset = (ts - origin).astype(np.int64)
+    return origin + (offset // step * step).astype('timedelta64[ns]')
+
+
+def bar_labels(ts: np.ndarray, interval: str) -> np.ndarray:
+    """Nhãn (thời điểm bắt đầu) của nến `interval` chứa từng timestamp"""
+    if interval in _CALENDAR_LABELERS:
+        return _CALENDAR_LABELERS[interval](ts).astype('datetime64[ns]')
+    if interval in INTRADAY_MINUTES:
+        return _intraday_start(ts, INTRADAY_MINUTES[interval])
+    raise ValueError(f"Unsupported resample interval '{interval}'")
+
+
+# =============================================================================
+# 2. GỘP OHLCV
+# =============================================================================
+def resample_ohlcv(df: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """
+    Gộp chuỗi OHLCV (cột 'timestamp' tăng dần) thành nến `interval`, 1 lượt numpy reduceat:
+    Open = nến đầu, High = max, Low = min, Close = nến cuối, Volume = tổng,
+    Dividends = tổng, Stock Splits = tích các lần chia tách (0 nếu không có).
+    Nến cuối có thể chưa đóng (tuần / tháng đang chạy) - giống dữ liệu Yahoo trả về.
+    """
+    if df is None or df.empty:
+        return df
+
+    ts = df['timestamp'].to_numpy(dtype='datetime64[ns]')
+    labels = bar_labels(ts, interval)
+    # Chuỗi đã sắp xếp -> nhãn không giảm, ranh giới nhóm là nơi nhãn thay đổi
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    ends = np.r_[starts[1:], len(ts)] - 1
+
+    out: Dict[str, Any] = {'timestamp': labels[starts]}
+    for col in df.columns:
+        if col == 'timestamp':
+            continue
+        values = df[col].to_numpy()
+        if col == 'Open':
+            out[col] = values[starts]
+        elif col == 'Close':
+            out[col] = values[ends]
+        elif col == 'High':
+            out[col] = np.maximum.reduceat(values, starts)
+        elif col == 'Low':
+            out[col] = np.minimum.reduceat(values, starts)
+        elif col in ('Volume', 'Dividends'):
+            out[col] = np.add.reduceat(values, starts)
+        elif col == 'Stock Splits':
+            ratios = np.multiply.reduceat(np.where(values == 0, 1.0, values), starts)
+            out[col] = np.where(ratios == 1.0, 0.0, ratios)
+        elif pd.api.types.is_numeric_dtype(values.dtype):
+            out[col] = values[ends]   # Cột khác (VD: Adj Close): lấy giá trị cuối kỳ
+    return pd.DataFrame(out)
+
+
+def pick_base(interval: str, available: Callable[[str], bool]) -> Optional[str]:
+    """
+    Chọn chuỗi gốc để dựng `interval`:
+    - 1wk / 1mo / 3mo: luôn từ 1d.
+    - Nến trong ngày: interval mịn nhất chia hết mà `available(base)` xác nhận kho đã phủ đủ.
+    None -> không dựng cục bộ được, phải tải trực tiếp.
+    """
+    if interval in CALENDAR_INTERVALS:
+        return DAILY_BASE
+    minutes = INTRADAY_MINUTES.get(interval)
+    if minutes is None:
+        return None
+    candidates = sorted((m, name) for name, m in INTRADAY_MINUTES.items()
+                        if m < minutes and minutes % m == 0 and name != "1h")
+    for _, base in candidates:
+        if available(base):
+            return base
+    return None
+
+
+# =============================================================================
+# 3. CACHE THEO CHUỖI GỐC
+# =============================================================================
+class ResampleCache:
+    """
+    Ghi nhớ kết quả resample theo (ticker, base, interval). Mỗi mục mang dấu vân tay của
+    chuỗi gốc (số nến, nến cuối, giá đóng cửa cuối); chuỗi gốc đổi (có nến mới) -> dựng lại.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[tuple, pd.DataFrame]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "builds": 0}
+
+    @staticmethod
+    def fingerprint(df: pd.DataFrame) -> tuple:
+        if df is None or df.empty:
+            return (0,)
+        return (len(df), df['timestamp'].iloc[0], df['timestamp'].iloc[-1], float(df['Close'].iloc[-1]))
+
+    def get(self, ticker: str, base: str, interval: str, base_df: pd.DataFrame) -> pd.DataFrame:
+        key = (ticker.upper(), base, interval)
+        fp = self.fingerprint(base_df)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == fp:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+
+        result = resample_ohlcv(base_df, interval)
+        with self._lock:
+            self._entries[key] = (fp, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.stats["builds"] += 1
+        return result
+
+    def invalidate(self, ticker: Optional[str] = None) -> None:
+        with self._lock:
+            if ticker is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == ticker.upper()]:
+                    del self._entries[key]
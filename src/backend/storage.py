@@ -0,0 +1,224 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/backend/storage.py
+ROLE: Local Columnar OHLCV Store (Kho dữ liệu nến cục bộ dạng Parquet)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+"""
+
+import os
+import re
+import json
+import logging
+import tempfile
+from importlib.util import find_spec
+from typing import Optional, Dict, Any, List, Callable
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Thư mục gốc của kho dữ liệu: <project>/data/ohlcv/<interval>/<TICKER>.parquet
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_STORE_DIR = os.path.join(ROOT_DIR, 'data', 'ohlcv')
+
+# Parquet cần pyarrow (hoặc fastparquet). Nếu thiếu, kho tự tắt và Engine tải trực tiếp như cũ.
+# Chỉ kiểm tra có cài hay không (find_spec), engine Parquet được pandas nạp ở lần đọc/ghi đầu tiên.
+PYARROW_AVAILABLE = find_spec("pyarrow") is not None
+PARQUET_AVAILABLE = PYARROW_AVAILABLE or find_spec("fastparquet") is not None
+
+# Độ dài của các khung thời gian (period) theo chuẩn yfinance
+PERIOD_OFFSETS = {
+    "1d": pd.DateOffset(days=1),
+    "5d": pd.DateOffset(days=5),
+    "1mo": pd.DateOffset(months=1),
+    "3mo": pd.DateOffset(months=3),
+    "6mo": pd.DateOffset(months=6),
+    "1y": pd.DateOffset(years=1),
+    "2y": pd.DateOffset(years=2),
+    "5y": pd.DateOffset(years=5),
+    "10y": pd.DateOffset(years=10),
+}
+
+
+def atomic_write(path: str, writer: Callable[[str], None]) -> None:
+    """
+    Ghi nguyên tử: writer(tmp_path) ghi vào file tạm duy nhất (mkstemp) cùng thư mục rồi os.replace.
+    Tên tạm không dựa vào PID -> 2 luồng của cùng tiến trình không giẫm lên file của nhau.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        writer(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def atomic_write_json(path: str, obj: Any) -> None:
+    def dump(tmp_path: str) -> None:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(obj, f)
+    atomic_write(path, dump)
+
+
+class OHLCVStore:
+    """
+    Kho lưu trữ OHLCV bền vững trên đĩa, khóa theo (ticker, interval).
+    Mỗi chuỗi gồm 1 file Parquet (dữ liệu) và 1 file JSON (metadata độ phủ lịch sử).
+    """
+
+    def __init__(self, root: str = DEFAULT_STORE_DIR):
+        self.root = root
+
+    @property
+    def enabled(self) -> bool:
+        return PARQUET_AVAILABLE
+
+    # ------------------------------------------------------------------
+    # ĐƯỜNG DẪN FILE
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _safe_name(ticker: str) -> str:
+        """Chuẩn hóa ticker thành tên file hợp lệ (VD: ^TNX -> _TNX, EURUSD=X -> EURUSD_X)"""
+        return re.sub(r'[^A-Za-z0-9._-]', '_', ticker.upper())
+
+    def path_for(self, ticker: str, interval: str, suffix: str = ".parquet") -> str:
+        return os.path.join(self.root, interval, self._safe_name(ticker) + suffix)
+
+    # ------------------------------------------------------------------
+    # ĐỌC / GHI
+    # ------------------------------------------------------------------
+    def load(self, ticker: str, interval: str) -> Optional[pd.DataFrame]:
+        """Đọc toàn bộ chuỗi đã lưu. Trả về None nếu chưa có hoặc file hỏng."""
+        path = self.path_for(ticker, interval)
+        if not self.enabled or not os.path.exists(path):
+            return None
+        try:
+            return pd.read_parquet(path)
+        except Exception as e:
+            logger.warning(f"OHLCV Store: Không đọc được {path} ({e}). Sẽ tải lại toàn bộ.")
+            return None
+
+    def load_arrays(self, ticker: str, interval: str, columns: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        Đọc thẳng các cột cần thành mảng numpy {cột: ndarray}, bỏ qua bước dựng DataFrame
+        (nhanh hơn ~2 lần khi đọc hàng trăm mã cho bảng giá của máy quét).
+        """
+        path = self.path_for(ticker, interval)
+        if not self.enabled or not os.path.exists(path):
+            return None
+        try:
+            if PYARROW_AVAILABLE:
+                import pyarrow.parquet as pq
+                table = pq.read_table(path, columns=columns)
+                return {col: table.column(col).to_numpy() for col in columns}
+            df = pd.read_parquet(path, columns=columns)
+            return {col: df[col].to_numpy() for col in columns}
+        except Exception as e:
+            logger.warning(f"OHLCV Store: Không đọc được {path} ({e}).")
+            return None
+
+    def load_meta(self, ticker: str, interval: str) -> Dict[str, Any]:
+        path = self.path_for(ticker, interval, ".meta.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, ticker: str, interval: str, df: pd.DataFrame, meta: Dict[str, Any]) -> None:
+        """Ghi nguyên tử (file tạm + os.replace) để tiến trình khác không đọc phải file dở dang."""
+        if not self.enabled:
+            return
+        path = self.path_for(ticker, interval)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            atomic_write(path, lambda tmp_path: df.to_parquet(tmp_path, index=False))
+            atomic_write_json(self.path_for(ticker, interval, ".meta.json"), meta)
+        except Exception as e:
+            logger.error(f"OHLCV Store: Lỗi ghi {path}: {e}")
+
+    def load_state(self, ticker: str, interval: str, name: str = "indicators") -> Optional[Dict[str, Any]]:
+        """Đọc snapshot trạng thái (VD: StreamingIndicators) lưu cạnh chuỗi OHLCV"""
+        path = self.path_for(ticker, interval, f".{name}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_state(self, ticker: str, interval: str, state: Dict[str, Any], name: str = "indicators") -> None:
+        path = self.path_for(ticker, interval, f".{name}.json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            atomic_write_json(path, state)
+        except Exception as e:
+            logger.error(f"OHLCV Store: Lỗi ghi snapshot {path}: {e}")
+
+    # ------------------------------------------------------------------
+    # LOGIC ĐỘ PHỦ & CẮT LÁT
+    # ------------------------------------------------------------------
+    @staticmethod
+    def period_start(period: str, anchor: pd.Timestamp) -> Optional[pd.Timestamp]:
+        """Mốc bắt đầu của một period tính từ anchor. None nghĩa là toàn bộ lịch sử ('max')."""
+        if period == "max":
+            return None
+        if period == "ytd":
+            return pd.Timestamp(year=anchor.year, month=1, day=1)
+        if period == "1d":
+            return anchor.normalize()
+        offset = PERIOD_OFFSETS.get(period)
+        if offset is None:
+            raise ValueError(f"Unsupported period '{period}'")
+        return anchor - offset
+
+    @classmethod
+    def covers(cls, meta: Dict[str, Any], period: str) -> bool:
+        """Kiểm tra chuỗi đã lưu có đủ sâu để phục vụ period yêu cầu không."""
+        if not meta:
+            return False
+        if meta.get("full_history"):
+            return True
+        covered_from = meta.get("covered_from")
+        needed = cls.period_start(period, pd.Timestamp.now())
+        if needed is None or covered_from is None:
+            return False
+        return pd.Timestamp(covered_from) <= needed
+
+    @staticmethod
+    def merge(existing: Optional[pd.DataFrame], new: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+        """Gộp nến mới vào chuỗi cũ. Nến trùng timestamp lấy bản mới (nến cuối có thể chưa đóng)."""
+        if existing is None or existing.empty:
+            return new
+        if new is None or new.empty:
+            return existing
+        merged = pd.concat([existing, new], ignore_index=True)
+        merged = merged.drop_duplicates(subset='timestamp', keep='last')
+        return merged.sort_values('timestamp').reset_index(drop=True)
+
+    @staticmethod
+    def has_corporate_action(df: Optional[pd.DataFrame], after: pd.Timestamp) -> bool:
+        """Phát hiện cổ tức / chia tách trong các nến mới (làm thay đổi giá điều chỉnh quá khứ)"""
+        if df is None or df.empty:
+            return False
+        new_bars = df[df['timestamp'] > after]
+        for col in ('Dividends', 'Stock Splits'):
+            if col in new_bars.columns and (new_bars[col].fillna(0) != 0).any():
+                return True
+        return False
+
+    @classmethod
+    def slice_period(cls, df: pd.DataFrame, period: str) -> pd.DataFrame:
+        """Cắt đúng khung thời gian yêu cầu, neo theo nến cuối cùng đã lưu."""
+        if df is None or df.empty:
+            return df
+        start = cls.period_start(period, df['timestamp'].iloc[-1])
+        if start is None:
+            return df.reset_index(drop=True)
+        # timestamp đã sắp xếp tăng dần -> dùng searchsorted thay vì mask toàn bộ
+        pos = df['timestamp'].searchsorted(start, side='left')
+        return df.iloc[pos:].reset_index(drop=True)
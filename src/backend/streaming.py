@@ -0,0 +1,398 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/backend/streaming.py
+ROLE: Streaming Tick Pipeline (nguồn tick -> ring buffer cố định theo từng mã)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from abc import ABC, abstractmethod
+from importlib.util import find_spec
+from typing import Callable, Optional, Dict, Any, List, Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+from src.backend.providers import get_provider
+
+logger = logging.getLogger(__name__)
+
+# websockets là phụ thuộc tùy chọn: chỉ cần (và chỉ được nạp) khi dùng nguồn tick qua websocket
+WEBSOCKETS_AVAILABLE = find_spec("websockets") is not None
+
+DEFAULT_CAPACITY = 2048        # số tick tối đa giữ lại cho mỗi mã
+DEFAULT_POLL_INTERVAL = 5.0    # giây giữa 2 lượt hỏi quote (nguồn polling)
+
+# Tên trường phổ biến của các feed tick -> tên chuẩn nội bộ
+_TICK_ALIASES = {
+    "symbol": ("symbol", "s", "id", "ticker"),
+    "price": ("price", "p", "last", "last_price"),
+    "size": ("size", "v", "volume", "qty"),
+    "ts": ("ts", "t", "time", "timestamp"),
+}
+
+
+def parse_tick(message: Any) -> Optional[Dict[str, Any]]:
+    """
+    Chuẩn hóa 1 message (dict hoặc chuỗi JSON) về {symbol, price, size, ts (epoch giây)}.
+    Trả về None nếu message không phải tick hợp lệ (heartbeat, ack đăng ký...).
+    """
+    if isinstance(message, (str, bytes)):
+        try:
+            message = json.loads(message)
+        except ValueError:
+            return None
+    if not isinstance(message, dict):
+        return None
+
+    fields = {}
+    for name, aliases in _TICK_ALIASES.items():
+        fields[name] = next((message[a] for a in aliases if message.get(a) is not None), None)
+    if fields["symbol"] is None or fields["price"] is None:
+        return None
+    try:
+        price = float(fields["price"])
+        size = float(fields["size"] or 0.0)
+        ts = float(fields["ts"]) if fields["ts"] is not None else time.time()
+    except (TypeError, ValueError):
+        return None
+    if ts > 1e12:  # mili-giây
+        ts /= 1000.0
+    return {"symbol": str(fields["symbol"]).upper(), "price": price, "size": size, "ts": ts}
+
+
+# =============================================================================
+# 1. RING BUFFER
+# =============================================================================
+class TickRingBuffer:
+    """
+    Bộ đệm vòng kích thước cố định cho 1 mã: 3 mảng numpy cấp phát 1 lần (ts, price, size).
+    Tick mới ghi đè tick cũ nhất khi đầy -> bộ nhớ không tăng theo thời gian chạy.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.ts = np.zeros(capacity, dtype=np.float64)
+        self.price = np.zeros(capacity, dtype=np.float64)
+        self.size = np.zeros(capacity, dtype=np.float64)
+        self._head = 0       # vị trí ghi kế tiếp
+        self.count = 0       # số tick hợp lệ (<= capacity)
+        self.total = 0       # tổng số tick đã nhận từ đầu
+
+    def append(self, ts: float, price: float, size: float = 0.0) -> None:
+        i = self._head
+        self.ts[i] = ts
+        self.price[i] = price
+        self.size[i] = size
+        self._head = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.total += 1
+
+    def _order(self) -> np.ndarray:
+        """Chỉ số các ô hợp lệ theo thứ tự thời gian (cũ -> mới)"""
+        start = (self._head - self.count) % self.capacity
+        return (start + np.arange(self.count)) % self.capacity
+
+    def last(self) -> Optional[Dict[str, float]]:
+        if self.count == 0:
+            return None
+        i = (self._head - 1) % self.capacity
+        return {"ts": float(self.ts[i]), "price": float(self.price[i]), "size": float(self.size[i])}
+
+    def snapshot(self, n: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Bản sao n tick gần nhất (mặc định: toàn bộ) theo thứ tự thời gian"""
+        order = self._order()
+        if n is not None:
+            order = order[-n:]
+        return {"ts": self.ts[order], "price": self.price[order], "size": self.size[order]}
+
+
+# =============================================================================
+# 2. NGUỒN TICK
+# =============================================================================
+class TickSource(ABC):
+    """Nguồn tick chạy trong luồng nền: run() gọi emit(tick) cho từng tick cho tới khi stop_event được set"""
+
+    name = "base"
+
+    @abstractmethod
+    def run(self, emit: Callable[[Dict[str, Any]], None], symbols: Callable[[], List[str]],
+            stop_event: threading.Event) -> None:
+        """Vòng lặp phát tick; symbols() trả danh sách mã đang được đăng ký tại thời điểm gọi"""
+
+
+class PollingQuoteSource(TickSource):
+    """
+    Nguồn mặc định khi không có feed đẩy: hỏi quote nhẹ (provider.quote) của các mã đã đăng ký
+    theo chu kỳ. Chỉ phát tick khi giá / thời điểm quote thay đổi.
+    """
+
+    name = "poll"
+
+    def __init__(self, interval: float = DEFAULT_POLL_INTERVAL):
+        self.interval = interval
+
+    def run(self, emit, symbols, stop_event):
+        seen: Dict[str, tuple] = {}
+        while not stop_event.is_set():
+            for symbol in symbols():
+                try:
+                    quote = get_provider().quote(symbol)
+                except Exception as e:
+                    logger.warning(f"Quote poll failed for {symbol}: {e}")
+                    continue
+                if not quote or quote.get("price") is None:
+                    continue
+                marker = (quote["price"], quote.get("ts"))
+                if seen.get(symbol) != marker:
+                    seen[symbol] = marker
+                    # Quote chỉ có khối lượng lũy kế trong ngày, không có khối lượng từng lệnh -> size = 0
+                    emit({"symbol": symbol, "price": quote["price"], "size": 0.0, "ts": quote.get("ts") or time.time()})
+            stop_event.wait(self.interval)
+
+
+class FileReplaySource(TickSource):
+    """
+    Phát lại tick từ file JSON Lines (mỗi dòng 1 tick) - thay thế feed thật khi offline/demo.
+    Khoảng cách giữa các tick theo đúng timestamp ghi lại, chia cho `speed`; loop=True phát lặp vô hạn
+    (timestamp được dời lên hiện tại để buffer luôn tăng dần).
+    """
+
+    name = "replay"
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = True, max_gap: float = 2.0):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.max_gap = max_gap
+
+    def _read(self) -> Iterator[Dict[str, Any]]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                tick = parse_tick(line.strip()) if line.strip() else None
+                if tick is not None:
+                    yield tick
+
+    def run(self, emit, symbols, stop_event):
+        while not stop_event.is_set():
+            shift, prev_ts = None, None
+            for tick in self._read():
+                if stop_event.is_set():
+                    return
+                if shift is None:
+                    shift = time.time() - tick["ts"]
+                if prev_ts is not None and self.speed > 0:
+                    stop_event.wait(min(max(tick["ts"] - prev_ts, 0.0) / self.speed, self.max_gap))
+                prev_ts = tick["ts"]
+                emit({**tick, "ts": tick["ts"] + shift})
+            if not self.loop:
+                return
+
+
+class WebSocketSource(TickSource):
+    """
+    Feed đẩy qua websocket, message JSON dạng tick (xem parse_tick). Khi danh sách mã đổi,
+    gửi {"subscribe": [...]} cho server. Mất kết nối -> thử lại với thời gian chờ tăng dần.
+    """
+
+    name = "websocket"
+
+    def __init__(self, url: str, recv_timeout: float = 1.0, max_backoff: float = 30.0):
+        if not WEBSOCKETS_AVAILABLE:
+            raise ImportError("WebSocketSource requires the 'websockets' package")
+        self.url = url
+        self.recv_timeout = recv_timeout
+        self.max_backoff = max_backoff
+
+    def run(self, emit, symbols, stop_event):
+        from websockets.sync.client import connect as ws_connect
+        backoff = 1.0
+        while not stop_event.is_set():
+            try:
+                with ws_connect(self.url, open_timeout=5) as ws:
+                    backoff = 1.0
+                    subscribed: List[str] = []
+                    while not stop_event.is_set():
+                        wanted = sorted(symbols())
+                        if wanted != subscribed:
+                            ws.send(json.dumps({"subscribe": wanted}))
+                            subscribed = wanted
+                        try:
+                            message = ws.recv(timeout=self.recv_timeout)
+                        except TimeoutError:
+                            continue
+                        tick = parse_tick(message)
+                        if tick is not None:
+                            emit(tick)
+            except Exception as e:
+                logger.warning(f"Tick websocket {self.url} disconnected: {e}")
+                stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+
+# =============================================================================
+# 3. TICK STREAM (BUFFER THEO MÃ + LUỒNG NỀN)
+# =============================================================================
+class TickStream:
+    """
+    Ống nạp tick: 1 luồng nền đọc từ TickSource, ghi vào ring buffer riêng của từng mã.
+    UI chỉ đọc (latest / window / summary) - không bao giờ chờ mạng.
+    Nguồn đẩy (replay / websocket) có thể phát mã chưa đăng ký; chúng vẫn được lưu.
+    """
+
+    def __init__(self, source: TickSource, capacity: int = DEFAULT_CAPACITY):
+        self.source = source
+        self.capacity = capacity
+        self._buffers: Dict[str, TickRingBuffer] = {}
+        self._symbols: set = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"ticks": 0, "dropped": 0}
+
+    def subscribe(self, symbols: Iterable[str]) -> None:
+        with self._lock:
+            self._symbols.update(s.strip().upper() for s in symbols if s and s.strip())
+
+    def symbols(self) -> List[str]:
+        with self._lock:
+            return list(self._symbols)
+
+    def ingest(self, tick: Dict[str, Any]) -> None:
+        if not np.isfinite(tick["price"]):
+            self.stats["dropped"] += 1
+            return
+        with self._lock:
+            buffer = self._buffers.get(tick["symbol"])
+            if buffer is None:
+                buffer = self._buffers[tick["symbol"]] = TickRingBuffer(self.capacity)
+            buffer.append(tick["ts"], tick["price"], tick.get("size", 0.0))
+            self.stats["ticks"] += 1
+
+    # ------------------------------------------------------------------
+    # ĐỌC
+    # ------------------------------------------------------------------
+    def latest(self, symbol: str) -> Optional[Dict[str, float]]:
+        with self._lock:
+            buffer = self._buffers.get(symbol.upper())
+            return buffer.last() if buffer is not None else None
+
+    def window(self, symbol: str, n: Optional[int] = None) -> pd.DataFrame:
+        """n tick gần nhất của 1 mã (index thời gian, cột price/size)"""
+        with self._lock:
+            buffer = self._buffers.get(symbol.upper())
+            data = buffer.snapshot(n) if buffer is not None else None
+        if data is None:
+            return pd.DataFrame(columns=["price", "size"])
+        index = pd.to_datetime(data["ts"], unit="s")
+        return pd.DataFrame({"price": data["price"], "size": data["size"]}, index=index)
+
+    def summary(self, symbol: str, reference: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Tóm tắt trực tiếp: giá cuối, thay đổi so với `reference` (VD: giá đóng cửa phiên trước),
+        cao/thấp và VWAP trong buffer, số tick, tuổi của tick cuối (giây).
+        """
+        with self._lock:
+            buffer = self._buffers.get(symbol.upper())
+            if buffer is None or buffer.count == 0:
+                return None
+            data = buffer.snapshot()
+            total = buffer.total
+        price, size = data["price"], data["size"]
+        last = float(price[-1])
+        ref = reference if reference else float(price[0])
+        volume = float(size.sum())
+        return {
+            "symbol": symbol.upper(),
+            "price": last,
+            "change": last - ref,
+            "pct_change": (last / ref - 1.0) * 100.0 if ref else 0.0,
+            "high": float(price.max()),
+            "low": float(price.min()),
+            "vwap": float((price * size).sum() / volume) if volume > 0 else last,
+            "ticks": total,
+            "age": max(time.time() - float(data["ts"][-1]), 0.0),
+        }
+
+    # ------------------------------------------------------------------
+    # VÒNG ĐỜI
+    # ------------------------------------------------------------------
+    def _run(self) -> None:
+        try:
+            self.source.run(self.ingest, self.symbols, self._stop)
+        except Exception as e:
+            logger.error(f"Tick source '{self.source.name}' stopped: {e}")
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"ticks-{self.source.name}", daemon=True)
+        self._thread.start()
+        logger.info(f"TICK STREAM: started ({self.source.name}, capacity {self.capacity}/symbol)")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "source": self.source.name,
+                "running": self._thread is not None and self._thread.is_alive(),
+                "symbols": len(self._buffers),
+                "subscribed": len(self._symbols),
+                **self.stats,
+            }
+
+
+def write_tick_file(path: str, ticks: Iterable[Dict[str, Any]]) -> int:
+    """Ghi danh sách tick ra file JSON Lines để FileReplaySource phát lại; trả về số dòng đã ghi"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for tick in ticks:
+            f.write(json.dumps(tick) + "\n")
+            n += 1
+    return n
+
+
+# =============================================================================
+# SINGLETON TOÀN TIẾN TRÌNH
+# =============================================================================
+_STREAM: Optional[TickStream] = None
+_STREAM_LOCK = threading.Lock()
+
+
+def _source_from_env() -> TickSource:
+    """
+    FINCEPT_TICK_SOURCE:
+        poll (mặc định)            -> PollingQuoteSource, chu kỳ FINCEPT_TICK_INTERVAL giây
+        replay:<đường dẫn .jsonl>  -> FileReplaySource
+        ws://host:port/...         -> WebSocketSource
+    """
+    spec = os.environ.get("FINCEPT_TICK_SOURCE", "poll").strip()
+    if spec.startswith("replay:"):
+        return FileReplaySource(spec[len("replay:"):], speed=float(os.environ.get("FINCEPT_TICK_SPEED", "1")))
+    if spec.startswith(("ws://", "wss://")):
+        return WebSocketSource(spec)
+    return PollingQuoteSource(interval=float(os.environ.get("FINCEPT_TICK_INTERVAL", str(DEFAULT_POLL_INTERVAL))))
+
+
+def ensure_tick_stream(symbols: Iterable[str] = ()) -> TickStream:
+    """Khởi động (1 lần cho cả tiến trình) ống tick theo biến môi trường và đăng ký thêm các mã"""
+    global _STREAM
+    with _STREAM_LOCK:
+        if _STREAM is None:
+            _STREAM = TickStream(_source_from_env(),
+                                 capacity=int(os.environ.get("FINCEPT_TICK_CAPACITY", str(DEFAULT_CAPACITY))))
+        _STREAM.subscribe(symbols)
+        _STREAM.start()
+        return _STREAM
@@ -0,0 +1,316 @@
+"""
+=============================================================================
+PROJECT: FINCEPT TERMINAL CORE
+FILE: src/ui/charting.py
+ROLE: Vectorized Figure Builder & Downsampling (LTTB / OHLC Buckets / WebGL)
+AUTHOR: Fincept Copilot (Emo)
+=============================================================================
+"""
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from typing import Optional, List
+
+# Số điểm tối đa trên 1 trace trước khi chuyển sang WebGL (Scattergl)
+WEBGL_THRESHOLD = 1000
+
+# Bảng màu chuẩn Terminal
+BULL_COLOR = '#00FFAA'  # Xanh Neon (Bullish)
+BEAR_COLOR = '#FF4444'  # Đỏ Crimson (Bearish)
+MA_COLORS = {'SMA_20': '#FFA500', 'SMA_50': '#1E90FF', 'SMA_200': '#FF1493', 'EMA_12': '#00FFFF', 'EMA_26': '#FFD700'}
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: chọn `threshold` điểm giữ nguyên hình dạng đường giá.
+    - y 1 chiều (n,) -> trả về chỉ số (threshold,)
+    - y 2 chiều (k, n) -> giảm mẫu k đường cùng trục x trong 1 vòng lặp, trả về (k, threshold)
+    Luôn giữ điểm đầu và điểm cuối.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    single = y.ndim == 1
+    y = np.nan_to_num(np.atleast_2d(y))
+    k, n = y.shape
+    if threshold >= n or threshold < 3:
+        idx = np.broadcast_to(np.arange(n), (k, n))
+        return idx[0] if single else idx
+
+    x = np.asarray(x, dtype=np.float64)
+
+    # Biên các bucket ở giữa (bỏ điểm đầu & cuối): bucket i = [edges[i], edges[i+1])
+    every = (n - 2) / (threshold - 2)
+    edges = (np.floor(np.arange(threshold - 1) * every) + 1).astype(np.int64)
+    edges[-1] = n - 1
+
+    # Trung bình của từng bucket tính trước bằng cumsum (vector hóa)
+    cx = np.concatenate(([0.0], np.cumsum(x)))
+    cy = np.concatenate((np.zeros((k, 1)), np.cumsum(y, axis=1)), axis=1)
+    counts = edges[1:] - edges[:-1]
+    avg_x = (cx[edges[1:]] - cx[edges[:-1]]) / counts
+    avg_y = (cy[:, edges[1:]] - cy[:, edges[:-1]]) / counts
+    # "Bucket kế tiếp" của bucket cuối chính là điểm cuối cùng
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.concatenate((avg_y[:, 1:], y[:, -1:]), axis=1)
+
+    # Diện tích tam giác (A đã chọn, B ứng viên, C trung bình bucket sau) khai triển thành
+    # |xa*P + ya*Q + R| với P, Q, R chỉ phụ thuộc B và C -> tính trước cho toàn bộ điểm
+    bucket_of = np.repeat(np.arange(threshold - 2), counts)
+    body = slice(1, n - 1)
+    P = y[:, body] - next_y[:, bucket_of]
+    Q = next_x[bucket_of] - x[body]
+    R = x[body] * next_y[:, bucket_of] - next_x[bucket_of] * y[:, body]
+
+    rows = np.arange(k)
+    selected = np.empty((k, threshold), dtype=np.int64)
+    selected[:, 0] = 0
+    selected[:, -1] = n - 1
+    a = np.zeros(k, dtype=np.int64)
+    for i in range(threshold - 2):
+        lo, hi = edges[i] - 1, edges[i + 1] - 1
+        area = np.abs(x[a][:, None] * P[:, lo:hi] + y[rows, a][:, None] * Q[lo:hi] + R[:, lo:hi])
+        a = edges[i] + area.argmax(axis=1)
+        selected[:, i + 1] = a
+    return selected[0] if single else selected
+
+
+def bucket_ohlcv(df: pd.DataFrame, max_points: int) -> pd.DataFrame:
+    """
+    Gộp nến thành tối đa `max_points` bucket đều nhau, giữ đúng ngữ nghĩa OHLC:
+    Open = nến đầu, High = max, Low = min, Close = nến cuối, Volume = tổng.
+    """
+    n = len(df)
+    if n <= max_points:
+        return df
+
+    step = int(np.ceil(n / max_points))
+    starts = np.arange(0, n, step)
+    ends = np.append(starts[1:] - 1, n - 1)
+
+    out = {'timestamp': df['timestamp'].to_numpy()[starts]}
+    out['Open'] = df['Open'].to_numpy()[starts]
+    out['High'] = np.maximum.reduceat(df['High'].to_numpy(), starts)
+    out['Low'] = np.minimum.reduceat(df['Low'].to_numpy(), starts)
+    out['Close'] = df['Close'].to_numpy()[ends]
+    if 'Volume' in df.columns:
+        out['Volume'] = np.add.reduceat(df['Volume'].to_numpy(), starts)
+    return pd.DataFrame(out)
+
+
+def weekend_rangebreaks(timestamps: pd.Series) -> List[str]:
+    """
+    Danh sách các ngày không có giao dịch (T7, CN, ngày lễ) để ẩn khỏi trục X.
+    Chỉ áp dụng cho dữ liệu ngày hoặc trong ngày; dùng phép hiệu tập hợp trên DatetimeIndex.
+    """
+    ts = pd.DatetimeIndex(timestamps)
+    if len(ts) < 2:
+        return []
+    # Dữ liệu tuần / tháng: mỗi nến cách nhau > 1 ngày, không cần ẩn khoảng trống
+    if np.median(np.diff(ts.asi8)) > pd.Timedelta(days=1).value:
+        return []
+    observed = ts.normalize().unique()
+    all_days = pd.date_range(start=observed[0], end=observed[-1], freq='D')
+    return all_days.difference(observed).strftime("%Y-%m-%d").tolist()
+
+
+def format_numeric_table(df: pd.DataFrame, decimals: int = 2, na_rep: str = "N/A") -> pd.DataFrame:
+    """
+    Định dạng các cột số thực thành chuỗi có phân tách hàng nghìn (VD: 1,234.57), NaN -> na_rep.
+    Tách khỏi render_data_table để đo benchmark mà không cần Streamlit.
+    """
+    formatted = df.copy()
+    pattern = f"{{:,.{decimals}f}}".format
+    for col in formatted.select_dtypes(include=['float64', 'float32']).columns:
+        formatted[col] = formatted[col].map(pattern, na_action='ignore').fillna(na_rep)
+    return formatted
+
+
+def build_advanced_figure(df: pd.DataFrame, title: str, show_volume: bool = True,
+                          max_points: Optional[int] = None) -> Optional[go.Figure]:
+    """
+    Dựng Figure Plotly cho biểu đồ nến + MA + Volume (không gọi Streamlit).
+    - max_points: ngân sách điểm ảnh; nến được gộp bucket OHLC, đường MA được giảm mẫu bằng LTTB.
+    - Tự động dùng Scattergl (WebGL) khi số điểm của đường vượt WEBGL_THRESHOLD.
+    """
+    if df is None or df.empty:
+        return None
+
+    has_volume = show_volume and 'Volume' in df.columns
+
+    # 1. Khởi tạo Subplots: Hàng 1 cho Giá (chiếm 80%), Hàng 2 cho Khối lượng (chiếm 20%)
+    if has_volume:
+        fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.03, row_heights=[0.8, 0.2])
+    else:
+        fig = make_subplots(rows=1, cols=1)
+
+    candles = bucket_ohlcv(df, max_points) if max_points else df
+    ts_candles = candles['timestamp'].to_numpy()
+    open_ = candles['Open'].to_numpy()
+    close = candles['Close'].to_numpy()
+
+    # 2. Thêm đồ thị nến (Candlestick)
+    fig.add_trace(
+        go.Candlestick(
+            x=ts_candles,
+            open=open_,
+            high=candles['High'].to_numpy(),
+            low=candles['Low'].to_numpy(),
+            close=close,
+            increasing_line_color=BULL_COLOR,
+            decreasing_line_color=BEAR_COLOR,
+            name='Price Action'
+        ),
+        row=1, col=1
+    )
+
+    # 3. Các đường Trung bình động (Moving Averages) nếu tồn tại trong DF
+    ts_all = df['timestamp'].to_numpy()
+    ma_cols = [c for c in MA_COLORS if c in df.columns]
+    if ma_cols:
+        y_all = df[ma_cols].to_numpy(dtype=np.float64).T
+        if max_points and len(df) > max_points:
+            # Giảm mẫu tất cả các đường MA trong cùng một lượt LTTB
+            x_numeric = pd.DatetimeIndex(df['timestamp']).asi8.astype(np.float64)
+            keep = lttb_indices(x_numeric, y_all, max_points)
+        else:
+            keep = np.broadcast_to(np.arange(len(df)), y_all.shape)
+
+        for row, col_name in enumerate(ma_cols):
+            x_line, y_line = ts_all[keep[row]], y_all[row, keep[row]]
+            scatter_cls = go.Scattergl if len(y_line) > WEBGL_THRESHOLD else go.Scatter
+            fig.add_trace(
+                scatter_cls(x=x_line, y=y_line, mode='lines', line=dict(color=MA_COLORS[col_name], width=1.5), name=col_name.replace('_', ' ')),
+                row=1, col=1
+            )
+
+    # 4. Biểu đồ Khối lượng (Volume) - màu cột trùng màu nến.
+    # Tách thành 2 trace đơn sắc bằng mặt nạ boolean thay vì 1 mảng màu từng cột
+    # (Plotly kiểm tra từng chuỗi màu một, rất chậm với chuỗi dài).
+    if has_volume:
+        volume = candles['Volume'].to_numpy()
+        bullish = close >= open_
+        for mask, color_hex, show in ((bullish, BULL_COLOR, True), (~bullish, BEAR_COLOR, False)):
+            fig.add_trace(
+                go.Bar(x=ts_candles[mask], y=volume[mask], marker_color=color_hex, name='Volume',
+                       legendgroup='volume', showlegend=show, opacity=0.8),
+                row=2, col=1
+            )
+
+    # 5. Tùy chỉnh Layout chuẩn Terminal
+    fig.update_layout(
+        title=dict(text=f"<b>{title}</b>", font=dict(family="Roboto Mono", size=20, color="#FAFAFA")),
+        template='plotly_dark',
+        margin=dict(l=10, r=10, t=50, b=10),
+        height=650,
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(14, 17, 23, 0.5)',
+        xaxis_rangeslider_visible=False,
+        showlegend=True,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1, font=dict(color="#8892B0"))
+    )
+
+    # 6. Loại bỏ khoảng trống cuối tuần trên trục X (Hide weekend gaps)
+    dt_breaks = weekend_rangebreaks(df['timestamp'])
+    if dt_breaks:
+        fig.update_xaxes(rangebreaks=[dict(values=dt_breaks)])
+
+    # Cập nhật định dạng trục
+    fig.update_yaxes(title_text="Price (USD)", row=1, col=1, gridcolor='#262730', zerolinecolor='#262730')
+    if has_volume:
+        fig.update_yaxes(title_text="Volume", row=2, col=1, showgrid=False)
+
+    return fig
+
+
+def build_heatmap_figure(matrix: np.ndarray, x: np.ndarray, y: np.ndarray, title: str,
+                         x_title: str, y_title: str, z_title: str = "",
+                         marker: Optional[tuple] = None, zmid: Optional[float] = None) -> go.Figure:
+    """
+    Dựng Heatmap độ nhạy (VD: Fair Value theo Growth x Terminal Growth).
+    marker: (x, y) đánh dấu kịch bản đang chọn trên lưới.
+    """
+    fig = go.Figure(
+        go.Heatmap(
+            z=matrix, x=x, y=y,
+            colorscale=[[0.0, BEAR_COLOR], [0.5, '#11141A'], [1.0, BULL_COLOR]],
+            zmid=zmid,
+            colorbar=dict(title=z_title),
+            hovertemplate=f"{x_title}: %{{x:.2f}}<br>{y_title}: %{{y:.2f}}<br>{z_title}: %{{z:,.2f}}<extra></extra>"
+        )
+    )
+    if marker is not None:
+        fig.add_trace(go.Scatter(
+            x=[marker[0]], y=[marker[1]], mode='markers',
+            marker=dict(symbol='x', size=14, color='#FFFFFF'), name='Selected', showlegend=False
+        ))
+
+    fig.update_layout(
+        title=dict(text=f"<b>{title}</b>", font=dict(family="Roboto Mono", size=16, color="#FAFAFA")),
+        template='plotly_dark',
+        margin=dict(l=10, r=10, t=50, b=10),
+        height=480,
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(14, 17, 23, 0.5)',
+        xaxis_title=x_title,
+        yaxis_title=y_title,
+    )
+    return fig
+
+
+def build_distribution_figure(counts: np.ndarray, edges: np.ndarray, title: str, x_title: str,
+                              markers: Optional[dict] = None) -> go.Figure:
+    """
+    Dựng biểu đồ phân phối từ histogram đã tính sẵn (counts, edges) - không cần gửi toàn bộ mẫu.
+    markers: {nhãn: giá trị} vẽ thành các đường dọc (VD: Giá hiện tại, P5, P95).
+    """
+    centers = (edges[:-1] + edges[1:]) / 2
+    fig = go.Figure(go.Bar(x=centers, y=counts, width=np.diff(edges), marker_color=BULL_COLOR, opacity=0.8, name='Draws'))
+    for label, value in (markers or {}).items():
+        fig.add_vline(x=value, line_dash="dash", line_color="#FFA500" if label.startswith("P") else BEAR_COLOR,
+                      annotation_text=label, annotation_font_color="#FAFAFA")
+
+    fig.update_layout(
+        title=dict(text=f"<b>{title}</b>", font=dict(family="Roboto Mono", size=16, color="#FAFAFA")),
+        template='plotly_dark',
+        margin=dict(l=10, r=10, t=50, b=10),
+        height=420,
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(14, 17, 23, 0.5)',
+        xaxis_title=x_title,
+        yaxis_title="Frequency",
+        bargap=0,
+        showlegend=False,
+    )
+    return fig
+
+
+def build_equity_figure(curves: pd.DataFrame, title: str, max_points: Optional[int] = 2000) -> go.Figure:
+    """
+    Equity curve của chiến lược so với Buy & Hold (hàng trên) và drawdown (hàng dưới).
+    curves: kết quả SignalBacktester.run_rule()["curves"]; chuỗi dài được giảm mẫu LTTB chung 1 trục x.
+    """
+    x = curves.index
+    series = curves[["Strategy", "Buy & Hold", "Drawdown"]].to_numpy(dtype=np.float64).T
+    if max_points is not None and len(curves) > max_points:
+        idx = np.unique(lttb_indices(np.arange(len(curves)), series, max_points))
+        x, series = x[idx], series[:, idx]
+
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.04, row_heights=[0.7, 0.3])
+    fig.add_trace(go.Scatter(x=x, y=series[0], name="Strategy", line=dict(color=BULL_COLOR, width=1.6)), row=1, col=1)
+    fig.add_trace(go.Scatter(x=x, y=series[1], name="Buy & Hold", line=dict(color='#888888', width=1.2)), row=1, col=1)
+    fig.add_trace(go.Scatter(x=x, y=series[2], name="Drawdown", fill='tozeroy',
+                             line=dict(color=BEAR_COLOR, width=1), showlegend=False), row=2, col=1)
+
+    fig.update_layout(
+        title=dict(text=f"<b>{title}</b>", font=dict(family="Roboto Mono", size=16, color="#FAFAFA")),
+        template='plotly_dark',
+        margin=dict(l=10, r=10, t=50, b=10),
+        height=480,
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(14, 17, 23, 0.5)',
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+    )
+    fig.update_yaxes(title_text="Growth of 1", row=1, col=1)
+    fig.update_yaxes(title_text="Drawdown", tickformat=".0%", row=2, col=1)
+    return fig
@@ -8,11 +8,15 @@ AUTHOR: Fincept Copilot (Emo)
 """
 
 import streamlit as st
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import pandas as pd
 from typing import Optional
 
+import numpy as np
+
+from src.ui.charting import (build_advanced_figure, build_heatmap_figure, build_distribution_figure,
+                             build_equity_figure, format_numeric_table)
+from src.backend.profiling import stage, PROFILE_SESSION_KEY
+
 class TerminalUI:
     """Kho giao diện dùng chung cho toàn bộ Terminal"""
 
@@ -36,109 +40,49 @@ class TerminalUI:
         )
 
     @staticmethod
-    def render_advanced_chart(df: pd.DataFrame, title: str, show_volume: bool = True):
+    def render_advanced_chart(df: pd.DataFrame, title: str, show_volume: bool = True, max_points: Optional[int] = 2000):
         """
         Động cơ vẽ biểu đồ tài chính đẳng cấp Enterprise bằng Plotly.
         - Tự động bỏ qua các ngày nghỉ cuối tuần (không bị rỗng nến).
         - Tích hợp Volume (Khối lượng) ngay bên dưới đồ thị giá.
         - Hỗ trợ vẽ các đường MA (Moving Average) nếu có trong DataFrame.
+        - max_points: ngân sách điểm ảnh (LTTB + gộp nến), None để vẽ toàn bộ dữ liệu.
         """
-        if df is None or df.empty:
+        with stage("figure"):
+            fig = build_advanced_figure(df, title, show_volume=show_volume, max_points=max_points)
+        if fig is None:
             st.warning("SYSTEM ALERT: No sufficient data available for charting.")
             return
 
-        # 1. Khởi tạo Subplots: Hàng 1 cho Giá (chiếm 80%), Hàng 2 cho Khối lượng (chiếm 20%)
-        if show_volume and 'Volume' in df.columns:
-            fig = make_subplots(
-                rows=2, cols=1, 
-                shared_xaxes=True, 
-                vertical_spacing=0.03, 
-                row_heights=[0.8, 0.2]
-            )
-        else:
-            fig = make_subplots(rows=1, cols=1)
-
-        # 2. Thêm đồ thị nến (Candlestick)
-        fig.add_trace(
-            go.Candlestick(
-                x=df['timestamp'],
-                open=df['Open'],
-                high=df['High'],
-                low=df['Low'],
-                close=df['Close'],
-                increasing_line_color='#00FFAA', # Xanh Neon (Bullish)
-                decreasing_line_color='#FF4444', # Đỏ Crimson (Bearish)
-                name='Price Action'
-            ),
-            row=1, col=1
-        )
-
-        # 3. Quét và thêm các đường Trung bình động (Moving Averages) nếu tồn tại trong DF
-        # (Chúng ta sẽ tính toán các cột này ở module technical.py sau)
-        colors_ma = {'SMA_20': '#FFA500', 'SMA_50': '#1E90FF', 'SMA_200': '#FF1493', 'EMA_12': '#00FFFF', 'EMA_26': '#FFD700'}
-        for col_name, color_hex in colors_ma.items():
-            if col_name in df.columns:
-                fig.add_trace(
-                    go.Scatter(
-                        x=df['timestamp'], y=df[col_name], 
-                        line=dict(color=color_hex, width=1.5), 
-                        name=col_name.replace('_', ' ')
-                    ),
-                    row=1, col=1
-                )
-
-        # 4. Thêm biểu đồ Khối lượng (Volume)
-        if show_volume and 'Volume' in df.columns:
-            # Màu cột volume trùng với màu nến của ngày hôm đó
-            volume_colors = ['#00FFAA' if row['Close'] >= row['Open'] else '#FF4444' for _, row in df.iterrows()]
-            fig.add_trace(
-                go.Bar(
-                    x=df['timestamp'], 
-                    y=df['Volume'], 
-                    marker_color=volume_colors, 
-                    name='Volume',
-                    opacity=0.8
-                ),
-                row=2, col=1
-            )
+        # Render ra Streamlit (tuần tự hóa figure -> JSON gửi về trình duyệt)
+        with stage("render"):
+            st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False}) # Tắt thanh công cụ của Plotly cho gọn
 
-        # 5. Tùy chỉnh Layout chuẩn Terminal
-        fig.update_layout(
-            title=dict(text=f"<b>{title}</b>", font=dict(family="Roboto Mono", size=20, color="#FAFAFA")),
-            template='plotly_dark',
-            margin=dict(l=10, r=10, t=50, b=10),
-            height=650, # Chiều cao tối ưu cho màn hình Desktop
-            paper_bgcolor='rgba(0,0,0,0)', # Nền trong suốt để tiệp với Streamlit Dark Mode
-            plot_bgcolor='rgba(14, 17, 23, 0.5)',
-            xaxis_rangeslider_visible=False, # Tắt thanh cuộn dưới đáy để nhìn chuyên nghiệp hơn
-            showlegend=True,
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="right",
-                x=1,
-                font=dict(color="#8892B0")
-            )
-        )
-
-        # 6. Loại bỏ khoảng trống cuối tuần trên trục X (Hide weekend gaps)
-        # Chỉ áp dụng nếu dữ liệu là ngày (nhỏ hơn 300 điểm dữ liệu thường là daily)
-        if len(df) > 0 and 'timestamp' in df.columns:
-            # Lấy danh sách các ngày không có giao dịch (ví dụ T7, CN)
-            dt_all = pd.date_range(start=df['timestamp'].iloc[0], end=df['timestamp'].iloc[-1])
-            dt_obs = [d.strftime("%Y-%m-%d") for d in df['timestamp']]
-            dt_breaks = [d for d in dt_all.strftime("%Y-%m-%d").tolist() if not d in dt_obs]
-            
-            fig.update_xaxes(rangebreaks=[dict(values=dt_breaks)])
+    @staticmethod
+    def render_sensitivity_heatmap(matrix: np.ndarray, x: np.ndarray, y: np.ndarray, title: str,
+                                   x_title: str, y_title: str, z_title: str = "",
+                                   marker: Optional[tuple] = None, zmid: Optional[float] = None):
+        """Render Heatmap độ nhạy (Sensitivity Matrix) cho các mô hình định giá"""
+        with stage("figure"):
+            fig = build_heatmap_figure(matrix, x, y, title, x_title, y_title, z_title, marker=marker, zmid=zmid)
+        with stage("render"):
+            st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
 
-        # Cập nhật định dạng trục
-        fig.update_yaxes(title_text="Price (USD)", row=1, col=1, gridcolor='#262730', zerolinecolor='#262730')
-        if show_volume:
-            fig.update_yaxes(title_text="Volume", row=2, col=1, showgrid=False)
+    @staticmethod
+    def render_distribution(counts: np.ndarray, edges: np.ndarray, title: str, x_title: str, markers: Optional[dict] = None):
+        """Render phân phối xác suất (VD: Fair Value từ Monte Carlo) từ histogram đã tính sẵn"""
+        with stage("figure"):
+            fig = build_distribution_figure(counts, edges, title, x_title, markers=markers)
+        with stage("render"):
+            st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
 
-        # Render ra Streamlit
-        st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False}) # Tắt thanh công cụ của Plotly cho gọn
+    @staticmethod
+    def render_equity_curve(curves: pd.DataFrame, title: str):
+        """Render equity curve + drawdown của 1 backtest (SignalBacktester.run_rule) so với Buy & Hold"""
+        with stage("figure"):
+            fig = build_equity_figure(curves, title)
+        with stage("render"):
+            st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
 
     @staticmethod
     def render_data_table(df: pd.DataFrame, height: int = 400):
@@ -147,8 +91,26 @@ class TerminalUI:
             return
             
         # Format số thập phân cho đẹp
-        formatted_df = df.copy()
-        for col in formatted_df.select_dtypes(include=['float64', 'float32']).columns:
-            formatted_df[col] = formatted_df[col].apply(lambda x: f"{x:,.2f}" if pd.notnull(x) else "N/A")
-            
-        st.dataframe(formatted_df, height=height, use_container_width=True)
+        with stage("table"):
+            formatted_df = format_numeric_table(df)
+        with stage("render"):
+            st.dataframe(formatted_df, height=height, use_container_width=True)
+
+    @staticmethod
+    def render_profile_toggle():
+        """Công tắc ⏱️ PROFILE ở sidebar: profile mọi lượt chạy lại trang của session này"""
+        st.sidebar.selectbox("⏱️ PROFILE", ["off", "sample", "cprofile"], key=PROFILE_SESSION_KEY,
+                             help="sample: lấy mẫu stack -> .folded (flamegraph); cprofile: tất định -> .prof. "
+                                  "Một lượt: thêm ?profile=1 vào URL. Kết quả ghi vào data/profiles/")
+
+    @staticmethod
+    def render_profile_report(report: Optional[dict]):
+        """Bảng thời gian từng giai đoạn của lượt chạy vừa profile (không hiện gì khi không profile)"""
+        if not report:
+            return
+        with st.expander(f"⏱️ PROFILE: {report['wall_ms']:,.0f} ms ({report['mode']})", expanded=True):
+            stages = pd.DataFrame(report["stages"])
+            stages["stage"] = ["  " * d + name for d, name in zip(stages["depth"], stages["stage"])]
+            st.dataframe(stages[["stage", "calls", "ms", "pct"]].style.format({"ms": "{:,.1f}", "pct": "{:.1f}%"}),
+                         hide_index=True, use_container_width=True)
+            st.caption(" | ".join(f"{kind}: {path}" for kind, path in report["files"].items()))
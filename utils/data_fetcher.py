@@ -1,11 +1,13 @@
-import yfinance as yf
 import pandas as pd
 import pandas_ta as ta  # Thư viện Phân tích Kỹ thuật chuyên sâu
 import streamlit as st
 from datetime import datetime, timedelta
-import requests
 import numpy as np
 
+from src.backend.providers import get_provider
+from src.backend.disk_cache import disk_cached
+from src.backend.dbnomics import get_dbnomics_client, DEFAULT_BASE_URL
+
 class MarketDataEngine:
     """
     Công cụ tìm kiếm dữ liệu tập trung cho FinceptTerminal.
@@ -14,36 +16,33 @@ class MarketDataEngine:
     
     @staticmethod
     @st.cache_data(ttl=60)  # Cache trong 60 giây để tạo cảm giác thời gian thực
+    @disk_cached(ttl=60)    # Tầng đĩa dùng chung: các replica không cùng gọi quote 1 mã
     def get_realtime_quote(ticker: str):
         """
         Lấy dữ liệu giá mới nhất kèm theo giá đóng cửa phiên trước để tính toán delta.
-        Sử dụng yf.Ticker để truy xuất dữ liệu intraday.
+        Dùng quote nhẹ của provider (vài nến ngày + metadata), không tải nến phút hay hồ sơ doanh nghiệp.
         """
         try:
-            stock = yf.Ticker(ticker)
-            # Lấy dữ liệu 5 ngày để đảm bảo có giá đóng cửa phiên trước
-            hist = stock.history(period="5d", interval="1m")
-            if hist.empty:
+            quote = get_provider().quote(ticker)
+            if not quote or pd.isna(quote.get('price')):
                 return None
-            
-            latest = hist.iloc[-1]
-            # Lấy giá đóng cửa phiên trước từ info hoặc tính toán từ lịch sử
-            prev_close = stock.info.get('previousClose', hist.iloc['Close'])
-            
+
+            price = quote['price']
+            prev_close = quote.get('prev_close')
             # Xử lý trường hợp giá bị NaN
-            if pd.isna(prev_close):
-                prev_close = hist.iloc[-2]['Close'] if len(hist) > 1 else latest['Close']
-            
+            if prev_close is None or pd.isna(prev_close) or prev_close == 0:
+                prev_close = quote.get('open') or price
+
             return {
                 'symbol': ticker,
-                'price': latest['Close'],
-                'open': latest['Open'],
-                'high': latest['High'],
-                'low': latest['Low'],
-                'volume': latest['Volume'],
+                'price': price,
+                'open': quote.get('open'),
+                'high': quote.get('high'),
+                'low': quote.get('low'),
+                'volume': quote.get('volume'),
                 'prev_close': prev_close,
-                'change': latest['Close'] - prev_close,
-                'pct_change': ((latest['Close'] - prev_close) / prev_close) * 100
+                'change': price - prev_close,
+                'pct_change': ((price - prev_close) / prev_close) * 100
             }
         except Exception as e:
             # Ghi log lỗi nhưng không làm sập ứng dụng
@@ -52,6 +51,7 @@ class MarketDataEngine:
 
     @staticmethod
     @st.cache_data(ttl=3600)  # Cache trong 1 giờ cho dữ liệu lịch sử
+    @disk_cached(ttl=3600)
     def get_historical_data(ticker: str, period: str = "2y", interval: str = "1d"):
         """
         Lấy dữ liệu OHLCV lịch sử và tự động tính toán các chỉ báo kỹ thuật cơ bản.
@@ -60,13 +60,13 @@ class MarketDataEngine:
         """
         try:
             # Tắt thanh tiến trình để không làm rối giao diện Streamlit
-            df = yf.download(ticker, period=period, interval=interval, progress=False)
+            df = get_provider().history(ticker, period=period, interval=interval)
             if df.empty:
                 return pd.DataFrame()
             
             # Chuẩn hóa tên cột (YFinance trả về MultiIndex trong phiên bản mới)
             if isinstance(df.columns, pd.MultiIndex):
-                df.columns = [c for c in df.columns]
+                df.columns = df.columns.get_level_values(0)
             
             # Tính toán Chỉ báo Kỹ thuật (Technical Indicators)
             # 1. RSI (Relative Strength Index)
@@ -89,20 +89,22 @@ class MarketDataEngine:
 
     @staticmethod
     @st.cache_data(ttl=86400)  # Cache 24h cho dữ liệu cơ bản (Financials)
+    @disk_cached(ttl=86400)
     def get_fundamental_info(ticker: str):
         """
         Lấy Bảng cân đối kế toán, Báo cáo thu nhập và Hồ sơ công ty.
         Dữ liệu này rất quan trọng cho module Định giá DCF.
         """
         try:
-            stock = yf.Ticker(ticker)
+            provider = get_provider()
+            statements = provider.financials(ticker)
             return {
-                'info': stock.info,
-                'balance_sheet': stock.balance_sheet,
-                'income_stmt': stock.financials,
-                'cashflow': stock.cashflow,
-                'calendar': stock.calendar,
-                'recommendations': stock.recommendations
+                'info': provider.info(ticker),
+                'balance_sheet': statements['balance_sheet'],
+                'income_stmt': statements['income_statement'],
+                'cashflow': statements['cash_flow'],
+                'calendar': provider.attribute(ticker, 'calendar'),
+                'recommendations': provider.attribute(ticker, 'recommendations')
             }
         except Exception as e:
             return None
@@ -111,10 +113,11 @@ class EconomicDataEngine:
     """
     Bộ kết nối (Connector) cho DBNomics để lấy các chỉ số Kinh tế Vĩ mô.
     Hỗ trợ GDP, CPI, Lạm phát, Lãi suất từ IMF, World Bank, OECD.
+    Tải song song nhiều series trong 1 vòng request, lưu bền vững trong data/macro/ (Parquet).
     Tham chiếu: 
     """
     
-    BASE_URL = "https://api.db.nomics.world/v22"
+    BASE_URL = DEFAULT_BASE_URL
 
     @staticmethod
     @st.cache_data(ttl=86400)
@@ -123,18 +126,25 @@ class EconomicDataEngine:
         Hàm generic để gọi API DBNomics.
         Ví dụ: IMF/CPI/A.US.PCPIT_IX (CPI Hoa Kỳ hàng năm)
         """
-        url = f"https://api.db.nomics.world/v22/series/{provider_code}/{dataset_code}/{series_code}?observations=1"
+        sid = f"{provider_code}/{dataset_code}/{series_code}"
         try:
-            response = requests.get(url)
-            data = response.json()
-            series_data = data['series']['docs']
-            periods = series_data['period']
-            values = series_data['value']
-            
-            df = pd.DataFrame({'Date': periods, 'Value': values})
-            df = pd.to_datetime(df)
-            df.set_index('Date', inplace=True)
-            return df.sort_index()
+            df = get_dbnomics_client().fetch_many([sid]).get(sid)
+            if df is None:
+                raise ValueError(f"Series {sid} not found")
+            return df
         except Exception as e:
             st.warning(f"Dữ liệu vĩ mô không khả dụng: {str(e)}")
             return pd.DataFrame()
+
+    @staticmethod
+    @st.cache_data(ttl=3600)
+    def fetch_many(series_ids: list):
+        """
+        Tải hàng loạt series (VD: 40 chỉ số cho bảng điều khiển vĩ mô) trong 1 vòng request song song.
+        series_ids: danh sách 'PROVIDER/DATASET/SERIES'. Trả về dict {series_id: DataFrame}.
+        """
+        try:
+            return get_dbnomics_client().fetch_many(series_ids)
+        except Exception as e:
+            st.warning(f"Dữ liệu vĩ mô không khả dụng: {str(e)}")
+            return {}